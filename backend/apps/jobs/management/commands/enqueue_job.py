@@ -0,0 +1,26 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.jobs.queue import TASKS, enqueue
+
+
+class Command(BaseCommand):
+    help = 'Поставить задание в очередь, например из cron: enqueue_job sync.prune_tombstones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('task', help='Задача: одна из зарегистрированных в tasks.py приложений')
+        parser.add_argument('--payload', default='{}', help='Аргументы задачи, объект JSON')
+        parser.add_argument('--delay', type=int, default=0, help='Запустить не раньше чем через столько секунд')
+
+    def handle(self, *args, **options):
+        if options['task'] not in TASKS:
+            raise CommandError(f"Unknown task {options['task']}, expected one of: {', '.join(sorted(TASKS))}")
+        try:
+            payload = json.loads(options['payload'])
+        except ValueError as exc:
+            raise CommandError(f'Payload is not valid JSON: {exc}')
+        if not isinstance(payload, dict):
+            raise CommandError('Payload must be a JSON object')
+        job = enqueue(options['task'], payload, delay=options['delay'])
+        self.stdout.write(self.style.SUCCESS(f'Queued job {job.pk}'))
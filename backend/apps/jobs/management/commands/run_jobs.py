@@ -0,0 +1,32 @@
+import signal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.jobs.queue import TASKS, Worker
+
+
+class Command(BaseCommand):
+    help = (
+        'Воркер фоновых заданий: захватывает задания из очереди в базе и выполняет их. '
+        'SIGTERM/SIGINT - дождаться текущих заданий и выйти'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=1, help='Сколько заданий выполнять одновременно')
+        parser.add_argument('--task', action='append', dest='tasks',
+                            help='Выполнять только эту задачу (можно указать несколько раз)')
+        parser.add_argument('--poll', type=float, help='Пауза между проверками пустой очереди, секунд')
+        parser.add_argument('--burst', action='store_true', help='Выполнить готовые задания и выйти')
+
+    def handle(self, *args, **options):
+        unknown = set(options['tasks'] or []) - set(TASKS)
+        if unknown:
+            raise CommandError(f"Unknown task(s): {', '.join(sorted(unknown))}")
+        worker = Worker(
+            threads=options['threads'], names=options['tasks'], poll=options['poll'], burst=options['burst']
+        )
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *args: worker.stop())
+        self.stdout.write(f"Worker {worker.id}: {', '.join(sorted(options['tasks'] or TASKS))}")
+        processed = worker.run()
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} job(s)'))
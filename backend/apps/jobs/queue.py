@@ -0,0 +1,300 @@
+"""
+Очередь фоновых заданий в базе данных, без внешнего брокера.
+
+Задача объявляется декоратором task в модуле tasks.py приложения и
+ставится в очередь через enqueue: строка Job хранит имя задачи и ее
+аргументы (payload, JSON). Воркер (manage.py run_jobs) захватывает
+готовые задания, выполняет функцию задачи и записывает результат.
+
+Захват задания:
+- PostgreSQL: SELECT ... FOR UPDATE SKIP LOCKED - воркеры не ждут друг
+  друга и не берут одно задание дважды, лимит параллельности задачи
+  проверяется под advisory-блокировкой ее имени;
+- остальные базы (SQLite): условный UPDATE ... WHERE status = 'queued' с
+  проверкой лимита в том же запросе - задание достается воркеру, чей
+  UPDATE изменил строку.
+
+Упавшее задание повторяется через JOBS_RETRY_BACKOFF_SECONDS * 2^(n-1)
+секунд после n-й попытки (не больше JOBS_RETRY_BACKOFF_MAX, со случайным
+разбросом), пока не исчерпает max_attempts. Пока задание выполняется,
+воркер обновляет его locked_at; задание, не отмеченное дольше
+JOBS_LEASE_SECONDS (воркер остановлен или упал), возвращается в очередь.
+Поэтому задача должна выдерживать повторный запуск с начала.
+"""
+import logging
+import os
+import random
+import socket
+import threading
+import zlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+from django.db.models import Count, F, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+
+class Task:
+    def __init__(self, name, function, concurrency, max_attempts, on_failure):
+        self.name = name
+        self.function = function
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.on_failure = on_failure
+
+
+TASKS = {}
+
+
+def task(name, concurrency=None, max_attempts=3, on_failure=None):
+    """
+    Зарегистрировать функцию как задачу name.
+
+    Функция получает payload задания именованными аргументами, ее
+    результат сохраняется в Job.result (JSON). concurrency - сколько
+    заданий этой задачи выполняется одновременно на всех воркерах
+    (None - без ограничения). on_failure(job) вызывается, когда задание
+    исчерпало попытки.
+    """
+    def decorator(function):
+        TASKS[name] = Task(name, function, concurrency, max_attempts, on_failure)
+        return function
+    return decorator
+
+
+def enqueue(name, payload=None, user=None, delay=0):
+    """Поставить задание в очередь; внутри транзакции воркеры увидят его после коммита"""
+    if name not in TASKS:
+        raise LookupError(f'Unknown job {name}')
+    return Job.objects.create(
+        name=name,
+        payload=payload or {},
+        user=user,
+        max_attempts=TASKS[name].max_attempts,
+        run_at=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+def lease_seconds():
+    return getattr(settings, 'JOBS_LEASE_SECONDS', 300)
+
+
+def backoff(attempts):
+    """Пауза в секундах перед повтором после attempts попыток"""
+    base = getattr(settings, 'JOBS_RETRY_BACKOFF_SECONDS', 10)
+    delay = min(base * 2 ** (attempts - 1), getattr(settings, 'JOBS_RETRY_BACKOFF_MAX', 3600))
+    # Задания, упавшие вместе (например, пока база была недоступна), не повторяются разом
+    return delay * random.uniform(0.5, 1)
+
+
+def _available(names):
+    """Задачи из names, у которых лимит параллельности еще не занят"""
+    limits = {name: TASKS[name].concurrency for name in names if TASKS[name].concurrency}
+    if not limits:
+        return list(names)
+    running = dict(
+        Job.objects.filter(status='running', name__in=limits).values_list('name').annotate(Count('pk'))
+    )
+    return [name for name in names if name not in limits or running.get(name, 0) < limits[name]]
+
+
+def _start(job, worker_id):
+    job.status = 'running'
+    job.attempts += 1
+    job.locked_by = worker_id
+    job.locked_at = timezone.now()
+    job.save(update_fields=['status', 'attempts', 'locked_by', 'locked_at'])
+
+
+def _claim_skip_locked(ready, worker_id):
+    with transaction.atomic(using=ready.db):
+        job = ready.select_for_update(skip_locked=True).first()
+        if job is None:
+            return None
+        limit = TASKS[job.name].concurrency
+        if limit:
+            # Два воркера могли одновременно увидеть свободное место: проверка
+            # лимита и захват идут под блокировкой имени задачи до коммита
+            with connections[ready.db].cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_xact_lock(%s)', [zlib.crc32(job.name.encode())])
+            if Job.objects.filter(name=job.name, status='running').count() >= limit:
+                return None
+        _start(job, worker_id)
+        return job
+
+
+def _claim_conditional(ready, worker_id, candidates=20):
+    for job_id, name in ready.values_list('pk', 'name')[:candidates]:
+        claimed = Job.objects.filter(pk=job_id, status='queued')
+        limit = TASKS[name].concurrency
+        if limit:
+            running = (
+                Job.objects.filter(name=name, status='running')
+                .order_by().values('name').annotate(count=Count('pk')).values('count')
+            )
+            claimed = claimed.alias(running=Coalesce(Subquery(running), 0)).filter(running__lt=limit)
+        # Проверка и захват в одном UPDATE: SQLite выполняет его под блокировкой
+        # записи, следующий воркер увидит уже status = 'running'
+        updated = claimed.update(
+            status='running', attempts=F('attempts') + 1, locked_by=worker_id, locked_at=timezone.now()
+        )
+        if updated:
+            return Job.objects.get(pk=job_id)
+    return None
+
+
+def claim(worker_id, names=None):
+    """Захватить одно готовое задание задач names (по умолчанию - всех) или вернуть None"""
+    names = _available([name for name in names or TASKS if name in TASKS])
+    if not names:
+        return None
+    ready = Job.objects.filter(status='queued', run_at__lte=timezone.now(), name__in=names).order_by('run_at')
+    if connections[ready.db].vendor == 'postgresql':
+        return _claim_skip_locked(ready, worker_id)
+    return _claim_conditional(ready, worker_id)
+
+
+def _fail(job, error):
+    """Задание исчерпало попытки; False - итог уже записан другим захватом"""
+    job.status = 'failed'
+    job.error = error
+    job.finished_at = timezone.now()
+    failed = Job.objects.filter(pk=job.pk, status='running', attempts=job.attempts).update(
+        status=job.status, error=job.error, finished_at=job.finished_at
+    )
+    task = TASKS.get(job.name)
+    if failed and task is not None and task.on_failure is not None:
+        task.on_failure(job)
+    return bool(failed)
+
+
+def run(job):
+    """Выполнить захваченное задание и записать итог; True - задание выполнено"""
+    # Если аренда истекла и задание захватили снова, итог пишет только новый захват
+    jobs = Job.objects.filter(pk=job.pk, status='running', attempts=job.attempts)
+    try:
+        result = TASKS[job.name].function(**job.payload)
+    except Exception as exc:
+        logger.exception(
+            'Job failed', extra={'job_id': str(job.pk), 'job': job.name, 'attempt': job.attempts}
+        )
+        error = f'{type(exc).__name__}: {exc}'
+        if job.attempts < job.max_attempts:
+            jobs.update(
+                status='queued', error=error, locked_by='', locked_at=None,
+                run_at=timezone.now() + timedelta(seconds=backoff(job.attempts)),
+            )
+        else:
+            _fail(job, error)
+        return False
+    jobs.update(status='done', result=result, error='', finished_at=timezone.now())
+    return True
+
+
+def requeue_stale():
+    """Вернуть в очередь задания, которые воркер не отмечал дольше JOBS_LEASE_SECONDS"""
+    now = timezone.now()
+    stale = Job.objects.filter(status='running', locked_at__lt=now - timedelta(seconds=lease_seconds()))
+    failed = sum(
+        _fail(job, 'The worker running the job was lost')
+        for job in stale.filter(attempts__gte=F('max_attempts'))
+    )
+    requeued = stale.update(status='queued', locked_by='', locked_at=None, run_at=now)
+    if failed or requeued:
+        logger.warning('Stale jobs recovered', extra={'requeued': requeued, 'failed': failed})
+    return requeued + failed
+
+
+def run_pending(worker_id='inline', names=None):
+    """Выполнить в текущем потоке все готовые задания, вернуть их число"""
+    count = 0
+    while (job := claim(worker_id, names)) is not None:
+        run(job)
+        count += 1
+    return count
+
+
+class Worker:
+    """
+    threads потоков захватывают и выполняют задания, отдельный поток
+    продлевает аренду выполняемых. После stop() потоки дорабатывают
+    текущие задания и завершаются.
+    """
+
+    def __init__(self, threads=1, names=None, poll=None, burst=False):
+        self.id = f'{socket.gethostname()}:{os.getpid()}'
+        self.threads = threads
+        self.names = names
+        self.poll = poll if poll is not None else getattr(settings, 'JOBS_POLL_SECONDS', 1)
+        # burst: выполнить готовые задания и выйти, не дожидаясь новых
+        self.burst = burst
+        self.processed = 0
+        self._current = set()
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._finished = threading.Event()
+
+    def stop(self):
+        self._stopping.set()
+
+    def run(self):
+        loops = [threading.Thread(target=self._loop, name=f'jobs-{n}') for n in range(self.threads)]
+        heartbeat = threading.Thread(target=self._heartbeat, name='jobs-heartbeat', daemon=True)
+        heartbeat.start()
+        for thread in loops:
+            thread.start()
+        for thread in loops:
+            thread.join()
+        self._finished.set()
+        heartbeat.join()
+        return self.processed
+
+    def _loop(self):
+        try:
+            while not self._stopping.is_set():
+                # Как после запроса: соединение, закрытое базой, открывается заново
+                close_old_connections()
+                try:
+                    requeue_stale()
+                    job = claim(self.id, self.names)
+                except Exception:
+                    if self.burst:
+                        raise
+                    logger.exception('Job worker cannot claim a job')
+                    self._stopping.wait(self.poll)
+                    continue
+                if job is None:
+                    if self.burst:
+                        return
+                    self._stopping.wait(self.poll)
+                    continue
+                with self._lock:
+                    self._current.add(job.pk)
+                try:
+                    run(job)
+                finally:
+                    with self._lock:
+                        self._current.discard(job.pk)
+                        self.processed += 1
+        finally:
+            connections.close_all()
+
+    def _heartbeat(self):
+        try:
+            while not self._finished.wait(lease_seconds() / 3):
+                with self._lock:
+                    running = list(self._current)
+                if running:
+                    close_old_connections()
+                    try:
+                        Job.objects.filter(pk__in=running, status='running').update(locked_at=timezone.now())
+                    except Exception:
+                        logger.exception('Job worker cannot extend the lease')
+        finally:
+            connections.close_all()
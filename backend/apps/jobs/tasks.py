@@ -0,0 +1,18 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from backend.deletion import delete_in_batches
+from .models import Job
+from .queue import task
+
+
+@task('jobs.prune', concurrency=1)
+def prune(days=None):
+    """Удалить завершенные задания старше JOBS_RETENTION_DAYS"""
+    days = days if days is not None else getattr(settings, 'JOBS_RETENTION_DAYS', 7)
+    finished = Job.objects.filter(
+        status__in=['done', 'failed'], finished_at__lt=timezone.now() - timedelta(days=days)
+    )
+    return {'deleted': delete_in_batches(finished)}
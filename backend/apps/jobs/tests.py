@@ -0,0 +1,164 @@
+import io
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.users.models import User
+from backend.testing import UserAPITestCase
+from . import queue
+from .models import Job
+from .queue import backoff, claim, enqueue, requeue_stale, run, run_pending, task
+
+
+@override_settings(JOBS_RETRY_BACKOFF_SECONDS=0)
+class JobQueueTests(UserAPITestCase):
+    """Очередь в базе: захват, повторы с паузой, лимит параллельности, аренда и статус"""
+
+    username = 'worker'
+
+    def setUp(self):
+        self.calls = []
+        self.register('tests.echo', lambda **payload: self.calls.append(payload) or payload)
+
+    def register(self, name, function, **options):
+        task(name, **options)(function)
+        self.addCleanup(queue.TASKS.pop, name)
+
+    def test_job_result_and_status_api(self):
+        job = enqueue('tests.echo', {'value': 1}, user=self.user)
+        self.assertEqual(run_pending(), 1)
+        self.assertEqual(self.calls, [{'value': 1}])
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        data = client.get(f'/api/jobs/{job.pk}/').json()
+        self.assertEqual((data['status'], data['attempts'], data['result']), ('done', 1, {'value': 1}))
+
+        # Чужое задание не видно
+        other = User.objects.create_user('other-worker', 'other-worker@example.com', 'password')
+        client.force_authenticate(other)
+        self.assertEqual(client.get(f'/api/jobs/{job.pk}/').status_code, 404)
+
+    def test_unknown_task_is_rejected(self):
+        with self.assertRaises(LookupError):
+            enqueue('tests.missing')
+        # Задания задачи, которой нет в этом процессе (другая версия кода), не захватываются
+        Job.objects.create(name='tests.missing')
+        self.assertIsNone(claim('worker-1'))
+
+    def test_delayed_job_waits(self):
+        enqueue('tests.echo', delay=60)
+        self.assertEqual(run_pending(), 0)
+
+    def test_failed_job_is_retried_with_backoff(self):
+        attempts = []
+
+        def flaky():
+            attempts.append(len(attempts) + 1)
+            if len(attempts) < 3:
+                raise ValueError('not yet')
+            return 'ok'
+
+        self.register('tests.flaky', flaky, max_attempts=3)
+        job = enqueue('tests.flaky')
+        with self.assertLogs('apps.jobs.queue', 'ERROR'):
+            self.assertEqual(run_pending(), 3)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.result, job.error), ('done', 3, 'ok', ''))
+
+    def test_retries_stop_at_max_attempts(self):
+        failures = []
+        self.register('tests.broken', lambda: 1 / 0, max_attempts=2, on_failure=failures.append)
+        job = enqueue('tests.broken')
+        with self.assertLogs('apps.jobs.queue', 'ERROR'):
+            run_pending()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+        self.assertEqual(job.error, 'ZeroDivisionError: division by zero')
+        self.assertEqual([failed.pk for failed in failures], [job.pk])
+
+    @override_settings(JOBS_RETRY_BACKOFF_SECONDS=10, JOBS_RETRY_BACKOFF_MAX=60)
+    def test_backoff_doubles_up_to_the_cap(self):
+        with patch.object(queue.random, 'uniform', return_value=1):
+            self.assertEqual([backoff(attempts) for attempts in range(1, 6)], [10, 20, 40, 60, 60])
+
+        self.register('tests.broken', lambda: 1 / 0)
+        job = enqueue('tests.broken')
+        with self.assertLogs('apps.jobs.queue', 'ERROR'):
+            self.assertEqual(run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'queued')
+        self.assertGreaterEqual(job.run_at, timezone.now() + timedelta(seconds=4))
+
+    def test_claimed_job_is_not_claimed_again(self):
+        first, second = enqueue('tests.echo'), enqueue('tests.echo')
+        self.assertEqual(claim('worker-1').pk, first.pk)
+        self.assertEqual(claim('worker-2').pk, second.pk)
+        self.assertIsNone(claim('worker-3'))
+        self.assertEqual(Job.objects.get(pk=first.pk).locked_by, 'worker-1')
+
+    def test_concurrency_limit_per_task(self):
+        self.register('tests.heavy', lambda: None, concurrency=1)
+        heavy = [enqueue('tests.heavy'), enqueue('tests.heavy')]
+        echo = enqueue('tests.echo', delay=1)
+        Job.objects.filter(pk=echo.pk).update(run_at=timezone.now())
+
+        self.assertEqual(claim('worker-1').pk, heavy[0].pk)
+        # Второе задание той же задачи ждет, задания других задач идут
+        self.assertEqual(claim('worker-2').pk, echo.pk)
+        self.assertIsNone(claim('worker-3'))
+
+        # Обход общей проверки: лимит соблюдает и сам захват строки
+        with patch.object(queue, '_available', lambda names: list(names)):
+            self.assertIsNone(claim('worker-3', ['tests.heavy']))
+
+        run(Job.objects.get(pk=heavy[0].pk))
+        self.assertEqual(claim('worker-3').pk, heavy[1].pk)
+
+    @override_settings(JOBS_LEASE_SECONDS=60)
+    def test_job_of_a_lost_worker_is_requeued(self):
+        self.register('tests.once', lambda: None, max_attempts=1)
+        lost, last = enqueue('tests.echo'), enqueue('tests.once')
+        claim('worker-1')
+        claim('worker-1')
+        Job.objects.update(locked_at=timezone.now() - timedelta(minutes=5))
+        with self.assertLogs('apps.jobs.queue', 'WARNING'):
+            self.assertEqual(requeue_stale(), 2)
+        self.assertEqual(Job.objects.get(pk=lost.pk).status, 'queued')
+        self.assertEqual(Job.objects.get(pk=last.pk).status, 'failed')
+
+        # Итог прежнего захвата не перезаписывает новый
+        stale = Job.objects.get(pk=lost.pk)
+        stale.attempts = 1
+        again = claim('worker-2')
+        self.assertEqual(again.attempts, 2)
+        run(stale)
+        self.assertEqual(Job.objects.get(pk=lost.pk).status, 'running')
+
+    def test_prune_finished_jobs(self):
+        old = enqueue('tests.echo')
+        run_pending()
+        Job.objects.filter(pk=old.pk).update(finished_at=timezone.now() - timedelta(days=30))
+        fresh = enqueue('tests.echo')
+        run_pending()
+        prune = enqueue('jobs.prune')
+        run_pending()
+        self.assertEqual(Job.objects.get(pk=prune.pk).result, {'deleted': 1})
+        self.assertEqual(set(Job.objects.values_list('pk', flat=True)), {fresh.pk, prune.pk})
+
+    def test_commands(self):
+        out = io.StringIO()
+        call_command('enqueue_job', 'tests.echo', payload='{"value": 2}', stdout=out)
+        self.assertIn('Queued job', out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('enqueue_job', 'tests.missing', stdout=out)
+        with self.assertRaises(CommandError):
+            call_command('enqueue_job', 'tests.echo', payload='[]', stdout=out)
+        with self.assertRaises(CommandError):
+            call_command('run_jobs', task=['tests.missing'], stdout=out)
+        self.assertEqual(Job.objects.get().payload, {'value': 2})
@@ -0,0 +1,19 @@
+from rest_framework import generics
+from rest_framework.permissions import IsAuthenticated
+
+from .models import Job
+from .serializers import JobSerializer
+
+
+class JobView(generics.RetrieveAPIView):
+    """
+    GET /api/jobs/<id>/ - статус фонового задания пользователя.
+
+    Пока status равен queued или running, запрос повторяется; run_at у
+    задания в очереди - время следующей попытки, result - итог задачи.
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = JobSerializer
+
+    def get_queryset(self):
+        return Job.objects.filter(user=self.request.user)
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Nutrition
+from .models import Nutrition, DailyNutritionSummary
 
 # Register your models here.
 admin.site.register(Nutrition)
+admin.site.register(DailyNutritionSummary)
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from apps.users.models import User
+from apps.nutrition import rollup
+
+
+class Command(BaseCommand):
+    help = 'Пересчитать или проверить DailyNutritionSummary по исходным записям Nutrition'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users',
+                            help='ID пользователя (можно указать несколько раз)')
+        parser.add_argument('--verify', action='store_true',
+                            help='Только проверить сводку, ничего не изменяя')
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('id')
+        if options['users']:
+            users = users.filter(id__in=options['users'])
+
+        broken = 0
+        for user in users.iterator():
+            if options['verify']:
+                mismatches = rollup.verify(user)
+                for day, expected, stored in mismatches:
+                    self.stdout.write(f'user={user.id} date={day}: expected {expected}, stored {stored}')
+                broken += bool(mismatches)
+            else:
+                with transaction.atomic():
+                    rollup.rebuild(user)
+
+        if options['verify']:
+            if broken:
+                raise CommandError(f'Summary mismatch for {broken} user(s)')
+            self.stdout.write(self.style.SUCCESS('Nutrition summary is consistent'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Nutrition summary rebuilt'))
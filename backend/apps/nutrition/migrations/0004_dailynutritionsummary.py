@@ -0,0 +1,62 @@
+# Generated by Django 5.0.2 on 2026-10-18 14:55
+
+from zoneinfo import ZoneInfo
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def build_summaries(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    Nutrition = apps.get_model('nutrition', 'Nutrition')
+    DailyNutritionSummary = apps.get_model('nutrition', 'DailyNutritionSummary')
+    for user in User.objects.iterator():
+        rows = (
+            Nutrition.objects.filter(user=user)
+            .annotate(day=TruncDate('created_at', tzinfo=ZoneInfo(user.timezone)))
+            .values('day')
+            .annotate(
+                meals_count=Count('id'),
+                total_calories=Sum('calories'),
+                total_protein=Sum('protein'),
+                total_carbohydrates=Sum('carbohydrates'),
+                total_fats=Sum('fats'),
+            )
+            .order_by('day')
+        )
+        DailyNutritionSummary.objects.bulk_create(
+            DailyNutritionSummary(user=user, date=row.pop('day'), **row) for row in rows
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nutrition', '0003_nutrition_user_created_idx'),
+        ('users', '0005_user_timezone_goal_user_achieved_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyNutritionSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('meals_count', models.IntegerField(default=0)),
+                ('total_calories', models.IntegerField(default=0)),
+                ('total_protein', models.FloatField(default=0)),
+                ('total_carbohydrates', models.FloatField(default=0)),
+                ('total_fats', models.FloatField(default=0)),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='daily_nutrition', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='dailynutritionsummary',
+            constraint=models.UniqueConstraint(fields=('user', 'date'), name='daily_nutrition_user_date_uniq'),
+        ),
+        migrations.RunPython(build_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.2 on 2026-10-18 15:00
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nutrition', '0005_nutrition_client_id'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='nutrition',
+            index=models.Index(fields=['user', 'updated_at'], name='nutrition_user_updated_idx'),
+        ),
+    ]
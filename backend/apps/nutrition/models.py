@@ -9,7 +9,8 @@ class Nutrition(models.Model):
         ('snack', 'Перекус'),
     ]
 
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='nutrition_records')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='nutrition_records',
+                             db_index=False)  # покрывается индексом (user, created_at)
     meal_type = models.CharField(max_length=50, choices=MEAL_CHOICES)
     calories = models.IntegerField()
     protein = models.FloatField()
@@ -17,6 +18,37 @@ class Nutrition(models.Model):
     fats = models.FloatField()
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Ключ идемпотентности, который генерирует клиент (для bulk-загрузки)
+    client_id = models.CharField(max_length=64, null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'client_id'], name='nutrition_user_client_id_uniq',
+                                    condition=models.Q(client_id__isnull=False)),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='nutrition_user_created_idx'),
+            models.Index(fields=['user', 'updated_at'], name='nutrition_user_updated_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.meal_type}"
+
+class DailyNutritionSummary(models.Model):
+    """Суммы по питанию за локальные сутки пользователя, обновляются вместе с Nutrition"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_nutrition',
+                             db_index=False)  # покрывается ограничением (user, date)
+    date = models.DateField()
+    meals_count = models.IntegerField(default=0)
+    total_calories = models.IntegerField(default=0)
+    total_protein = models.FloatField(default=0)
+    total_carbohydrates = models.FloatField(default=0)
+    total_fats = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'date'], name='daily_nutrition_user_date_uniq'),
+        ]
 
     def __str__(self):
-        return f"{self.user.username} - {self.meal_type}"
+        return f"{self.user_id} - {self.date}"
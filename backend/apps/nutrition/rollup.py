@@ -0,0 +1,176 @@
+"""
+Поддержка таблицы DailyNutritionSummary.
+
+Все изменения Nutrition переводятся в приращения (delta) к строке за
+локальные сутки пользователя. Функции рассчитаны на вызов внутри
+transaction.atomic() вместе с изменением самих записей.
+
+После смены timezone сводку пересчитывает задание nutrition.rebuild_summary,
+а до его завершения (User.nutrition_summary_stale) day_totals и
+period_totals считают суммы по самим записям.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+
+from backend.bulk import insert_from_select
+from backend.dates import day_range, get_user_timezone
+from backend.stats import truncate
+from .models import Nutrition, DailyNutritionSummary
+
+TOTAL_FIELDS = ('total_calories', 'total_protein', 'total_carbohydrates', 'total_fats')
+
+
+def _delta_for(instance, sign=1):
+    return {
+        'meals_count': sign,
+        'total_calories': sign * instance.calories,
+        'total_protein': sign * instance.protein,
+        'total_carbohydrates': sign * instance.carbohydrates,
+        'total_fats': sign * instance.fats,
+    }
+
+
+def local_date(user, instance):
+    return instance.created_at.astimezone(get_user_timezone(user)).date()
+
+
+def apply_delta(user, day, delta):
+    """Прибавить delta к строке (user, day), создавая или удаляя ее при необходимости"""
+    summaries = DailyNutritionSummary.objects.filter(user=user, date=day)
+    changes = {field: F(field) + value for field, value in delta.items()}
+    if not summaries.update(**changes) and delta['meals_count'] > 0:
+        try:
+            with transaction.atomic():
+                DailyNutritionSummary.objects.create(user=user, date=day, **delta)
+        except IntegrityError:
+            # Строку за этот день успел создать параллельный запрос
+            summaries.update(**changes)
+    if delta['meals_count'] < 0:
+        summaries.filter(meals_count__lte=0).delete()
+
+
+def record_added(user, instance):
+    apply_delta(user, local_date(user, instance), _delta_for(instance))
+
+
+def record_removed(user, instance):
+    apply_delta(user, local_date(user, instance), _delta_for(instance, sign=-1))
+
+
+def record_changed(user, old, new):
+    removed, added = _delta_for(old, sign=-1), _delta_for(new)
+    delta = {field: added[field] + removed[field] for field in added}
+    apply_delta(user, local_date(user, new), delta)
+
+
+def _meal_totals():
+    return {
+        'meals_count': Count('id'),
+        'total_calories': Sum('calories'),
+        'total_protein': Sum('protein'),
+        'total_carbohydrates': Sum('carbohydrates'),
+        'total_fats': Sum('fats'),
+    }
+
+
+def daily_totals(user, queryset):
+    """Суммы queryset по локальным суткам пользователя одним GROUP BY"""
+    return (
+        queryset
+        .annotate(day=TruncDate('created_at', tzinfo=get_user_timezone(user)))
+        .values('day')
+        .annotate(**_meal_totals())
+        .order_by('day')
+    )
+
+
+def day_totals(user, day):
+    """TOTAL_FIELDS за локальные сутки day (values-queryset, не больше одной строки)"""
+    if user.nutrition_summary_stale:
+        start, end = day_range(day, get_user_timezone(user))
+        meals = Nutrition.objects.filter(user=user, created_at__gte=start, created_at__lt=end)
+        return daily_totals(user, meals).values(*TOTAL_FIELDS)
+    return DailyNutritionSummary.objects.filter(user=user, date=day).values(*TOTAL_FIELDS)
+
+
+def period_totals(user, date_from, date_to, bucket):
+    """Суммы по интервалам bucket (period, meals_count и TOTAL_FIELDS) за [date_from, date_to]"""
+    if user.nutrition_summary_stale:
+        tz = get_user_timezone(user)
+        start, end = day_range(date_from, tz, days=(date_to - date_from).days + 1)
+        return (
+            Nutrition.objects.filter(user=user, created_at__gte=start, created_at__lt=end)
+            .annotate(period=truncate('created_at', bucket, tz))
+            .values('period')
+            .annotate(**_meal_totals())
+            .order_by('period')
+        )
+    # Один GROUP BY по дневной сводке: не больше одной строки на день
+    return (
+        DailyNutritionSummary.objects
+        .filter(user=user, date__gte=date_from, date__lte=date_to)
+        .annotate(period=truncate('date', bucket))
+        .values('period')
+        .annotate(meals_count=Sum('meals_count'), **{field: Sum(field) for field in TOTAL_FIELDS})
+        .order_by('period')
+    )
+
+
+def queryset_added(user, queryset):
+    """Прибавить к сводке записи queryset после их массовой вставки"""
+    for row in daily_totals(user, queryset):
+        apply_delta(user, row.pop('day'), row)
+
+
+def queryset_removed(user, queryset):
+    """
+    Вычесть из сводки записи queryset перед их массовым удалением.
+
+    Сводки затронутых дней пересчитываются по оставшимся записям тремя
+    запросами независимо от числа дней, а не приращением по каждому дню.
+    """
+    days = queryset.annotate(removed_day=TruncDate('created_at', tzinfo=get_user_timezone(user))).values('removed_day')
+    DailyNutritionSummary.objects.filter(user=user, date__in=days).delete()
+    remaining = (
+        Nutrition.objects.filter(user=user)
+        .exclude(pk__in=queryset.values('pk'))
+        .alias(local_day=TruncDate('created_at', tzinfo=get_user_timezone(user)))
+        .filter(local_day__in=days)
+    )
+    insert_from_select(
+        DailyNutritionSummary, daily_totals(user, remaining),
+        {'date': 'day', 'meals_count': 'meals_count', **{field: field for field in TOTAL_FIELDS}},
+        {'user': user.pk},
+    )
+
+
+def rebuild(user):
+    """Пересчитать сводку пользователя по исходным записям"""
+    DailyNutritionSummary.objects.filter(user=user).delete()
+    DailyNutritionSummary.objects.bulk_create(
+        DailyNutritionSummary(user=user, date=row.pop('day'), **row)
+        for row in daily_totals(user, Nutrition.objects.filter(user=user))
+    )
+
+
+def verify(user):
+    """Список расхождений сводки с исходными записями: (дата, ожидалось, сохранено)"""
+    expected = {
+        row.pop('day'): row
+        for row in daily_totals(user, Nutrition.objects.filter(user=user))
+    }
+    stored = {
+        row.pop('date'): row
+        for row in DailyNutritionSummary.objects.filter(user=user).values(
+            'date', 'meals_count', *TOTAL_FIELDS
+        )
+    }
+    mismatches = []
+    for day in sorted(expected.keys() | stored.keys()):
+        want, have = expected.get(day), stored.get(day)
+        if want is None or have is None or want['meals_count'] != have['meals_count'] or any(
+            abs((want[field] or 0) - have[field]) > 1e-6 for field in TOTAL_FIELDS
+        ):
+            mismatches.append((day, want, have))
+    return mismatches
@@ -4,4 +4,5 @@ from .models import Nutrition
 class NutritionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Nutrition
-        exclude = ('user',)  # Исключаем поле user из сериализатора 
\ No newline at end of file
+        exclude = ('user',)  # Исключаем поле user из сериализатора
+        read_only_fields = ('client_id',) 
\ No newline at end of file
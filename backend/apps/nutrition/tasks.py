@@ -0,0 +1,28 @@
+from django.db import transaction
+
+from apps.jobs.queue import task
+from apps.users.models import User
+from apps.users.sessions import forget_auth_state
+from backend.cache import bump_user_version
+from . import rollup
+
+
+@task('nutrition.rebuild_summary', concurrency=1)
+def rebuild_summary(user_ids=None):
+    """Пересчитать DailyNutritionSummary пользователей user_ids (по умолчанию - всех)"""
+    users = User.objects.order_by('id')
+    if user_ids:
+        users = users.filter(id__in=user_ids)
+    rebuilt = 0
+    for user in users.iterator():
+        # Транзакция на пользователя, как в команде rebuild_nutrition_summary
+        with transaction.atomic():
+            rollup.rebuild(user)
+            # Если timezone успели сменить снова, сводку пересчитает следующее задание
+            User.objects.filter(pk=user.pk, timezone=user.timezone, nutrition_summary_stale=True).update(
+                nutrition_summary_stale=False
+            )
+        forget_auth_state(user.pk)
+        bump_user_version(user.pk)
+        rebuilt += 1
+    return {'users': rebuilt}
@@ -1,3 +1,283 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from io import StringIO
+from unittest.mock import patch
 
-# Create your tests here.
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from apps.jobs.queue import run_pending
+from apps.users.sessions import start_session
+from backend.dates import user_day_range, user_today
+from backend.fastpath import get_plan
+from backend.testing import UserAPITestCase, explain
+from . import rollup
+from .models import Nutrition, DailyNutritionSummary
+from .serializers import NutritionSerializer
+from .views import NutritionViewSet
+
+
+class NutritionQueryPlanTests(UserAPITestCase):
+    """Проверяем, что фильтры по пользователю и дате используют индекс (user, created_at)"""
+
+    username = 'planner'
+
+    def test_day_range_uses_user_created_index(self):
+        start, end = user_day_range(self.user)
+        plan = explain(
+            Nutrition.objects.filter(user=self.user, created_at__gte=start, created_at__lt=end)
+        )
+        self.assertIn('nutrition_user_created_idx', plan)
+
+
+class DailyNutritionSummaryTests(UserAPITestCase):
+    """Сводка по дням должна совпадать с исходными записями после любых изменений"""
+
+    username = 'eater'
+
+    def create_meal(self, meal_type='lunch', calories=500):
+        response = self.client.post('/api/nutrition/', {
+            'meal_type': meal_type, 'calories': calories,
+            'protein': 20.5, 'carbohydrates': 60, 'fats': 15.25,
+        })
+        self.assertEqual(response.status_code, 201)
+        return response.json()['id']
+
+    def assertConsistent(self):
+        self.assertEqual(rollup.verify(self.user), [])
+
+    def test_today_stats_follow_writes(self):
+        meal_id = self.create_meal(calories=500)
+        self.create_meal(meal_type='dinner', calories=300)
+        self.assertEqual(self.client.get('/api/nutrition/today_stats/').json()['total_calories'], 800)
+
+        self.client.patch(f'/api/nutrition/{meal_id}/', {'calories': 400})
+        self.assertEqual(self.client.get('/api/nutrition/today_stats/').json()['total_calories'], 700)
+        self.assertConsistent()
+
+        self.client.delete(f'/api/nutrition/{meal_id}/')
+        self.assertEqual(self.client.get('/api/nutrition/today_stats/').json()['total_calories'], 300)
+        self.assertConsistent()
+
+    def test_bulk_deletes_keep_summary_current(self):
+        self.create_meal(meal_type='lunch')
+        self.create_meal(meal_type='snack')
+        self.client.delete('/api/nutrition/delete_by_meal_type/?meal_type=snack')
+        self.assertConsistent()
+
+        self.client.delete(f'/api/nutrition/delete_by_date/?date={user_today(self.user)}')
+        self.assertConsistent()
+        self.assertFalse(DailyNutritionSummary.objects.filter(user=self.user).exists())
+
+        self.create_meal()
+        self.client.delete('/api/nutrition/delete_all/')
+        self.assertConsistent()
+        self.assertEqual(
+            self.client.get('/api/nutrition/today_stats/').json(),
+            dict.fromkeys(rollup.TOTAL_FIELDS, 0),
+        )
+
+    def test_rebuild_restores_summary(self):
+        self.create_meal()
+        DailyNutritionSummary.objects.filter(user=self.user).update(total_calories=1)
+        self.assertNotEqual(rollup.verify(self.user), [])
+        rollup.rebuild(self.user)
+        self.assertConsistent()
+
+    def test_timezone_change_rebuilds_summary_in_background(self):
+        api = APIClient()
+        api.credentials(HTTP_AUTHORIZATION=f'Bearer {start_session(self.user).access_token}')
+        today = timezone.now().date()
+        self.create_meal(calories=500)
+        # Вчерашний полдень UTC - сегодняшние сутки в поясе UTC+14
+        noon = datetime.combine(today - timedelta(days=1), time(12), tzinfo=dt_timezone.utc)
+        Nutrition.objects.filter(pk=self.create_meal(calories=300)).update(created_at=noon)
+        rollup.rebuild(self.user)
+
+        def stats():
+            return (
+                api.get('/api/nutrition/today_stats/').json(),
+                api.get(f'/api/nutrition/stats/?from={today - timedelta(days=2)}&to={today + timedelta(days=1)}').json(),
+                api.get('/api/dashboard/').json()['nutrition'],
+            )
+
+        response = api.put('/api/auth/profile/', {'timezone': 'Pacific/Kiritimati'})
+        self.assertEqual(response.status_code, 200)
+        # Сводка еще по UTC, ответы считаются по записям
+        self.assertTrue(DailyNutritionSummary.objects.filter(user=self.user, date=today - timedelta(days=1)).exists())
+        live = stats()
+
+        self.assertEqual(run_pending(), 1)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.nutrition_summary_stale)
+        self.assertConsistent()
+        self.assertFalse(DailyNutritionSummary.objects.filter(user=self.user, date=today - timedelta(days=1)).exists())
+        self.assertEqual(stats(), live)
+
+    def test_bulk_upload_is_idempotent(self):
+        meal = {'meal_type': 'lunch', 'calories': 100, 'protein': 1, 'carbohydrates': 2, 'fats': 3}
+        batch = [{**meal, 'client_id': f'offline-{i}'} for i in range(3)]
+
+        response = self.client.post('/api/nutrition/bulk/', batch, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual({item['status'] for item in response.json()}, {'created'})
+
+        response = self.client.post('/api/nutrition/bulk/', batch, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({item['status'] for item in response.json()}, {'existing'})
+        self.assertEqual(Nutrition.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(self.client.get('/api/nutrition/today_stats/').json()['total_calories'], 300)
+        self.assertConsistent()
+
+    def test_bulk_upload_rejects_invalid_batch(self):
+        batch = [
+            {'meal_type': 'lunch', 'calories': 100, 'protein': 1, 'carbohydrates': 2, 'fats': 3,
+             'client_id': 'ok'},
+            {'meal_type': 'lunch', 'calories': 'many', 'protein': 1, 'carbohydrates': 2, 'fats': 3},
+        ]
+        response = self.client.post('/api/nutrition/bulk/', batch, format='json')
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()
+        self.assertEqual(errors[0], {})
+        self.assertIn('calories', errors[1])
+        self.assertIn('client_id', errors[1])
+        self.assertFalse(Nutrition.objects.exists())
+
+
+class NutritionFastPathParityTests(UserAPITestCase):
+    """Быстрый путь list/retrieve должен совпадать с NutritionSerializer байт в байт"""
+
+    username = 'parity'
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Nutrition.objects.bulk_create([
+            Nutrition(user=cls.user, meal_type='breakfast', calories=350,
+                      protein=0.1, carbohydrates=1e-7, fats=12345.678),
+            Nutrition(user=cls.user, meal_type='snack', calories=0,
+                      protein=0, carbohydrates=0, fats=0, client_id='offline-1'),
+        ])
+
+    def test_list_and_retrieve_match_serializer(self):
+        self.assertIsNotNone(get_plan(NutritionSerializer()))
+        queryset = Nutrition.objects.filter(user=self.user)
+        response = self.client.get('/api/nutrition/')
+        self.assertEqual(response.content, JSONRenderer().render(NutritionSerializer(queryset, many=True).data))
+
+        record = queryset.first()
+        response = self.client.get(f'/api/nutrition/{record.pk}/')
+        self.assertEqual(response.content, JSONRenderer().render(NutritionSerializer(record).data))
+
+
+class NutritionImportTests(UserAPITestCase):
+    """Импорт истории файлом: пачки, ошибки по строкам, повтор без дубликатов и сводка"""
+
+    CSV = (
+        'meal_type,calories,protein,carbohydrates,fats,created_at,client_id\n'
+        'breakfast,400,20,50,10,2024-03-01T08:00:00Z,a1\n'
+        'lunch,700,35,80,25,2024-03-01T13:00:00Z,a2\n'
+        'brunch,500,1,1,1,,a3\n'
+        'dinner,600,30,60,20,2024-03-02T19:00:00Z,\n'
+        'snack,150,5,20,5,not-a-date,a5\n'
+    )
+
+    username = 'importer'
+
+    def upload(self, content, name='meals.csv', **data):
+        upload = SimpleUploadedFile(name, content.encode() if isinstance(content, str) else content)
+        return self.client.post('/api/nutrition/import/', {'file': upload, **data}, format='multipart')
+
+    def test_csv_import_reports_rows_and_keeps_dates(self):
+        with patch.object(NutritionViewSet, 'import_batch_size', 2):
+            response = self.upload(self.CSV)
+        self.assertEqual(response.status_code, 201)
+        report = response.json()
+        self.assertEqual(
+            {key: report[key] for key in ('rows', 'created', 'skipped', 'failed')},
+            {'rows': 5, 'created': 3, 'skipped': 0, 'failed': 2},
+        )
+        self.assertEqual([error['line'] for error in report['errors']], [4, 6])
+        self.assertIn('meal_type', report['errors'][0]['errors'])
+        self.assertIn('created_at', report['errors'][1]['errors'])
+
+        dates = Nutrition.objects.filter(user=self.user).order_by('created_at').values_list('created_at', flat=True)
+        self.assertEqual([value.isoformat() for value in dates][:2],
+                         ['2024-03-01T08:00:00+00:00', '2024-03-01T13:00:00+00:00'])
+        self.assertEqual(rollup.verify(self.user), [])
+
+        # Повтор того же файла: строки с client_id пропускаются, без client_id - создаются снова
+        response = self.upload(self.CSV)
+        self.assertEqual((response.json()['created'], response.json()['skipped']), (1, 2))
+
+    def test_ndjson_import(self):
+        lines = [
+            json.dumps({'meal_type': 'lunch', 'calories': 500, 'protein': 20, 'carbohydrates': 60, 'fats': 15}),
+            '',
+            '[1, 2]',
+            '{broken',
+        ]
+        response = self.upload('\n'.join(lines), name='meals.jsonl')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.json()['created'], response.json()['failed']), (1, 2))
+        self.assertEqual([error['line'] for error in response.json()['errors']], [3, 4])
+
+    def test_unreadable_file_keeps_committed_batches(self):
+        # Файл декодируется блоками по 8 КБ - испорченный байт далеко от начала
+        content = self.CSV.encode() + b'lunch,500,20,60,15,,\n' * 1000 + b'lunch,\xff\xfe,1,1,1,,z\n'
+        with patch.object(NutritionViewSet, 'import_batch_size', 100):
+            response = self.upload(content)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('error', response.json())
+        self.assertGreater(response.json()['created'], 0)
+        self.assertEqual(Nutrition.objects.filter(user=self.user).count(), response.json()['created'])
+        self.assertEqual(rollup.verify(self.user), [])
+
+    def test_bad_requests(self):
+        self.assertEqual(self.client.post('/api/nutrition/import/', {}, format='multipart').status_code, 400)
+        self.assertEqual(self.upload(self.CSV, name='meals.txt').status_code, 400)
+        self.assertEqual(self.upload(self.CSV, name='meals.txt', input='csv').status_code, 201)
+
+    def test_management_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as file:
+            file.write(self.CSV)
+            file.flush()
+            out, err = StringIO(), StringIO()
+            call_command('import_history', 'importer', 'nutrition', file.name, batch_size=2, stdout=out, stderr=err)
+        self.assertIn('Imported 3 of 5 row(s)', out.getvalue())
+        self.assertIn('line 4:', err.getvalue())
+        self.assertEqual(Nutrition.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(rollup.verify(self.user), [])
+
+    def test_large_file_is_imported_by_a_job(self):
+        with tempfile.TemporaryDirectory() as media, tempfile.TemporaryDirectory() as uploads, \
+                override_settings(MEDIA_ROOT=media, IMPORT_UPLOAD_ROOT=uploads, IMPORT_SYNC_MAX_BYTES=100):
+            response = self.upload(self.CSV)
+            self.assertEqual(response.status_code, 202)
+            self.assertFalse(Nutrition.objects.filter(user=self.user).exists())
+            # Файл ждет задания вне MEDIA_ROOT, который раздается по /media/
+            self.assertEqual(len(os.listdir(uploads)), 1)
+            self.assertEqual(os.listdir(media), [])
+            self.assertEqual(run_pending(), 1)
+            self.assertEqual(os.listdir(uploads), [])
+
+        job = self.client.get(response.json()['status_url']).json()
+        self.assertEqual(job['status'], 'done')
+        self.assertEqual((job['result']['created'], job['result']['failed']), (3, 2))
+        self.assertEqual(Nutrition.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(rollup.verify(self.user), [])
+
+    def test_upload_is_removed_when_enqueue_fails(self):
+        with tempfile.TemporaryDirectory() as uploads, \
+                override_settings(IMPORT_UPLOAD_ROOT=uploads, IMPORT_SYNC_MAX_BYTES=100), \
+                patch('backend.imports.enqueue', side_effect=DatabaseError('database is locked')):
+            with self.assertRaises(DatabaseError):
+                self.upload(self.CSV)
+            self.assertEqual(os.listdir(uploads), [])
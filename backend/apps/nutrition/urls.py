@@ -1,10 +1,21 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import NutritionViewSet
+from .views import NutritionViewSet, AsyncNutritionListView, AsyncTodayNutritionView
 
 router = DefaultRouter()
 router.register(r'', NutritionViewSet, basename='nutrition')
 
 urlpatterns = [
     path('', include(router.urls)),
-] 
\ No newline at end of file
+]
+
+if settings.ASYNC_READ_VIEWS:
+    urlpatterns[:0] = [
+        path('', AsyncNutritionListView.as_view(
+            sync_view=NutritionViewSet.as_view({'get': 'list', 'post': 'create'}, basename='nutrition', detail=False)
+        ), name='nutrition-list'),
+        path('today_stats/', AsyncTodayNutritionView.as_view(
+            sync_view=NutritionViewSet.as_view({'get': 'today_stats'}, basename='nutrition', detail=False)
+        ), name='nutrition-today-stats'),
+    ]
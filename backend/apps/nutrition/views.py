@@ -5,37 +5,66 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from .models import Nutrition
 from .serializers import NutritionSerializer
-from django.utils import timezone
-from django.db.models import Sum
+from . import rollup
+from django.db import transaction
+from django.utils.dateparse import parse_date
+from backend.dates import user_today
+from backend.logs import SampledLogger
+from backend.stats import parse_stats_params, fill_buckets
+from backend.cache import UserCacheInvalidationMixin, cache_per_user
+from backend.conditional import ConditionalGetMixin
+from backend.bulk import BulkCreateMixin
+from backend.export import ExportMixin
+from backend.imports import ImportMixin
+from backend.fastpath import FastReadMixin
+from backend.sparse import SparseFieldsMixin
+from backend.async_views import AsyncListView, AsyncReadView
+from apps.sync import tombstones
+from apps.users.deletion import delete_user_data, deletion_response
 import logging
 
 logger = logging.getLogger(__name__)
+# События на каждый запрос, пишутся с долей LOG_SAMPLE_RATE
+request_logger = SampledLogger(logger)
 
 # Create your views here.
 
-class NutritionViewSet(viewsets.ModelViewSet):
+class NutritionViewSet(UserCacheInvalidationMixin, ConditionalGetMixin, SparseFieldsMixin, FastReadMixin,
+                       ExportMixin, ImportMixin, BulkCreateMixin, viewsets.ModelViewSet):
     serializer_class = NutritionSerializer
     permission_classes = [IsAuthenticated]
+    import_kind = 'nutrition'
     
     def get_queryset(self):
         return Nutrition.objects.filter(user=self.request.user)
 
+    @transaction.atomic
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        instance = serializer.save(user=self.request.user)
+        rollup.record_added(self.request.user, instance)
 
+    @transaction.atomic
     def perform_update(self, serializer):
         instance = self.get_object()
         if instance.user == self.request.user:
-            serializer.save()
+            updated = serializer.save()
+            rollup.record_changed(self.request.user, instance, updated)
         else:
             raise PermissionError("You don't have permission to edit this nutrition record")
 
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        rollup.record_removed(self.request.user, instance)
+        tombstones.record_deleted(self.request.user, 'nutrition', [instance.pk])
+        instance.delete()
+
+    def after_bulk_create(self, created_ids):
+        rollup.queryset_added(self.request.user, self.get_queryset().filter(id__in=created_ids))
+
     @action(detail=False, methods=['delete'])
     def delete_all(self, request):
         """Удалить все записи о питании пользователя"""
-        nutrition = self.get_queryset()
-        nutrition.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        return deletion_response(request, delete_user_data(request.user, 'nutrition'))
 
     @action(detail=False, methods=['delete'])
     def delete_by_date(self, request):
@@ -46,10 +75,18 @@ class NutritionViewSet(viewsets.ModelViewSet):
                 {'error': 'Date parameter is required'}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
-        
-        nutrition = self.get_queryset().filter(created_at__date=date)
-        nutrition.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+
+        try:
+            day = parse_date(date)
+        except ValueError:
+            day = None
+        if day is None:
+            return Response(
+                {'error': 'Date must be in YYYY-MM-DD format'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return deletion_response(request, delete_user_data(request.user, 'nutrition', {'date': day.isoformat()}))
 
     @action(detail=False, methods=['delete'])
     def delete_by_meal_type(self, request):
@@ -61,31 +98,70 @@ class NutritionViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        nutrition = self.get_queryset().filter(meal_type=meal_type)
-        nutrition.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        return deletion_response(request, delete_user_data(request.user, 'nutrition', {'meal_type': meal_type}))
 
     @action(detail=False, methods=['get'])
+    @cache_per_user('nutrition-today', vary_on=lambda request: user_today(request.user))
     def today_stats(self, request):
         """Получить статистику питания за сегодня"""
         try:
-            today = timezone.now().date()
-            stats = self.get_queryset().filter(created_at__date=today).aggregate(
-                total_calories=Sum('calories'),
-                total_protein=Sum('protein'),
-                total_carbohydrates=Sum('carbohydrates'),
-                total_fats=Sum('fats')
-            )
-            
-            # Преобразуем None в 0 для всех значений
-            stats = {k: v or 0 for k, v in stats.items()}
+            # Одна строка сводки вместо агрегации по всем приемам пищи
+            # (по записям за сутки, только пока сводка пересчитывается)
+            stats = rollup.day_totals(request.user, user_today(request.user)).first()
+
+            # Нет записей за сегодня - все значения 0
+            stats = stats or dict.fromkeys(rollup.TOTAL_FIELDS, 0)
             
-            logger.info(f"Today's nutrition stats for user {request.user.username}: {stats}")
+            request_logger.info('Today nutrition stats', extra={'user_id': request.user.pk, 'stats': stats})
             
             return Response(stats)
-        except Exception as e:
-            logger.error(f"Error getting today's nutrition stats: {e}")
+        except Exception:
+            logger.exception("Error getting today's nutrition stats")
             return Response(
                 {'error': 'Failed to get nutrition statistics'},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+
+    @action(detail=False, methods=['get'])
+    def stats(self, request):
+        """Статистика питания по дням, неделям или месяцам (?from=&to=&bucket=)"""
+        try:
+            date_from, date_to, bucket = parse_stats_params(
+                request.query_params, user_today(request.user)
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        rows = rollup.period_totals(request.user, date_from, date_to, bucket)
+        empty = dict.fromkeys(('meals_count', *rollup.TOTAL_FIELDS), 0)
+        return Response({
+            'from': date_from,
+            'to': date_to,
+            'bucket': bucket,
+            'results': fill_buckets(rows, date_from, date_to, bucket, empty),
+        })
+
+
+class AsyncNutritionListView(AsyncListView):
+    """GET /api/nutrition/ под ASGI (см. backend.async_views)"""
+    serializer_class = NutritionSerializer
+
+
+class AsyncTodayNutritionView(AsyncReadView):
+    """GET /api/nutrition/today_stats/ под ASGI, общий кэш с NutritionViewSet.today_stats"""
+
+    @cache_per_user('nutrition-today', vary_on=lambda request: user_today(request.user))
+    async def read(self, request):
+        try:
+            stats = await rollup.day_totals(request.user, user_today(request.user)).afirst()
+            stats = stats or dict.fromkeys(rollup.TOTAL_FIELDS, 0)
+
+            request_logger.info('Today nutrition stats', extra={'user_id': request.user.pk, 'stats': stats})
+
+            return self.json_response(stats)
+        except Exception:
+            logger.exception("Error getting today's nutrition stats")
+            return self.json_response(
+                {'error': 'Failed to get nutrition statistics'},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.sync.models import Tombstone
+
+
+class Command(BaseCommand):
+    help = 'Удалить следы удалений старше SYNC_TOMBSTONE_RETENTION_DAYS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        horizon = timezone.now() - timedelta(days=settings.SYNC_TOMBSTONE_RETENTION_DAYS)
+        old = Tombstone.objects.filter(deleted_at__lt=horizon).order_by('id')
+        total = 0
+        while True:
+            ids = list(old.values_list('id', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            total += Tombstone.objects.filter(id__in=ids).delete()[0]
+        self.stdout.write(self.style.SUCCESS(f'Pruned {total} tombstone(s)'))
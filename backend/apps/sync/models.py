@@ -0,0 +1,26 @@
+from django.db import models
+from django.utils import timezone
+from apps.users.models import User
+
+class Tombstone(models.Model):
+    """След удаленной записи для инкрементальной синхронизации"""
+    KIND_CHOICES = [
+        ('workout', 'Workout'),
+        ('nutrition', 'Nutrition'),
+        ('goal', 'Goal'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='tombstones',
+                             db_index=False)  # покрывается индексом (user, deleted_at)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    # Пустой object_id - удалены все записи этого типа (delete_all)
+    object_id = models.BigIntegerField(null=True, blank=True)
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'deleted_at'], name='tombstone_user_deleted_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.kind} {self.object_id or '*'}"
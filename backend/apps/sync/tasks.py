@@ -0,0 +1,12 @@
+import io
+
+from django.core.management import call_command
+
+from apps.jobs.queue import task
+
+
+@task('sync.prune_tombstones', concurrency=1)
+def prune_tombstones():
+    out = io.StringIO()
+    call_command('prune_sync_tombstones', stdout=out)
+    return {'output': out.getvalue().strip()}
@@ -0,0 +1,78 @@
+from datetime import timedelta
+
+from django.test import override_settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from apps.workouts.models import Workout
+from backend.testing import UserAPITestCase
+from .models import Tombstone
+
+
+class SyncTests(UserAPITestCase):
+    """Инкрементальная синхронизация возвращает только изменения после cursor"""
+
+    username = 'syncer'
+
+    def create_workout(self, name):
+        response = self.client.post('/api/workouts/', {
+            'name': name, 'description': 'Notes', 'duration': 30, 'calories_burned': 200,
+        })
+        return response.json()['id']
+
+    def sync(self, cursor=None):
+        response = self.client.get('/api/sync/', {'since': cursor} if cursor else {})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_first_sync_is_full_snapshot(self):
+        self.create_workout('Run')
+        data = self.sync()
+        self.assertTrue(data['reset'])
+        self.assertEqual([w['name'] for w in data['workouts']['updated']], ['Run'])
+
+    def test_delta_contains_only_changes_and_deletions(self):
+        kept = self.create_workout('Kept')
+        removed = self.create_workout('Removed')
+        cursor = self.sync()['cursor']
+        Workout.objects.filter(user=self.user).update(updated_at='2000-01-01T00:00:00Z')
+
+        self.client.patch(f'/api/workouts/{kept}/', {'name': 'Renamed'})
+        self.client.delete(f'/api/workouts/{removed}/')
+        data = self.sync(cursor)
+
+        self.assertFalse(data['reset'])
+        self.assertEqual([w['name'] for w in data['workouts']['updated']], ['Renamed'])
+        self.assertEqual(data['workouts']['deleted'], [removed])
+        self.assertFalse(data['workouts']['cleared'])
+        self.assertEqual(data['goals'], {'updated': [], 'deleted': [], 'cleared': False})
+
+    def test_write_committed_after_sync_is_not_lost(self):
+        # Метка времени записи ставится до коммита: запись с updated_at
+        # раньше начала синхронизации становится видна уже после нее
+        stamped_at = timezone.now()
+        cursor = self.sync()['cursor']
+        late = Workout.objects.create(user=self.user, name='Late', description='', duration=1, calories_burned=1)
+        Workout.objects.filter(pk=late.pk).update(updated_at=stamped_at)
+        Tombstone.objects.create(user=self.user, kind='goal', object_id=7, deleted_at=stamped_at)
+
+        data = self.sync(cursor)
+        self.assertEqual([w['id'] for w in data['workouts']['updated']], [late.pk])
+        self.assertEqual(data['goals']['deleted'], [7])
+
+    @override_settings(SYNC_CURSOR_OVERLAP_SECONDS=30)
+    def test_cursor_overlaps_previous_response(self):
+        before = timezone.now()
+        cursor = parse_datetime(self.sync()['cursor'])
+        after = timezone.now()
+        self.assertTrue(before - timedelta(seconds=30) <= cursor <= after - timedelta(seconds=30))
+
+    def test_bulk_deletes_leave_tombstones(self):
+        self.create_workout('Old')
+        cursor = self.sync()['cursor']
+        self.client.delete('/api/workouts/delete_all/')
+        self.assertTrue(self.sync(cursor)['workouts']['cleared'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/sync/', {'since': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
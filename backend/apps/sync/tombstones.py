@@ -0,0 +1,24 @@
+from django.utils import timezone
+
+from backend.bulk import insert_from_select
+from .models import Tombstone
+
+
+def record_deleted(user, kind, object_ids):
+    Tombstone.objects.bulk_create(
+        Tombstone(user=user, kind=kind, object_id=object_id) for object_id in object_ids
+    )
+
+
+def record_cleared(user, kind):
+    """Одна запись вместо тысяч: клиент очищает всю коллекцию этого типа"""
+    Tombstone.objects.create(user=user, kind=kind)
+
+
+def record_queryset_deleted(user, kind, queryset):
+    """Записать удаление всех строк queryset; вызывать до queryset.delete()"""
+    # INSERT ... SELECT: один запрос при любом числе удаляемых строк
+    insert_from_select(
+        Tombstone, queryset.values('id'), {'object_id': 'id'},
+        {'user': user.pk, 'kind': kind, 'deleted_at': timezone.now()},
+    )
@@ -0,0 +1,86 @@
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from apps.nutrition.models import Nutrition
+from apps.nutrition.serializers import NutritionSerializer
+from apps.users.models import Goal
+from apps.users.serializers import GoalSerializer
+from apps.workouts.models import Workout
+from apps.workouts.serializers import WorkoutSerializer
+from .models import Tombstone
+
+# Ключ ответа, тип в Tombstone, модель и сериализатор
+SYNCED = (
+    ('workouts', 'workout', Workout, WorkoutSerializer),
+    ('nutrition', 'nutrition', Nutrition, NutritionSerializer),
+    ('goals', 'goal', Goal, GoalSerializer),
+)
+
+
+class SyncView(APIView):
+    """
+    GET /api/sync/?since=<cursor> - изменения с момента cursor.
+
+    Возвращает измененные и удаленные тренировки, записи о питании и цели.
+    Без since (или если since старше срока хранения удалений) отдается
+    полный снимок с reset=true. Значение cursor из ответа передается в
+    следующий запрос.
+
+    Соседние ответы пересекаются на SYNC_CURSOR_OVERLAP_SECONDS, поэтому
+    клиент может получить уже известную запись повторно и сопоставляет
+    записи по id; cleared применяется до updated.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        # updated_at и deleted_at ставятся в Python до коммита, поэтому
+        # запись с меткой раньше начала запроса может стать видна уже после
+        # него. Курсор отступает назад на время самой долгой транзакции
+        # записи: такие записи придут в следующий раз, а не потеряются
+        now = timezone.now()
+        cursor = now - timedelta(seconds=getattr(settings, 'SYNC_CURSOR_OVERLAP_SECONDS', 60))
+        since = request.query_params.get('since')
+        if since:
+            try:
+                since = parse_datetime(since)
+            except ValueError:
+                since = None
+            if since is None:
+                return Response(
+                    {'error': 'since must be a cursor returned by a previous sync'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since, dt_timezone.utc)
+
+        retention = timedelta(days=getattr(settings, 'SYNC_TOMBSTONE_RETENTION_DAYS', 30))
+        reset = since is None or since < now - retention
+
+        data = {'cursor': cursor.isoformat().replace('+00:00', 'Z'), 'reset': reset}
+        tombstones = {}
+        if not reset:
+            for kind, object_id in (
+                Tombstone.objects
+                .filter(user=request.user, deleted_at__gte=since)
+                .values_list('kind', 'object_id')
+            ):
+                tombstones.setdefault(kind, []).append(object_id)
+
+        for key, kind, model, serializer_class in SYNCED:
+            changed = model.objects.filter(user=request.user)
+            if not reset:
+                changed = changed.filter(updated_at__gte=since)
+            deleted = tombstones.get(kind, [])
+            data[key] = {
+                'updated': serializer_class(changed.order_by('updated_at', 'id'), many=True).data,
+                'deleted': sorted(object_id for object_id in deleted if object_id is not None),
+                'cleared': None in deleted,
+            }
+        return Response(data)
@@ -1,6 +1,7 @@
 from django.contrib import admin
-from .models import User, Goal
+from .models import User, Goal, DeletionJob
 
 # Register your models here.
 admin.site.register(User)
-admin.site.register(Goal)
\ No newline at end of file
+admin.site.register(Goal)
+admin.site.register(DeletionJob)
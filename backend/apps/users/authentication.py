@@ -0,0 +1,58 @@
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db import router
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .sessions import aget_auth_state, get_auth_state, is_generation_valid
+
+
+class StatelessSessionJWTAuthentication(JWTAuthentication):
+    """
+    Аутентификация по токену без чтения строки пользователя.
+
+    request.user - экземпляр User, у которого загружены только id,
+    timezone и nutrition_summary_stale, поэтому фильтры вида
+    `filter(user=request.user)`, расчет локальной даты и выбор источника
+    статистики питания не требуют запросов. Остальные поля подгружаются
+    одним запросом при первом обращении к любому из них. Отзыв сессий и
+    is_active проверяются по закэшированному состоянию.
+    """
+
+    def get_user(self, validated_token):
+        user_id = self.get_user_id(validated_token)
+        return self.user_from_state(user_id, validated_token, get_auth_state(user_id))
+
+    async def aget_user(self, validated_token):
+        """get_user для асинхронных view: состояние читается без перехода в поток"""
+        user_id = self.get_user_id(validated_token)
+        return self.user_from_state(user_id, validated_token, await aget_auth_state(user_id))
+
+    def get_user_id(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+        # simplejwt >= 5.4 кладет id строкой, а сравнения request.user с
+        # владельцем записи и ключи кэша ждут значение типа первичного ключа
+        try:
+            return get_user_model()._meta.pk.to_python(user_id)
+        except ValidationError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+    def user_from_state(self, user_id, validated_token, state):
+        if state is None:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+        token_generation, is_active, timezone, nutrition_summary_stale = state
+        if not is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        if not is_generation_valid(validated_token, token_generation):
+            raise AuthenticationFailed(_('Session has been revoked'), code='session_revoked')
+
+        User = get_user_model()
+        return User.from_db(
+            router.db_for_read(User), [User._meta.pk.attname, 'timezone', 'nutrition_summary_stale'],
+            [user_id, timezone, nutrition_summary_stale]
+        )
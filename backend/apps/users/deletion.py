@@ -0,0 +1,234 @@
+"""
+Массовые удаления данных пользователя и удаление аккаунта.
+
+Операция описывается шагами - (queryset, before_batch) для
+backend.deletion.delete_in_batches - и завершающим действием. Если строк
+не больше DELETION_SYNC_MAX_ROWS, операция выполняется сразу в одной
+транзакции. Иначе создается DeletionJob, а удаление короткими
+транзакциями по пачкам выполняет задание очереди users.run_deletion
+(apps/jobs); статус отдается по GET /api/auth/deletions/<id>/. Упавшее
+задание очередь повторяет, повтор продолжает с оставшихся строк.
+
+Задание удаляет только строки, которые были на момент запроса: в params
+DeletionJob записывается max_pk, и записи, созданные пока задание ждет
+или идет, остаются.
+"""
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+
+from apps.jobs.queue import enqueue
+from apps.nutrition import rollup
+from apps.nutrition.models import DailyNutritionSummary, Nutrition
+from apps.sync import tombstones
+from apps.sync.models import Tombstone
+from apps.workouts.models import Workout
+from backend.cache import bump_user_version
+from backend.dates import user_day_range
+from backend.deletion import delete_in_batches
+from .models import DeletionJob, Goal
+from .sessions import revoke_sessions
+
+logger = logging.getLogger(__name__)
+
+
+def _in_day(user, queryset, date):
+    start, end = user_day_range(user, parse_date(date))
+    return queryset.filter(created_at__gte=start, created_at__lt=end)
+
+
+def _existing(queryset, params):
+    """Строки, существовавшие на момент запроса (params['max_pk'] задания)"""
+    if 'max_pk' in params:
+        return queryset.filter(pk__lte=params['max_pk'])
+    return queryset
+
+
+def _record_cleared(user, kind, model, params):
+    tombstones.record_cleared(user, kind)
+    if 'max_pk' in params:
+        # Клиент очистит всю коллекцию, поэтому записи, созданные после
+        # запроса, должны прийти ему снова как измененные
+        model.objects.filter(user=user, pk__gt=params['max_pk']).update(updated_at=timezone.now())
+
+
+def workouts_plan(user, params):
+    """params: {} - все тренировки, {'date': 'YYYY-MM-DD'} - за локальные сутки"""
+    workouts = _existing(Workout.objects.filter(user=user), params)
+    if 'date' in params:
+        def before_batch(batch):
+            tombstones.record_queryset_deleted(user, 'workout', batch)
+        return [(_in_day(user, workouts, params['date']), before_batch)], None
+    return [(workouts, None)], lambda: _record_cleared(user, 'workout', Workout, params)
+
+
+def nutrition_plan(user, params):
+    """params: {} - все записи, {'date': ...} или {'meal_type': ...} - их часть"""
+    nutrition = _existing(Nutrition.objects.filter(user=user), params)
+    if 'date' in params:
+        nutrition = _in_day(user, nutrition, params['date'])
+    if 'meal_type' in params:
+        nutrition = nutrition.filter(meal_type=params['meal_type'])
+    partial = 'date' in params or 'meal_type' in params
+
+    def before_batch(batch):
+        # Сводка остается верной после каждой пачки, а не только в конце
+        rollup.queryset_removed(user, batch)
+        if partial:
+            tombstones.record_queryset_deleted(user, 'nutrition', batch)
+
+    return [(nutrition, before_batch)], None if partial else lambda: _record_cleared(
+        user, 'nutrition', Nutrition, params
+    )
+
+
+# Модели с данными пользователя, которые удаляются вместе с аккаунтом
+ACCOUNT_DATA_MODELS = (Workout, Nutrition, DailyNutritionSummary, Goal, Tombstone, OutstandingToken)
+
+
+def account_plan(user, params):
+    """Все данные пользователя, затем сам пользователь"""
+    steps = [(model.objects.filter(user=user), None) for model in ACCOUNT_DATA_MODELS]
+    return steps, user.delete
+
+
+PLANS = {
+    'workouts': workouts_plan,
+    'nutrition': nutrition_plan,
+    'account': account_plan,
+}
+
+# Модель операции, новые строки которой фоновое задание не удаляет. Аккаунт
+# отключается до постановки задания, новых строк у него не появится
+BOUNDED_MODELS = {
+    'workouts': Workout,
+    'nutrition': Nutrition,
+}
+
+
+def _count_up_to(steps, limit):
+    """Число строк во всех шагах, но не больше limit + 1: точное число не нужно"""
+    rows = 0
+    for queryset, _ in steps:
+        rows += queryset[:limit + 1 - rows].count()
+        if rows > limit:
+            break
+    return rows
+
+
+def _run_at_once(steps, finish):
+    # Строк не больше DELETION_SYNC_MAX_ROWS: одна транзакция без выборки id,
+    # первым в ней идет запись (см. backend/deletion.py)
+    with transaction.atomic():
+        for queryset, before_batch in steps:
+            if before_batch is not None:
+                before_batch(queryset)
+            queryset.delete()
+        if finish is not None:
+            finish()
+
+
+def _run_in_batches(steps, finish, progress):
+    for queryset, before_batch in steps:
+        delete_in_batches(queryset, before_batch=before_batch, progress=progress)
+    if finish is not None:
+        with transaction.atomic():
+            finish()
+
+
+def delete_user_data(user, operation, params=None):
+    """
+    Удалить данные пользователя: сразу или в фоне.
+
+    Возвращает None, если данные уже удалены, или созданный DeletionJob.
+    """
+    params = params or {}
+    steps, finish = PLANS[operation](user, params)
+    limit = getattr(settings, 'DELETION_SYNC_MAX_ROWS', 1000)
+    if _count_up_to(steps, limit) <= limit:
+        _run_at_once(steps, finish)
+        return None
+
+    model = BOUNDED_MODELS.get(operation)
+    if model is not None:
+        params = {**params, 'max_pk': model.objects.filter(user=user).aggregate(max_pk=Max('pk'))['max_pk']}
+    # Задание очереди коммитится вместе с DeletionJob: воркер не увидит одно без
+    # другого, а при ошибке постановки не останется DeletionJob, который никто не выполнит
+    with transaction.atomic():
+        job = DeletionJob.objects.create(user=user, operation=operation, params=params)
+        enqueue('users.run_deletion', {'job_id': str(job.pk)}, user=user)
+    logger.info('Deletion job queued', extra={'user_id': user.pk, 'job_id': str(job.pk), 'operation': operation})
+    return job
+
+
+def delete_account(user):
+    """
+    Отключить вход сразу, а данные удалить через delete_user_data.
+
+    Одна транзакция: если удаление не удалось ни выполнить, ни поставить в
+    очередь, аккаунт остается активным, а не заблокированным с данными.
+    """
+    with transaction.atomic():
+        type(user).objects.filter(pk=user.pk).update(is_active=False)
+        revoke_sessions(user)
+        return delete_user_data(user, 'account')
+
+
+def run_job(job_id):
+    """
+    Выполнить задание; для уже завершенного ничего не делает.
+
+    Ошибка передается очереди, которая повторит задание; failed ставит
+    job_failed, когда попытки исчерпаны.
+    """
+    job = DeletionJob.objects.select_related('user').get(pk=job_id)
+    if job.status == 'done':
+        return
+    jobs = DeletionJob.objects.filter(pk=job_id)
+    jobs.update(status='running', updated_at=timezone.now())
+    user = job.user
+
+    def progress(deleted):
+        jobs.update(deleted=F('deleted') + deleted, updated_at=timezone.now())
+        bump_user_version(user.pk)
+
+    try:
+        # Пользователя уже нет - аккаунт удален предыдущим запуском
+        if user is not None:
+            steps, finish = PLANS[job.operation](user, job.params)
+            _run_in_batches(steps, finish, progress)
+    except Exception as exc:
+        jobs.update(status='pending', error=str(exc), updated_at=timezone.now())
+        raise
+    if user is not None:
+        bump_user_version(user.pk)
+    jobs.update(status='done', error='', finished_at=timezone.now())
+
+
+def job_failed(queued_job):
+    """Очередь больше не повторит задание users.run_deletion"""
+    DeletionJob.objects.filter(pk=queued_job.payload['job_id']).exclude(status='done').update(
+        status='failed', updated_at=timezone.now()
+    )
+
+
+def deletion_response(request, job):
+    """204 - удалено сразу, 202 - удаление идет в фоне, в теле ссылка на статус"""
+    if job is None:
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    return Response(
+        {
+            'id': str(job.pk),
+            'status': job.status,
+            'status_url': request.build_absolute_uri(reverse('deletion-job', args=[job.pk])),
+        },
+        status=status.HTTP_202_ACCEPTED
+    )
@@ -1,10 +1,16 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import GoalViewSet
+from .views import GoalViewSet, AsyncGoalListView
 
 router = DefaultRouter()
 router.register(r'', GoalViewSet, basename='goal')
 
 urlpatterns = [
     path('', include(router.urls)),
-] 
\ No newline at end of file
+]
+
+if settings.ASYNC_READ_VIEWS:
+    urlpatterns.insert(0, path('', AsyncGoalListView.as_view(
+        sync_view=GoalViewSet.as_view({'get': 'list', 'post': 'create'}, basename='goal', detail=False)
+    ), name='goal-list'))
@@ -0,0 +1,17 @@
+"""Типы записей для импорта истории: команда import_history и задание users.import_history"""
+from apps.nutrition import rollup
+from apps.nutrition.models import Nutrition
+from apps.nutrition.serializers import NutritionSerializer
+from apps.workouts.models import Workout
+from apps.workouts.serializers import WorkoutSerializer
+
+
+def nutrition_added(user, ids):
+    rollup.queryset_added(user, Nutrition.objects.filter(user=user, id__in=ids))
+
+
+# Тип записей: модель, сериализатор и хук после вставки пачки (как after_bulk_create у viewset)
+IMPORTERS = {
+    'workouts': (Workout, WorkoutSerializer, None),
+    'nutrition': (Nutrition, NutritionSerializer, nutrition_added),
+}
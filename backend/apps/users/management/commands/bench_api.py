@@ -0,0 +1,305 @@
+import io
+import json
+import logging
+import sys
+import threading
+import time
+from contextlib import ExitStack
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils import timezone
+
+from apps.nutrition import rollup
+from apps.nutrition.models import Nutrition
+from apps.users.deletion import ACCOUNT_DATA_MODELS
+from apps.users.models import User, Goal
+from apps.users.sessions import start_session
+from apps.workouts.models import Workout
+from backend.deletion import delete_in_batches
+from .bench_asgi import percentile
+from .bench_serializers import make_goal, make_nutrition, make_workout
+
+BENCH_PREFIX = 'bench-api-'
+BENCH_PASSWORD = 'bench-api-password'
+
+
+class BenchUser:
+    """Пользователь нагрузочного теста и его текущие токены"""
+
+    def __init__(self, user, users):
+        self.user = user
+        # Всего пользователей в тесте
+        self.users = users
+        self.access = None
+        self.refresh = None
+        # Запросы, меняющие токены пользователя, идут по очереди
+        self.lock = threading.Lock()
+
+    def headers(self):
+        return {'Authorization': f'Bearer {self.access}'}
+
+
+def login(bench_user, number, today):
+    return 'POST', '/api/auth/login/', {'username': bench_user.user.username, 'password': BENCH_PASSWORD}, {}
+
+
+def token_refresh(bench_user, number, today):
+    return 'POST', '/api/token/refresh/', {'refresh': bench_user.refresh}, {}
+
+
+def list_workouts(bench_user, number, today):
+    return 'GET', '/api/workouts/', None, bench_user.headers()
+
+
+def list_nutrition(bench_user, number, today):
+    return 'GET', '/api/nutrition/', None, bench_user.headers()
+
+
+def list_goals(bench_user, number, today):
+    return 'GET', '/api/goals/', None, bench_user.headers()
+
+
+def create_workout(bench_user, number, today):
+    body = {'name': f'Run {number}', 'description': 'Пробежка в парке', 'duration': 40, 'calories_burned': 420}
+    return 'POST', '/api/workouts/', body, bench_user.headers()
+
+
+def create_nutrition(bench_user, number, today):
+    body = {'meal_type': 'lunch', 'calories': 650, 'protein': 35.5, 'carbohydrates': 70.0, 'fats': 20.25}
+    return 'POST', '/api/nutrition/', body, bench_user.headers()
+
+
+def today_stats(bench_user, number, today):
+    return 'GET', '/api/nutrition/today_stats/', None, bench_user.headers()
+
+
+def dashboard(bench_user, number, today):
+    return 'GET', '/api/dashboard/', None, bench_user.headers()
+
+
+def _past_day(number, users, today):
+    # Каждый запрос пользователя удаляет следующий день истории
+    return (today - timedelta(days=number // users)).isoformat()
+
+
+def delete_workouts_by_date(bench_user, number, today):
+    day = _past_day(number, bench_user.users, today)
+    return 'DELETE', f'/api/workouts/delete_by_date/?date={day}', None, bench_user.headers()
+
+
+def delete_nutrition_by_date(bench_user, number, today):
+    day = _past_day(number, bench_user.users, today)
+    return 'DELETE', f'/api/nutrition/delete_by_date/?date={day}', None, bench_user.headers()
+
+
+# Сценарий: функция запроса и нужна ли очередность запросов одного пользователя.
+# Удаления идут последними: они стирают историю, которую читают остальные
+SCENARIOS = {
+    'login': (login, False),
+    'token-refresh': (token_refresh, True),
+    'list-workouts': (list_workouts, False),
+    'list-nutrition': (list_nutrition, False),
+    'list-goals': (list_goals, False),
+    'today-stats': (today_stats, False),
+    'dashboard': (dashboard, False),
+    'create-workout': (create_workout, False),
+    'create-nutrition': (create_nutrition, False),
+    'delete-workouts-by-date': (delete_workouts_by_date, False),
+    'delete-nutrition-by-date': (delete_nutrition_by_date, False),
+}
+
+
+def call_wsgi(application, method, path, headers, data=None):
+    """Запрос к WSGI-приложению в текущем потоке: (статус, тело ответа)"""
+    path, _, query = path.partition('?')
+    body = json.dumps(data).encode() if data is not None else b''
+    environ = {
+        'REQUEST_METHOD': method,
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(body)),
+        'HTTP_ACCEPT': 'application/json',
+        'REMOTE_ADDR': '127.0.0.1',
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in headers.items():
+        environ['HTTP_' + name.upper().replace('-', '_')] = value
+    statuses = []
+    response = application(environ, lambda status, response_headers, exc_info=None: statuses.append(status))
+    try:
+        content = b''.join(response)
+    finally:
+        response.close()
+    return int(statuses[0].split()[0]), content
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный тест REST API: создать пользователей с историей тренировок, питания '
+        'и целей и прогнать реальные маршруты с заданной параллельностью. Для каждого '
+        'сценария выводятся p50/p95/p99, запросы в секунду и SQL-запросы на запрос. '
+        'Команда пишет в базу DATABASE_URL и удаляет пользователей bench-api-*, поэтому '
+        'запускается только на отдельной базе с --yes-i-know. Для CI: '
+        '--yes-i-know --json --max-p95 <мс> - ненулевой код выхода при регрессии'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20, help='Пользователей')
+        parser.add_argument('--workouts', type=int, default=300, help='Тренировок у пользователя')
+        parser.add_argument('--nutrition', type=int, default=600, help='Записей о питании у пользователя')
+        parser.add_argument('--goals', type=int, default=10, help='Целей у пользователя')
+        parser.add_argument('--days', type=int, default=90, help='На сколько дней назад растянуть историю')
+        parser.add_argument('--requests', type=int, default=200, help='Запросов на сценарий')
+        parser.add_argument('--concurrency', type=int, default=8, help='Одновременных клиентов')
+        parser.add_argument('--scenario', action='append', dest='scenarios', choices=sorted(SCENARIOS),
+                            help='Сценарий, можно несколько (по умолчанию все)')
+        parser.add_argument('--json', action='store_true', help='Вывести результаты одной JSON-строкой (для CI)')
+        parser.add_argument('--max-p95', type=float,
+                            help='Завершиться с ошибкой, если p95 какого-либо сценария больше стольких мс')
+        parser.add_argument('--yes-i-know', action='store_true',
+                            help='Подтвердить, что база отдельная: команда создает и удаляет в ней данные')
+
+    def handle(self, *args, **options):
+        if not options['yes_i_know']:
+            raise CommandError(
+                f"bench_api создает и удаляет пользователей {BENCH_PREFIX}* в базе "
+                f"{connections[DEFAULT_DB_ALIAS].settings_dict['NAME']}. Запускайте на отдельной "
+                f"базе с --yes-i-know"
+            )
+        # Логи запросов в консоль измеряли бы скорость терминала
+        logging.disable(logging.INFO)
+        scenarios = [name for name in SCENARIOS if name in (options['scenarios'] or SCENARIOS)]
+        bench_users = self.seed(options)
+        try:
+            results = {name: self.run_scenario(name, bench_users, options) for name in scenarios}
+        finally:
+            self.cleanup()
+
+        if options['json']:
+            self.stdout.write(json.dumps(results))
+        else:
+            self.stdout.write(
+                f"{options['users']} пользователей, {options['requests']} запросов на сценарий, "
+                f"{options['concurrency']} клиентов"
+            )
+            self.stdout.write(
+                f"{'scenario':<26} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+                f"{'queries':>8} {'errors':>7}"
+            )
+            for name, result in results.items():
+                self.stdout.write(
+                    f"{name:<26} {result['rps']:>8,.0f} {result['p50']:>8.1f} {result['p95']:>8.1f} "
+                    f"{result['p99']:>8.1f} {result['queries']:>8.1f} {result['errors']:>7}"
+                )
+
+        if options['max_p95'] is not None:
+            slow = [name for name, result in results.items() if result['p95'] > options['max_p95']]
+            if slow:
+                raise CommandError(f"p95 больше {options['max_p95']} мс: {', '.join(slow)}")
+
+    def cleanup(self):
+        """Удалить пользователей теста и их историю короткими транзакциями по пачкам"""
+        users = User.objects.filter(username__startswith=BENCH_PREFIX)
+        for model in ACCOUNT_DATA_MODELS:
+            delete_in_batches(model.objects.filter(user__in=users))
+        delete_in_batches(users)
+
+    def seed(self, options):
+        # Остатки прерванного запуска
+        self.cleanup()
+        # Хэш пароля считается один раз: PBKDF2 на каждого пользователя занял бы минуты
+        password = make_password(BENCH_PASSWORD)
+        users = User.objects.bulk_create(
+            User(username=f'{BENCH_PREFIX}{number}', email=f'{BENCH_PREFIX}{number}@example.com', password=password)
+            for number in range(options['users'])
+        )
+        if users[0].pk is None:
+            users = list(User.objects.filter(username__startswith=BENCH_PREFIX).order_by('id'))
+
+        now = timezone.now()
+        for model, factory, count in (
+            (Workout, make_workout, options['workouts']),
+            (Nutrition, make_nutrition, options['nutrition']),
+            (Goal, make_goal, options['goals']),
+        ):
+            for user in users:
+                rows = model.objects.bulk_create((factory(user, i) for i in range(count)), batch_size=2000)
+                # created_at ставится при вставке (auto_now_add) - растягиваем историю вторым проходом
+                for i, row in enumerate(rows):
+                    row.created_at = now - timedelta(days=i * options['days'] // max(count, 1), minutes=i)
+                model.objects.bulk_update(rows, ['created_at'], batch_size=500)
+        for user in users:
+            rollup.rebuild(user)
+
+        return [BenchUser(user, len(users)) for user in users]
+
+    def run_scenario(self, name, bench_users, options):
+        # Новые сессии перед каждым сценарием: вход и обновление токенов отзывают прежние
+        for bench_user in bench_users:
+            refresh = start_session(bench_user.user)
+            bench_user.refresh, bench_user.access = str(refresh), str(refresh.access_token)
+
+        make_request, serial = SCENARIOS[name]
+        application = WSGIHandler()
+        today = timezone.localdate()
+
+        def execute(number):
+            bench_user = bench_users[number % len(bench_users)]
+            queries = []
+
+            def count_query(execute_sql, sql, params, many, context):
+                queries.append(sql)
+                return execute_sql(sql, params, many, context)
+
+            with ExitStack() as stack:
+                if serial:
+                    stack.enter_context(bench_user.lock)
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(count_query))
+                method, path, data, headers = make_request(bench_user, number, today)
+                started = time.perf_counter()
+                status, content = call_wsgi(application, method, path, headers, data)
+                elapsed = time.perf_counter() - started
+                if name == 'token-refresh' and status == 200:
+                    bench_user.refresh = json.loads(content)['refresh']
+            return elapsed, status, len(queries)
+
+        remaining = iter(range(options['requests']))
+        outcomes = []
+
+        def client():
+            for number in remaining:
+                outcomes.append(execute(number))
+            # Соединения клиента не должны пережить удаление данных теста
+            connections.close_all()
+
+        threads = [threading.Thread(target=client) for _ in range(options['concurrency'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        latencies = [latency for latency, _, _ in outcomes]
+        return {
+            'rps': len(outcomes) / elapsed,
+            'p50': percentile(latencies, 0.5) * 1000,
+            'p95': percentile(latencies, 0.95) * 1000,
+            'p99': percentile(latencies, 0.99) * 1000,
+            'queries': sum(queries for _, _, queries in outcomes) / len(outcomes),
+            'errors': sum(status >= 400 for _, status, _ in outcomes),
+        }
@@ -0,0 +1,219 @@
+import asyncio
+import io
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.nutrition.models import Nutrition
+from apps.users.models import User, Goal
+from apps.users.sessions import start_session
+from apps.workouts.models import Workout
+from .bench_serializers import make_goal, make_nutrition, make_workout
+
+DEFAULT_PATHS = [
+    '/api/workouts/',
+    '/api/goals/',
+    '/api/nutrition/today_stats/',
+    '/api/auth/profile/',
+    '/api/dashboard/',
+]
+
+# Сервер, значение DJANGO_ASYNC_READS для него
+SERVERS = {
+    'wsgi': '0',
+    'asgi-sync': '0',
+    'asgi': '1',
+}
+
+BENCH_USERNAME = 'bench-asgi'
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def call_wsgi(application, path, headers):
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': path,
+        'QUERY_STRING': '',
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in headers.items():
+        environ['HTTP_' + name.upper().replace('-', '_')] = value
+    statuses = []
+    body = application(environ, lambda status, response_headers, exc_info=None: statuses.append(status))
+    try:
+        for _ in body:
+            pass
+    finally:
+        body.close()
+    return int(statuses[0].split()[0])
+
+
+async def call_asgi(application, path, headers):
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': b'',
+        'root_path': '',
+        'headers': [(b'host', b'localhost')] + [
+            (name.lower().encode(), value.encode()) for name, value in headers.items()
+        ],
+        'client': ('127.0.0.1', 0),
+        'server': ('localhost', 80),
+    }
+    received = False
+    statuses = []
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        # Клиент не отключается: Django отменит ожидание после ответа
+        await asyncio.Future()
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            statuses.append(message['status'])
+
+    await application(scope, receive, send)
+    return statuses[0]
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнить пропускную способность WSGI, ASGI с синхронными view и ASGI '
+        'с async-view на частых GET-запросах при большом числе клиентов'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='Запросов на каждый сервер')
+        parser.add_argument('--concurrency', type=int, default=100, help='Одновременных клиентов')
+        parser.add_argument('--wsgi-threads', type=int, default=8,
+                            help='Потоков WSGI-сервера (как gthread-воркер gunicorn)')
+        parser.add_argument('--rows', type=int, default=200, help='Записей каждого типа у пользователя')
+        parser.add_argument('--path', action='append', dest='paths',
+                            help=f'Путь для запросов, можно несколько (по умолчанию {", ".join(DEFAULT_PATHS)})')
+        parser.add_argument('--server', choices=sorted(SERVERS),
+                            help='Прогнать только этот сервер в текущем процессе (используется внутри)')
+
+    def handle(self, *args, **options):
+        options['paths'] = options['paths'] or DEFAULT_PATHS
+        if options['server']:
+            self.stdout.write(json.dumps(self.run_server(options)))
+            return
+
+        # Данные коммитятся: запросы WSGI идут из других потоков и соединений
+        User.objects.filter(username=BENCH_USERNAME).delete()
+        user = User.objects.create_user(BENCH_USERNAME, f'{BENCH_USERNAME}@example.com')
+        try:
+            for model, factory in ((Workout, make_workout), (Nutrition, make_nutrition), (Goal, make_goal)):
+                model.objects.bulk_create((factory(user, i) for i in range(options['rows'])), batch_size=2000)
+
+            self.stdout.write(
+                f"{options['requests']} запросов, {options['concurrency']} клиентов, "
+                f"WSGI: {options['wsgi_threads']} потоков"
+            )
+            self.stdout.write(f"{'server':<10} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+            for server in SERVERS:
+                result = self.run_subprocess(server, options)
+                self.stdout.write(
+                    f"{server:<10} {result['rps']:>9,.0f} {result['p50']:>8.1f} "
+                    f"{result['p99']:>8.1f} {result['errors']:>7}"
+                )
+        finally:
+            user.delete()
+
+    def run_subprocess(self, server, options):
+        # Маршруты async-view выбираются при импорте urls, поэтому каждый сервер - отдельный процесс
+        command = [
+            sys.executable, str(settings.BASE_DIR / 'manage.py'), 'bench_asgi', '--server', server,
+            '--requests', str(options['requests']), '--concurrency', str(options['concurrency']),
+            '--wsgi-threads', str(options['wsgi_threads']),
+        ]
+        for path in options['paths']:
+            command += ['--path', path]
+        env = dict(os.environ, DJANGO_ASYNC_READS=SERVERS[server])
+        completed = subprocess.run(command, env=env, capture_output=True, text=True)
+        if completed.returncode:
+            raise CommandError(f'{server}: {completed.stderr.strip()}')
+        return json.loads(completed.stdout.strip().splitlines()[-1])
+
+    def run_server(self, options):
+        # Логи запросов в консоль измеряли бы скорость терминала
+        logging.disable(logging.INFO)
+        try:
+            user = User.objects.get(username=BENCH_USERNAME)
+        except User.DoesNotExist:
+            raise CommandError('Запускайте без --server: данные создает основной процесс')
+        headers = {
+            'Authorization': f'Bearer {start_session(user).access_token}',
+            'Accept': 'application/json',
+        }
+        return asyncio.run(self.drive(options, headers))
+
+    async def drive(self, options, headers):
+        server, paths = options['server'], options['paths']
+        if server == 'wsgi':
+            application = WSGIHandler()
+            executor = ThreadPoolExecutor(max_workers=options['wsgi_threads'])
+            loop = asyncio.get_running_loop()
+
+            def call(path):
+                return loop.run_in_executor(executor, call_wsgi, application, path, headers)
+        else:
+            application = ASGIHandler()
+
+            def call(path):
+                return call_asgi(application, path, headers)
+
+        # Прогрев: кэш ответов, соединения, импорт
+        for path in paths:
+            await call(path)
+
+        remaining = iter(range(options['requests']))
+        latencies = []
+        errors = 0
+
+        async def client():
+            nonlocal errors
+            for number in remaining:
+                started = time.perf_counter()
+                status = await call(paths[number % len(paths)])
+                latencies.append(time.perf_counter() - started)
+                errors += status != 200
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(options['concurrency'])))
+        elapsed = time.perf_counter() - started
+        return {
+            'rps': len(latencies) / elapsed,
+            'p50': percentile(latencies, 0.5) * 1000,
+            'p99': percentile(latencies, 0.99) * 1000,
+            'errors': errors,
+        }
@@ -0,0 +1,117 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, close_old_connections, connection, transaction
+
+from apps.nutrition import rollup
+from apps.users.models import User
+from .bench_asgi import percentile
+from .bench_serializers import make_nutrition
+
+# Профиль и переменные окружения для него
+PROFILES = {
+    # Как было раньше: журнал отката, synchronous=FULL, соединение на каждый запрос
+    'sqlite-default': {'SQLITE_PRAGMAS': 'off', 'DATABASE_CONN_MAX_AGE': '0'},
+    'sqlite-tuned': {},
+    'postgres': {},
+}
+
+BENCH_USERNAME = 'bench-db-writes'
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнить скорость параллельной записи (запись о питании + сводка за день '
+        'в одной транзакции) для SQLite без настройки, SQLite с WAL и PostgreSQL'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=16, help='Параллельных потоков записи')
+        parser.add_argument('--writes', type=int, default=100, help='Транзакций на поток')
+        parser.add_argument('--postgres-url', help='DATABASE_URL для профиля postgres (без него профиль пропускается)')
+        parser.add_argument('--profile', choices=sorted(PROFILES),
+                            help='Прогнать только этот профиль в текущем процессе (используется внутри)')
+
+    def handle(self, *args, **options):
+        if options['profile']:
+            self.stdout.write(json.dumps(self.run_profile(options)))
+            return
+
+        self.stdout.write(f"{options['writers']} потоков x {options['writes']} транзакций")
+        self.stdout.write(f"{'profile':<15} {'writes/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+        for profile, env in PROFILES.items():
+            if profile == 'postgres':
+                if not options['postgres_url']:
+                    continue
+                env = {'DATABASE_URL': options['postgres_url']}
+            elif os.environ.get('DATABASE_URL', 'sqlite').split(':')[0] != 'sqlite':
+                continue
+            result = self.run_subprocess(profile, env, options)
+            self.stdout.write(
+                f"{profile:<15} {result['wps']:>9,.0f} {result['p50']:>8.1f} "
+                f"{result['p99']:>8.1f} {result['errors']:>7}"
+            )
+
+    def run_subprocess(self, profile, env, options):
+        # Настройки БД читаются при запуске, поэтому каждый профиль - отдельный процесс
+        command = [
+            sys.executable, str(settings.BASE_DIR / 'manage.py'), 'bench_db_writes', '--profile', profile,
+            '--writers', str(options['writers']), '--writes', str(options['writes']),
+        ]
+        completed = subprocess.run(command, env=dict(os.environ, **env), capture_output=True, text=True)
+        if completed.returncode:
+            raise CommandError(f'{profile}: {completed.stderr.strip()}')
+        return json.loads(completed.stdout.strip().splitlines()[-1])
+
+    def run_profile(self, options):
+        if connection.vendor == 'sqlite' and not settings.SQLITE_PRAGMAS:
+            # journal_mode хранится в самом файле БД - возвращаем режим по умолчанию
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode = DELETE')
+        User.objects.filter(username=BENCH_USERNAME).delete()
+        user = User.objects.create_user(BENCH_USERNAME, f'{BENCH_USERNAME}@example.com')
+        connection.close()
+
+        latencies = []
+        errors = []
+        lock = threading.Lock()
+
+        def writer(number):
+            for i in range(options['writes']):
+                started = time.perf_counter()
+                try:
+                    with transaction.atomic():
+                        instance = make_nutrition(user, number * options['writes'] + i)
+                        instance.save()
+                        rollup.record_added(user, instance)
+                except OperationalError:
+                    with lock:
+                        errors.append(1)
+                else:
+                    with lock:
+                        latencies.append(time.perf_counter() - started)
+                # Как request_finished: закрыть соединение, если CONN_MAX_AGE истек
+                close_old_connections()
+            connection.close()
+
+        threads = [threading.Thread(target=writer, args=(number,)) for number in range(options['writers'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        user.delete()
+        return {
+            'wps': len(latencies) / elapsed,
+            'p50': percentile(latencies, 0.5) * 1000 if latencies else 0,
+            'p99': percentile(latencies, 0.99) * 1000 if latencies else 0,
+            'errors': len(errors),
+        }
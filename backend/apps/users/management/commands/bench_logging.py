@@ -0,0 +1,82 @@
+import logging
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from django.test.utils import override_settings
+
+from backend.logs import QueueJSONHandler, SampledLogger
+
+STATS = {'total_calories': 1850, 'total_proteins': 95.5, 'total_fats': 60.2, 'total_carbs': 210.0}
+
+
+class BenchUser:
+    pk = 42
+    username = 'bench-logging'
+
+
+def eager_events(logger, user):
+    # Как было: f-строки собираются на каждый вызов, даже если запись отброшена
+    logger.info(f"Getting goals for user {user.username}")
+    logger.info(f"Getting profile for user {user.username}")
+    logger.info(f"Today's nutrition stats for user {user.username}: {STATS}")
+
+
+def structured_events(logger, user):
+    logger.info('Goals requested', extra={'user_id': user.pk})
+    logger.info('Profile requested', extra={'user_id': user.pk})
+    logger.info('Today nutrition stats', extra={'user_id': user.pk, 'stats': STATS})
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнить стоимость логирования на запрос: f-строки и синхронный StreamHandler '
+        'против структурных логов с выборкой и записью JSON через очередь'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20000, help='Сколько раз повторить события запроса')
+        parser.add_argument('--sample-rate', type=float, default=0.01, help='Доля событий запроса в логе')
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{options['requests']} запросов, 3 события на запрос (GET целей, профиля, статистики питания)"
+        )
+        self.stdout.write(f"{'setup':<28} {'us/request':>11} {'lines':>7}")
+        with tempfile.TemporaryFile('w+') as stream:
+            setups = [
+                ('f-string + StreamHandler', eager_events, False, False),
+                ('structured + StreamHandler', structured_events, False, False),
+                ('sampled + StreamHandler', structured_events, True, False),
+                ('structured + queue JSON', structured_events, False, True),
+                ('sampled + queue JSON', structured_events, True, True),
+            ]
+            for name, events, sampled, queued in setups:
+                rate = options['sample_rate'] if sampled else 1
+                with override_settings(LOG_SAMPLE_RATE=rate):
+                    per_request, lines = self.run(stream, events, sampled, queued, options['requests'])
+                self.stdout.write(f'{name:<28} {per_request:>11.1f} {lines:>7}')
+
+    def run(self, stream, events, sampled, queued, requests):
+        stream.seek(0)
+        stream.truncate()
+        handler = QueueJSONHandler(stream, maxsize=0) if queued else logging.StreamHandler(stream)
+        logger = logging.getLogger('bench.logging')
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        logger.addHandler(handler)
+        user = BenchUser()
+        target = SampledLogger(logger) if sampled else logger
+        try:
+            started = time.perf_counter()
+            for _ in range(requests):
+                events(target, user)
+            # Время потока запроса; фоновая запись в файл в него не входит
+            elapsed = time.perf_counter() - started
+        finally:
+            logger.removeHandler(handler)
+            handler.close()
+        stream.flush()
+        stream.seek(0)
+        return elapsed / requests * 1e6, sum(1 for _ in stream)
@@ -0,0 +1,86 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from apps.nutrition.models import Nutrition
+from apps.nutrition.serializers import NutritionSerializer
+from apps.users.models import User, Goal
+from apps.users.serializers import GoalSerializer
+from apps.workouts.models import Workout
+from apps.workouts.serializers import WorkoutSerializer
+from backend.fastpath import get_plan, represent
+
+
+def make_workout(user, i):
+    return Workout(user=user, name=f'Workout {i}', description='Интервальная тренировка ' * 4,
+                   duration=30 + i % 60, calories_burned=200 + i % 500)
+
+
+def make_nutrition(user, i):
+    return Nutrition(user=user, meal_type=('breakfast', 'lunch', 'dinner', 'snack')[i % 4],
+                     calories=300 + i % 700, protein=20.5, carbohydrates=60.25, fats=15.125)
+
+
+def make_goal(user, i):
+    return Goal(user=user, name=f'Goal {i}', goal_type='weight', target_weight=70.5,
+                target_date=timezone.now(), progress=i % 100, description='Описание цели')
+
+
+MODELS = {
+    'workout': (Workout, WorkoutSerializer, make_workout),
+    'nutrition': (Nutrition, NutritionSerializer, make_nutrition),
+    'goal': (Goal, GoalSerializer, make_goal),
+}
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Сравнить скорость ModelSerializer и быстрого пути (rows/sec) для list-ответов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000])
+        parser.add_argument('--model', choices=sorted(MODELS), default='workout')
+        parser.add_argument('--repeat', type=int, default=3, help='Лучший результат из N прогонов')
+
+    def handle(self, *args, **options):
+        model, serializer_class, factory = MODELS[options['model']]
+        # Все тестовые данные создаются в транзакции и откатываются
+        try:
+            with transaction.atomic():
+                user = User.objects.create_user('bench-serializers', 'bench-serializers@example.com')
+                created = 0
+                self.stdout.write(f"{'rows':>8} {'serializer rows/s':>18} {'fast path rows/s':>17} {'speedup':>8}")
+                for rows in sorted(options['rows']):
+                    model.objects.bulk_create(
+                        (factory(user, i) for i in range(created, rows)), batch_size=2000
+                    )
+                    created = rows
+                    queryset = model.objects.filter(user=user)
+                    slow = self.measure(options['repeat'], lambda: self.serializer_path(serializer_class, queryset))
+                    fast = self.measure(options['repeat'], lambda: self.fast_path(serializer_class, queryset))
+                    self.stdout.write(f'{rows:>8} {rows / slow:>18,.0f} {rows / fast:>17,.0f} {slow / fast:>7.1f}x')
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def measure(self, repeat, func):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    def serializer_path(self, serializer_class, queryset):
+        return JSONRenderer().render(serializer_class(queryset, many=True).data)
+
+    def fast_path(self, serializer_class, queryset):
+        names, sources, converters = get_plan(serializer_class())
+        return JSONRenderer().render(represent(queryset.values_list(*sources), names, converters))
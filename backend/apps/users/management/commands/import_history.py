@@ -0,0 +1,62 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.users.imports import IMPORTERS
+from apps.users.models import User
+from backend.cache import bump_user_version
+from backend.imports import IMPORT_FORMATS, ImportFileError, ImportReport, guess_format, import_rows, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        'Импортировать историю тренировок или питания пользователя из файла CSV или NDJSON, '
+        'например выгрузки другого трекера. Файл читается построчно, записи вставляются пачками'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='Пользователь, которому принадлежат записи')
+        parser.add_argument('kind', choices=sorted(IMPORTERS), help='Тип записей')
+        parser.add_argument('path', help='Файл .csv, .ndjson или .jsonl')
+        parser.add_argument('--input', choices=IMPORT_FORMATS, help='Формат файла (по умолчанию - по расширению)')
+        parser.add_argument('--batch-size', type=int, default=500, help='Строк в пачке и транзакции')
+        parser.add_argument('--max-errors', type=int, default=100, help='Сколько ошибочных строк вывести')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['username']} does not exist")
+        input_format = options['input'] or guess_format(options['path'])
+        if input_format is None:
+            raise CommandError('Cannot tell the file format from its name, use --input')
+        model, serializer_class, after_batch = IMPORTERS[options['kind']]
+
+        def progress(report):
+            self.stdout.write(
+                f'{report.rows} row(s) read: {report.created} created, {report.skipped} skipped, '
+                f'{report.failed} invalid'
+            )
+
+        report = ImportReport(options['max_errors'])
+        try:
+            with open(options['path'], 'rb') as file:
+                import_rows(
+                    user, model, serializer_class(), read_rows(file, input_format), options['batch_size'],
+                    after_batch=after_batch and (lambda ids: after_batch(user, ids)),
+                    progress=progress, report=report,
+                )
+        except OSError as exc:
+            raise CommandError(str(exc))
+        except ImportFileError as exc:
+            raise CommandError(f'{exc} ({report.created} row(s) imported before it)')
+        finally:
+            if report.created:
+                bump_user_version(user.id)
+
+        for error in report.errors:
+            self.stderr.write(f"line {error['line']}: {json.dumps(error['errors'], ensure_ascii=False)}")
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {report.created} of {report.rows} row(s), '
+            f'{report.skipped} already present, {report.failed} invalid'
+        ))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+
+from backend.deletion import delete_in_batches
+
+
+class Command(BaseCommand):
+    help = 'Удалить просроченные OutstandingToken и BlacklistedToken небольшими пакетами'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        # Короткая транзакция на пакет; BlacklistedToken удаляется каскадом
+        total = delete_in_batches(
+            OutstandingToken.objects.filter(expires_at__lt=timezone.now()), size=options['batch_size']
+        )
+        self.stdout.write(self.style.SUCCESS(f'Pruned {total} expired token(s)'))
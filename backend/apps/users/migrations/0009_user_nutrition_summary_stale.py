@@ -0,0 +1,18 @@
+# Generated by Django 5.0.2 on 2026-10-18 16:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_deletionjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='nutrition_summary_stale',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -1,3 +1,5 @@
+import uuid
+
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 
@@ -16,12 +18,25 @@ class User(AbstractUser):
     weight = models.FloatField(null=True, blank=True)  # in kg
     age = models.IntegerField(null=True, blank=True)
     gender = models.CharField(max_length=1, choices=GENDER_CHOICES, blank=True)
+    timezone = models.CharField(max_length=64, default='UTC')  # IANA, например Europe/Moscow
+    token_generation = models.PositiveIntegerField(default=0)  # см. apps/users/sessions.py
+    # Сводка по питанию пересчитывается в фоне после смены timezone (apps/nutrition/rollup.py)
+    nutrition_summary_stale = models.BooleanField(default=False)
 
     def __str__(self):
         return self.username
 
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        # Пользователь из токена загружается только с id; обращение к любому
+        # отложенному полю подгружает сразу все, а не по запросу на поле
+        deferred = self.get_deferred_fields()
+        if fields is not None and deferred and set(fields) <= deferred:
+            fields = list(deferred)
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+
 class Goal(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='goals')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='goals',
+                             db_index=False)  # покрывается индексом (user, achieved)
     goal_type = models.CharField(max_length=50)
     target_weight = models.FloatField()
     target_date = models.DateTimeField()
@@ -32,5 +47,37 @@ class Goal(models.Model):
     name = models.CharField(max_length=255)
     description = models.TextField(blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'achieved'], name='goal_user_achieved_idx'),
+            models.Index(fields=['user', 'updated_at'], name='goal_user_updated_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.goal_type}"
+
+class DeletionJob(models.Model):
+    """Фоновое удаление данных пользователя пачками (см. apps/users/deletion.py)"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    # Случайный id: статус удаления аккаунта запрашивается уже без токена
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    # SET_NULL: задание удаления аккаунта переживает самого пользователя
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='deletion_jobs')
+    operation = models.CharField(max_length=20)
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    deleted = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Обновляется после каждой пачки: по нему видно зависшее задание
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
     def __str__(self):
-        return f"{self.user.username}'s goal - {self.goal_type}"
+        return f"{self.operation} {self.status}"
@@ -1,5 +1,9 @@
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from django.db import transaction
 from rest_framework import serializers
-from .models import User, Goal
+from apps.jobs.queue import enqueue
+from .models import User, Goal, DeletionJob
+from .sessions import forget_auth_state
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -26,9 +30,29 @@ class UserSerializer(serializers.ModelSerializer):
 class UserProfileSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
-        fields = ('id', 'username', 'email', 'first_name', 'last_name', 'bio', 'height', 'weight', 'age', 'gender')
+        fields = ('id', 'username', 'email', 'first_name', 'last_name', 'bio', 'height', 'weight', 'age', 'gender', 'timezone')
         read_only_fields = ('id',)
 
+    def validate_timezone(self, value):
+        try:
+            ZoneInfo(value)
+        except (ZoneInfoNotFoundError, ValueError):
+            raise serializers.ValidationError('Unknown timezone')
+        return value
+
+    def update(self, instance, validated_data):
+        timezone_changed = validated_data.get('timezone', instance.timezone) != instance.timezone
+        if not timezone_changed:
+            return super().update(instance, validated_data)
+        # Сводка по питанию хранится по локальным суткам. Пересчет по всей
+        # истории идет в фоне, а пока статистика считается по самим записям
+        validated_data['nutrition_summary_stale'] = True
+        with transaction.atomic():
+            instance = super().update(instance, validated_data)
+            enqueue('nutrition.rebuild_summary', {'user_ids': [instance.pk]}, user=instance)
+        forget_auth_state(instance.pk)
+        return instance
+
 class ChangePasswordSerializer(serializers.Serializer):
     old_password = serializers.CharField(required=True)
     new_password = serializers.CharField(required=True)
@@ -36,4 +60,9 @@ class ChangePasswordSerializer(serializers.Serializer):
 class GoalSerializer(serializers.ModelSerializer):
     class Meta:
         model = Goal
-        exclude = ('user',) 
\ No newline at end of file
+        exclude = ('user',) 
+
+class DeletionJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DeletionJob
+        fields = ('id', 'operation', 'status', 'deleted', 'error', 'created_at', 'finished_at')
@@ -0,0 +1,151 @@
+"""
+Сессии пользователя через номер поколения токенов.
+
+Каждый вход увеличивает User.token_generation и кладет новое значение в
+claim `gen` refresh- и access-токенов. Токен действителен, пока его
+поколение входит в последние MAX_SESSIONS_PER_USER, поэтому лишние и
+отозванные сессии отсекаются одним UPDATE без удаления строк
+OutstandingToken.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from backend.cache import acache, get_cache
+from backend.routers import pin_to_primary
+
+GENERATION_CLAIM = 'gen'
+
+
+def max_sessions():
+    return getattr(settings, 'MAX_SESSIONS_PER_USER', 1)
+
+
+def _auth_state_key(user_id):
+    return f'user:{user_id}:auth-state'
+
+
+def _auth_state_query(user_id):
+    return get_user_model().objects.filter(pk=user_id).values_list(
+        'token_generation', 'is_active', 'timezone', 'nutrition_summary_stale'
+    )
+
+
+def auth_state_timeout():
+    # 0 - не кэшировать: сброс в кэше одного процесса не увидят остальные
+    return getattr(settings, 'AUTH_STATE_CACHE_TIMEOUT', 0)
+
+
+def get_auth_state(user_id):
+    """
+    (token_generation, is_active, timezone, nutrition_summary_stale) пользователя
+    из кэша или None, если его нет
+    """
+    if auth_state_timeout() <= 0:
+        return _auth_state_query(user_id).first()
+    cache = get_cache()
+    state = cache.get(_auth_state_key(user_id))
+    if state is None:
+        state = _auth_state_query(user_id).first()
+        if state is None:
+            return None
+        cache.set(_auth_state_key(user_id), state, auth_state_timeout())
+    return state
+
+
+async def aget_auth_state(user_id):
+    """Асинхронный вариант get_auth_state"""
+    if auth_state_timeout() <= 0:
+        return await _auth_state_query(user_id).afirst()
+    cache = get_cache()
+    state = await acache(cache, 'get', _auth_state_key(user_id))
+    if state is None:
+        state = await _auth_state_query(user_id).afirst()
+        if state is None:
+            return None
+        await acache(cache, 'set', _auth_state_key(user_id), state, auth_state_timeout())
+    return state
+
+
+def forget_auth_state(user_id):
+    """Сбросить закэшированное состояние после изменения полей из get_auth_state"""
+    if auth_state_timeout() <= 0:
+        return
+
+    def forget():
+        get_cache().delete(_auth_state_key(user_id))
+
+    forget()
+    if transaction.get_connection().in_atomic_block:
+        # Повторно после коммита: параллельный запрос мог успеть закэшировать
+        # еще не закоммиченное состояние
+        transaction.on_commit(forget)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def forget_saved_user_auth_state(sender, instance, **kwargs):
+    # Сохранение через админку или save() может поменять is_active
+    forget_auth_state(instance.pk)
+
+
+def start_session(user):
+    """Открыть новую сессию и вернуть ее refresh-токен"""
+    User = get_user_model()
+    User.objects.filter(pk=user.pk).update(token_generation=F('token_generation') + 1)
+    user.token_generation = User.objects.values_list('token_generation', flat=True).get(pk=user.pk)
+    forget_auth_state(user.pk)
+    # Вход и регистрация идут без токена - закрепляем здесь, чтобы первые
+    # запросы с новым токеном не прочитали с реплики старое поколение
+    pin_to_primary(user.pk)
+
+    refresh = RefreshToken.for_user(user)
+    # access_token копирует claims refresh-токена, включая поколение
+    refresh[GENERATION_CLAIM] = user.token_generation
+    return refresh
+
+
+def revoke_sessions(user):
+    """Отозвать все сессии пользователя"""
+    get_user_model().objects.filter(pk=user.pk).update(
+        token_generation=F('token_generation') + max_sessions()
+    )
+    forget_auth_state(user.pk)
+    pin_to_primary(user.pk)
+
+
+def is_generation_valid(token, current_generation):
+    # Токены, выпущенные до появления claim, считаются поколением 0
+    return token.get(GENERATION_CLAIM, 0) > current_generation - max_sessions()
+
+
+class SessionTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """/api/token/ открывает сессию так же, как LoginView"""
+
+    @classmethod
+    def get_token(cls, user):
+        return start_session(user)
+
+
+class SessionTokenRefreshSerializer(TokenRefreshSerializer):
+    """Отклоняет refresh-токены отозванных или вытесненных сессий"""
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        generation = (
+            get_user_model().objects
+            .filter(**{api_settings.USER_ID_FIELD: refresh.get(api_settings.USER_ID_CLAIM)})
+            .values_list('token_generation', flat=True)
+            .first()
+        )
+        if generation is None or not is_generation_valid(refresh, generation):
+            raise InvalidToken(_('Session has been revoked'))
+        return super().validate(attrs)
@@ -0,0 +1,49 @@
+import io
+
+from django.core.management import call_command
+
+from apps.jobs.queue import task
+from backend.cache import bump_user_version
+from backend.imports import ImportFileError, ImportReport, import_rows, import_storage, read_rows
+from . import deletion
+from .imports import IMPORTERS
+from .models import User
+
+
+@task('users.run_deletion', concurrency=2, max_attempts=5, on_failure=deletion.job_failed)
+def run_deletion(job_id):
+    """Фоновое удаление (DeletionJob); повтор продолжает с оставшихся строк"""
+    deletion.run_job(job_id)
+
+
+@task('users.import_history', concurrency=2, max_attempts=1)
+def import_history(user_id, kind, path, input_format, max_errors=100):
+    """
+    Импорт файла, загруженного через ImportMixin и сохраненного в import_storage().
+
+    Одна попытка: повтор с начала файла продублировал бы строки без client_id.
+    """
+    user = User.objects.get(pk=user_id)
+    model, serializer_class, after_batch = IMPORTERS[kind]
+    report = ImportReport(max_errors)
+    storage = import_storage()
+    try:
+        with storage.open(path, 'rb') as file:
+            import_rows(
+                user, model, serializer_class(), read_rows(file, input_format),
+                after_batch=after_batch and (lambda ids: after_batch(user, ids)), report=report,
+            )
+    except ImportFileError as exc:
+        return {**report.as_dict(), 'error': str(exc)}
+    finally:
+        storage.delete(path)
+        if report.created:
+            bump_user_version(user.pk)
+    return report.as_dict()
+
+
+@task('users.prune_tokens', concurrency=1)
+def prune_tokens():
+    out = io.StringIO()
+    call_command('prune_tokens', stdout=out)
+    return {'output': out.getvalue().strip()}
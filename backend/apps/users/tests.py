@@ -1,3 +1,944 @@
-from django.test import TestCase
+import importlib
+import io
+import json
+import logging
+import os
+import tempfile
+from datetime import timedelta
+from importlib import import_module
+from unittest.mock import patch
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import DatabaseError, connection, transaction
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver, clear_url_caches, get_resolver, resolve, reverse
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from apps.jobs.models import Job
+from apps.jobs.queue import run_pending
+from apps.nutrition import rollup
+from apps.nutrition.models import DailyNutritionSummary, Nutrition
+from apps.sync.models import Tombstone
+from apps.nutrition.views import AsyncNutritionListView, AsyncTodayNutritionView
+from apps.workouts.models import Workout
+from apps.workouts.views import AsyncWorkoutListView, WorkoutViewSet
+from backend.async_views import AsyncReadView
+from backend.dates import user_today
+from backend.deletion import delete_in_batches
+from backend.downloads import parse_range
+from backend.fastpath import get_plan
+from backend.logs import QueueJSONHandler, SampledLogger
+from backend.routers import ReplicaRouter, ReplicaRoutingMiddleware, is_pinned
+from backend.testing import UserAPITestCase, explain
+from . import deletion, views
+from .models import User, Goal, DeletionJob
+from .serializers import GoalSerializer
+from .sessions import start_session
+from .views import AsyncDashboardView, AsyncGoalListView, AsyncUserProfileView, LandingPageView
+
+
+class GoalQueryPlanTests(UserAPITestCase):
+    """Проверяем, что выборки целей пользователя используют индекс (user, achieved)"""
+
+    username = 'planner'
+
+    def test_achieved_filter_uses_user_achieved_index(self):
+        plan = explain(Goal.objects.filter(user=self.user, achieved=True))
+        if connection.vendor == 'sqlite':
+            # SQLite получает условие как голый столбец ("achieved") и не
+            # использует его как ключ индекса, поэтому подходит любой
+            # составной индекс, начинающийся с user
+            self.assertRegex(plan, r'USING INDEX goal_user_\w+_idx \(user_id=\?')
+        else:
+            self.assertIn('goal_user_achieved_idx', plan)
+
+
+@override_settings(USER_CACHE_ENABLED=True)
+class UserCacheTests(UserAPITestCase):
+    """Ответы кэшируются по пользователю и сбрасываются его же записями"""
+
+    username = 'cached'
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other = User.objects.create_user('other', 'other@example.com', 'password')
+
+    def test_profile_is_cached_until_update(self):
+        self.assertEqual(self.client.get('/api/auth/profile/')['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/auth/profile/')
+        self.assertEqual(response['X-Cache'], 'HIT')
+
+        self.client.put('/api/auth/profile/', {'bio': 'updated'})
+        response = self.client.get('/api/auth/profile/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['bio'], 'updated')
+
+    def test_goal_write_invalidates_goal_lists(self):
+        self.assertEqual(self.client.get('/api/goals/in_progress/').json(), [])
+        self.client.post('/api/goals/', {
+            'name': 'Run', 'goal_type': 'cardio', 'target_weight': 70,
+            'target_date': '2030-01-01T00:00:00Z',
+        })
+        self.assertEqual(len(self.client.get('/api/goals/in_progress/').json()), 1)
+
+    def test_entries_are_per_user(self):
+        self.client.get('/api/auth/me/')
+        self.client.force_authenticate(self.other)
+        response = self.client.get('/api/auth/me/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['username'], 'other')
+
+    @override_settings(USER_CACHE_ENABLED=False)
+    def test_disabled_without_shared_cache(self):
+        self.client.get('/api/auth/profile/')
+        response = self.client.get('/api/auth/profile/')
+        self.assertNotIn('X-Cache', response)
+        self.client.put('/api/auth/profile/', {'bio': 'updated'})
+        self.assertIsNone(cache.get(f'user:{self.user.pk}:version'))
+
+
+class SessionTests(UserAPITestCase):
+    """Вход вытесняет старые сессии без удаления OutstandingToken"""
+
+    username = 'session'
+
+    def login(self):
+        response = self.client.post('/api/auth/login/', {'username': 'session', 'password': 'password'})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_new_login_revokes_previous_session(self):
+        first = self.login()
+        second = self.login()
+
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {first['access']}")
+        self.assertEqual(client.get('/api/auth/me/').status_code, 401)
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {second['access']}")
+        self.assertEqual(client.get('/api/auth/me/').status_code, 200)
+
+        response = self.client.post('/api/token/refresh/', {'refresh': first['refresh']})
+        self.assertEqual(response.status_code, 401)
+        response = self.client.post('/api/token/refresh/', {'refresh': second['refresh']})
+        self.assertEqual(response.status_code, 200)
+
+    def test_login_query_count_does_not_grow_with_history(self):
+        for _ in range(5):
+            self.login()
+        with self.assertNumQueries(4):
+            self.login()
+
+    @override_settings(REPLICA_DATABASES=['replica1'])
+    def test_login_pins_user_to_primary(self):
+        cache.clear()
+        self.login()
+        self.assertTrue(is_pinned(self.user.pk))
+
+    @override_settings(AUTH_STATE_CACHE_TIMEOUT=300)
+    def test_token_authentication_skips_user_lookup(self):
+        tokens = self.login()
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+        client.get('/api/workouts/')
+
+        # ETag-агрегат и сама выборка, без SELECT из users_user
+        with self.assertNumQueries(2):
+            response = client.get('/api/workouts/')
+        self.assertEqual(response.status_code, 200)
+
+        # Поля профиля подгружаются одним запросом при обращении
+        with self.assertNumQueries(1):
+            response = client.get('/api/auth/users/profile/')
+        self.assertEqual(response.json()['username'], 'session')
+
+
+    def test_string_user_id_claim_is_coerced_to_pk(self):
+        # simplejwt >= 5.4 кладет user_id в токен строкой
+        access = start_session(self.user).access_token
+        access['user_id'] = str(self.user.pk)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        goal = Goal.objects.create(user=self.user, name='Run', goal_type='cardio', target_weight=70,
+                                   target_date='2030-01-01T00:00:00Z')
+
+        response = client.patch(f'/api/goals/{goal.pk}/', {'progress': 50})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(client.delete(f'/api/goals/{goal.pk}/').status_code, 204)
+
+        access['user_id'] = 'not-a-pk'
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.assertEqual(client.get('/api/auth/me/').status_code, 401)
+
+    @override_settings(AUTH_STATE_CACHE_TIMEOUT=300)
+    def test_saving_user_forgets_cached_auth_state(self):
+        tokens = self.login()
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+        self.assertEqual(client.get('/api/auth/me/').status_code, 200)
+
+        # Как в админке: save() без revoke_sessions
+        user = User.objects.get(pk=self.user.pk)
+        user.is_active = False
+        user.save()
+        self.assertEqual(client.get('/api/auth/me/').status_code, 401)
+
+    def test_auth_state_is_not_cached_without_shared_cache(self):
+        tokens = self.login()
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+        client.get('/api/auth/me/')
+        self.assertIsNone(cache.get(f'user:{self.user.pk}:auth-state'))
+
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(client.get('/api/auth/me/').status_code, 401)
+
+    def test_prune_tokens_removes_only_expired(self):
+        self.login()
+        expired = self.login()
+        self.client.post('/api/token/refresh/', {'refresh': expired['refresh']})
+        # Обе первые сессии просрочены, последняя - нет
+        expired_count = OutstandingToken.objects.filter(user=self.user).update(
+            expires_at=timezone.now() - timedelta(days=1)
+        )
+        self.login()
+        self.assertTrue(BlacklistedToken.objects.exists())
+
+        out = io.StringIO()
+        call_command('prune_tokens', batch_size=1, stdout=out)
+        self.assertIn(f'Pruned {expired_count} expired token(s)', out.getvalue())
+        self.assertEqual(OutstandingToken.objects.filter(user=self.user).count(), 1)
+        self.assertFalse(BlacklistedToken.objects.exists())
+
+
+# Кэш ответов и состояния аутентификации включен, как с REDIS_URL
+@override_settings(USER_CACHE_ENABLED=True, AUTH_STATE_CACHE_TIMEOUT=300)
+class DashboardTests(UserAPITestCase):
+    """Главный экран собирается фиксированным числом запросов"""
+
+    username = 'dash'
+
+    def setUp(self):
+        cache.clear()
+        tokens = self.client.post('/api/auth/login/', {'username': 'dash', 'password': 'password'}).json()
+        self.api = APIClient()
+        self.api.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+
+    def populate(self, count):
+        for i in range(count):
+            self.api.post('/api/workouts/', {
+                'name': f'Workout {i}', 'description': 'Notes', 'duration': 30, 'calories_burned': 100,
+            })
+            self.api.post('/api/nutrition/', {
+                'meal_type': 'lunch', 'calories': 500, 'protein': 20, 'carbohydrates': 50, 'fats': 10,
+            })
+            self.api.post('/api/goals/', {
+                'name': f'Goal {i}', 'goal_type': 'weight', 'target_weight': 70,
+                'target_date': '2030-01-01T00:00:00Z',
+            })
+
+    def test_query_count_is_fixed(self):
+        for count in (1, 5):
+            self.populate(count)
+            # Профиль, сводка питания, агрегат тренировок, цели
+            with self.assertNumQueries(4):
+                response = self.api.get('/api/dashboard/')
+            self.assertEqual(response.status_code, 200)
+
+        data = response.json()
+        self.assertEqual(data['profile']['username'], 'dash')
+        self.assertEqual(data['nutrition']['total_calories'], 3000)
+        self.assertEqual(data['workouts']['workouts_count'], 6)
+        self.assertEqual(len(data['goals_in_progress']), 6)
+
+    def test_repeated_requests_hit_cache_and_etag(self):
+        self.populate(1)
+        etag = self.api.get('/api/dashboard/')['ETag']
+        with self.assertNumQueries(0):
+            response = self.api.get('/api/dashboard/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+
+class GoalFastPathParityTests(UserAPITestCase):
+    """Быстрый путь list/retrieve должен совпадать с GoalSerializer байт в байт"""
+
+    username = 'parity'
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Goal.objects.bulk_create([
+            Goal(user=cls.user, name='Похудеть', goal_type='weight', target_weight=68.5,
+                 target_date='2030-06-01T12:30:45.123456+03:00', progress=33.3, achieved=False,
+                 description='Текст\nс переносом'),
+            Goal(user=cls.user, name='Done', goal_type='run', target_weight=0,
+                 target_date='2020-01-01T00:00:00Z', progress=100, achieved=True),
+        ])
+
+    def test_list_and_retrieve_match_serializer(self):
+        self.assertIsNotNone(get_plan(GoalSerializer()))
+        queryset = Goal.objects.filter(user=self.user)
+        response = self.client.get('/api/goals/')
+        self.assertEqual(response.content, JSONRenderer().render(GoalSerializer(queryset, many=True).data))
+
+        goal = queryset.first()
+        response = self.client.get(f'/api/goals/{goal.pk}/')
+        self.assertEqual(response.content, JSONRenderer().render(GoalSerializer(goal).data))
+
+    @override_settings(LOG_SAMPLE_RATE=1)
+    def test_list_is_logged_once(self):
+        with self.assertLogs('apps.users.views', 'INFO') as logs:
+            self.client.get('/api/goals/')
+        self.assertEqual([record.getMessage() for record in logs.records], ['Goals requested'])
+
+
+@override_settings(USER_CACHE_ENABLED=True)
+class AsyncReadViewTests(UserAPITestCase):
+    """Async-view под ASGI отвечают так же, как синхронные DRF-view"""
+
+    username = 'async'
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.access = str(start_session(cls.user).access_token)
+        Workout.objects.bulk_create([
+            Workout(user=cls.user, name=f'Workout {i}', description='Notes', duration=i, calories_burned=i)
+            for i in range(3)
+        ])
+        DailyNutritionSummary.objects.create(
+            user=cls.user, date=user_today(cls.user), meals_count=1, total_calories=500,
+            total_protein=20.5, total_carbohydrates=50, total_fats=10,
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.api = APIClient()
+        self.api.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access}')
+        self.factory = AsyncRequestFactory()
+
+    async def call(self, view, sync_view, path, method='get', headers=None, **extra):
+        headers = {'Authorization': f'Bearer {self.access}', **(headers or {})}
+        request = getattr(self.factory, method)(path, headers=headers, **extra)
+        response = await view.as_view(sync_view=sync_view)(request)
+        if hasattr(response, 'render'):
+            await sync_to_async(response.render)()
+        return response
+
+    async def test_list_matches_sync_view(self):
+        sync_view = WorkoutViewSet.as_view({'get': 'list', 'post': 'create'})
+        for path in ('/api/workouts/', '/api/workouts/?fields=id,name', '/api/workouts/?page_size=2'):
+            expected = await sync_to_async(self.api.get)(path)
+            response = await self.call(AsyncWorkoutListView, sync_view, path)
+            self.assertEqual(response.content, expected.content)
+            self.assertEqual(response['ETag'], expected['ETag'])
+
+        response = await self.call(AsyncWorkoutListView, sync_view, '/api/workouts/',
+                                   headers={'If-None-Match': expected['ETag']})
+        self.assertEqual(response.status_code, 200)
+        response = await self.call(AsyncWorkoutListView, sync_view, '/api/workouts/?page_size=2',
+                                   headers={'If-None-Match': expected['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+    async def test_today_stats_and_dashboard_share_cache_with_sync_views(self):
+        expected = await sync_to_async(self.api.get)('/api/nutrition/today_stats/')
+        response = await self.call(AsyncTodayNutritionView, None, '/api/nutrition/today_stats/')
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response.content, expected.content)
+
+        response = await self.call(AsyncDashboardView, None, '/api/dashboard/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        expected = await sync_to_async(self.api.get)('/api/dashboard/')
+        self.assertEqual(expected['X-Cache'], 'HIT')
+        self.assertEqual(response.content, expected.content)
+        response = await self.call(AsyncDashboardView, None, '/api/dashboard/',
+                                   headers={'If-None-Match': expected['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+    def test_subclass_must_define_async_read(self):
+        with self.assertRaises(TypeError):
+            type('NoRead', (AsyncReadView,), {})
+        with self.assertRaises(TypeError):
+            type('SyncRead', (AsyncReadView,), {'read': lambda self, request: None})
+
+    @override_settings(ASYNC_READ_VIEWS=True)
+    def test_async_routes_keep_sync_route_names(self):
+        def reload_urls():
+            # Маршруты async-view добавляются при импорте urls.py
+            for name in ('apps.workouts.urls', 'apps.nutrition.urls', 'apps.users.goals_urls',
+                         'apps.users.urls', 'backend.urls'):
+                importlib.reload(import_module(name))
+            clear_url_caches()
+
+        reload_urls()
+        self.addCleanup(reload_urls)
+        for path, name, view in (
+            ('/api/workouts/', 'workout-list', AsyncWorkoutListView),
+            ('/api/nutrition/', 'nutrition-list', AsyncNutritionListView),
+            ('/api/nutrition/today_stats/', 'nutrition-today-stats', AsyncTodayNutritionView),
+            ('/api/goals/', 'goal-list', AsyncGoalListView),
+            ('/api/auth/profile/', 'profile', AsyncUserProfileView),
+            ('/api/dashboard/', 'dashboard', AsyncDashboardView),
+        ):
+            match = resolve(path)
+            self.assertIs(match.func.view_class, view)
+            self.assertEqual((match.view_name, reverse(name)), (name, path))
+
+    async def test_other_requests_fall_back_to_sync_view(self):
+        sync_view = WorkoutViewSet.as_view({'get': 'list', 'post': 'create'})
+        response = await self.call(AsyncWorkoutListView, sync_view, '/api/workouts/',
+                                   headers={'Authorization': 'Bearer invalid'})
+        self.assertEqual(response.status_code, 401)
+        response = await self.call(AsyncWorkoutListView, sync_view, '/api/workouts/?fields=password')
+        self.assertEqual(response.status_code, 400)
+        response = await self.call(AsyncWorkoutListView, sync_view, '/api/workouts/', method='post', data={
+            'name': 'Async', 'description': 'Notes', 'duration': 1, 'calories_burned': 1,
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(await Workout.objects.filter(user=self.user).acount(), 4)
+
+
+@override_settings(REPLICA_DATABASES=['replica1'])
+class ReplicaRoutingTests(SimpleTestCase):
+    """GET читают с реплики, пока пользователь не записал что-то сам"""
+
+    def setUp(self):
+        cache.clear()
+        token = AccessToken()
+        token['user_id'] = 1
+        self.factory = RequestFactory(headers={'Authorization': f'Bearer {token}'})
+
+    def read_alias(self, request, status=200):
+        aliases = []
+
+        def get_response(request):
+            aliases.append(ReplicaRouter().db_for_read(Goal))
+            return HttpResponse(status=status)
+
+        ReplicaRoutingMiddleware(get_response)(request)
+        return aliases[0]
+
+    def test_reads_use_replica_until_user_writes(self):
+        self.assertEqual(self.read_alias(self.factory.get('/api/goals/')), 'replica1')
+        self.assertIsNone(self.read_alias(self.factory.post('/api/goals/'), status=400))
+        self.assertEqual(self.read_alias(self.factory.get('/api/goals/')), 'replica1')
+
+        self.assertIsNone(self.read_alias(self.factory.post('/api/goals/'), status=201))
+        self.assertTrue(is_pinned(1))
+        self.assertIsNone(self.read_alias(self.factory.get('/api/goals/')))
+        # Другие пользователи по-прежнему читают с реплики
+        self.assertEqual(self.read_alias(RequestFactory().get('/api/goals/')), 'replica1')
+        # Вне запроса - основная БД
+        self.assertIsNone(ReplicaRouter().db_for_read(Goal))
+
+
+class StructuredLoggingTests(SimpleTestCase):
+    """JSON-логи через очередь и выборка событий на каждый запрос"""
+
+    def make_logger(self):
+        stream = io.StringIO()
+        handler = QueueJSONHandler(stream)
+        logger = logging.getLogger(f'tests.structured.{self._testMethodName}')
+        logger.addHandler(handler)
+        logger.propagate = False
+        self.addCleanup(logger.removeHandler, handler)
+        return logger, handler, stream
+
+    def lines(self, handler, stream):
+        handler.close()
+        return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+    def test_json_line_with_extra_fields(self):
+        logger, handler, stream = self.make_logger()
+        data = {'calories': 100}
+        logger.warning('Stats %s', data, extra={'user_id': 7})
+        # Аргументы подставлены в момент вызова, а не при записи в фоне
+        data['calories'] = 200
+        [entry] = self.lines(handler, stream)
+        self.assertEqual(entry['level'], 'WARNING')
+        self.assertEqual(entry['message'], "Stats {'calories': 100}")
+        self.assertEqual(entry['user_id'], 7)
+
+    def test_exception_is_formatted(self):
+        logger, handler, stream = self.make_logger()
+        try:
+            1 / 0
+        except ZeroDivisionError:
+            logger.exception('Failed')
+        [entry] = self.lines(handler, stream)
+        self.assertIn('ZeroDivisionError', entry['exc'])
+
+    @override_settings(LOG_SAMPLE_RATE=0)
+    def test_sampled_logger_drops_only_info_events(self):
+        logger, handler, stream = self.make_logger()
+        request_logger = SampledLogger(logger)
+        request_logger.info('Goals requested', extra={'user_id': 7})
+        logger.info('User logged out')
+        request_logger.warning('Slow request', extra={'user_id': 7})
+        entries = self.lines(handler, stream)
+        self.assertEqual([entry['message'] for entry in entries], ['User logged out', 'Slow request'])
+        self.assertEqual(entries[1]['user_id'], 7)
+
+
+def seed_history(user, count, per_day=10):
+    """count тренировок, записей о питании и целей, по per_day в день назад от сегодня"""
+    now = timezone.now()
+    for model, make in (
+        (Workout, lambda i: Workout(user=user, name=f'Workout {i}', description='Бег', duration=30,
+                                    calories_burned=300)),
+        (Nutrition, lambda i: Nutrition(user=user, meal_type=('breakfast', 'lunch', 'dinner', 'snack')[i % 4],
+                                        calories=500, protein=20.5, carbohydrates=50.0, fats=10.0)),
+        (Goal, lambda i: Goal(user=user, name=f'Goal {i}', goal_type='weight', target_weight=70,
+                              target_date=now, achieved=i % 2 == 0)),
+    ):
+        model.objects.bulk_create((make(i) for i in range(count)), batch_size=2000)
+        if model is not Goal:
+            # created_at ставится при вставке - раскладываем историю по дням пачками id
+            ids = list(model.objects.filter(user=user).order_by('-id').values_list('id', flat=True))
+            for day, start in enumerate(range(0, count, per_day)):
+                chunk = ids[start:start + per_day]
+                model.objects.filter(id__range=(min(chunk), max(chunk))).update(
+                    created_at=now - timedelta(days=day)
+                )
+    rollup.rebuild(user)
+
+
+# Массовые удаления измеряются на пути через DeletionJob; сразу выполняемые
+# удаления проверяет DeletionTests
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'], DELETION_SYNC_MAX_ROWS=0)
+class QueryBudgetTests(TestCase):
+    """
+    Число SQL-запросов каждого маршрута API не больше бюджета и одинаково у
+    пользователя с 10 и с 10 000 записей каждого типа.
+
+    Каждый запрос выполняется при пустом кэше и откатывается. С переменной
+    окружения QUERY_BUDGET_REPORT=путь размеры ответов пишутся в JSON-файл.
+    """
+    SMALL, LARGE = 10, 10000
+
+    # Имя маршрута, метод, путь, тело, бюджет запросов
+    ROUTES = [
+        ('token_obtain_pair', 'post', '/api/token/', {'username': '{username}', 'password': 'password'}, 5),
+        # simplejwt 5.3 (requirements.txt) укладывается в 8; с 5.4 ротация еще проверяет
+        # пользователя и пишет OutstandingToken нового refresh-токена (с точками сохранения)
+        ('token_refresh', 'post', '/api/token/refresh/', {'refresh': '{refresh}'}, 15),
+        ('login', 'post', '/api/auth/login/', {'username': '{username}', 'password': 'password'}, 5),
+        ('register', 'post', '/api/auth/register/', {'username': 'newcomer', 'email': 'new@example.com'}, 7),
+        ('user-register', 'post', '/api/auth/users/register/',
+         {'username': 'newcomer', 'email': 'new@example.com'}, 7),
+        ('user-list', 'get', '/api/auth/users/', None, 3),
+        ('user-detail', 'get', '/api/auth/users/{user}/', None, 3),
+        # Отключение входа и постановка удаления в одной транзакции (+ точки сохранения)
+        ('user-detail', 'delete', '/api/auth/users/{user}/', None, 11),
+        ('deletion-job', 'get', '/api/auth/deletions/{job}/', None, 1),
+        ('job-detail', 'get', '/api/jobs/{queued_job}/', None, 3),
+        ('user-detail', 'get', '/api/auth/me/', None, 2),
+        ('user-profile', 'get', '/api/auth/users/profile/', None, 2),
+        ('user-profile', 'put', '/api/auth/users/profile/', {'bio': 'Бегаю по утрам'}, 3),
+        ('user-change-password', 'post', '/api/auth/users/change_password/',
+         {'old_password': 'password', 'new_password': 'new-password'}, 3),
+        ('profile', 'get', '/api/auth/profile/', None, 2),
+        ('profile', 'put', '/api/auth/profile/', {'bio': 'Бегаю по утрам'}, 3),
+        ('dashboard', 'get', '/api/dashboard/', None, 5),
+        ('sync', 'get', '/api/sync/', None, 4),
+        ('sync', 'get', '/api/sync/?since={since}', None, 5),
+        ('workout-list', 'get', '/api/workouts/', None, 3),
+        ('workout-list', 'get', '/api/workouts/?page_size=50', None, 3),
+        ('workout-list', 'post', '/api/workouts/',
+         {'name': 'Бег', 'description': 'Парк', 'duration': 30, 'calories_burned': 300}, 2),
+        ('workout-detail', 'get', '/api/workouts/{workout}/', None, 3),
+        ('workout-detail', 'patch', '/api/workouts/{workout}/', {'duration': 45}, 5),
+        ('workout-detail', 'delete', '/api/workouts/{workout}/', None, 6),
+        ('workout-bulk', 'post', '/api/workouts/bulk/',
+         [{'client_id': f'w{i}', 'name': 'Бег', 'description': 'Парк', 'duration': 30, 'calories_burned': 300}
+          for i in range(5)], 7),
+        ('workout-import', 'post', '/api/workouts/import/',
+         {'file': SimpleUploadedFile('workouts.csv', b'name,description,duration,calories_burned,created_at\n'
+                                     + b'Run,Park,30,300,2024-03-01T08:00:00Z\n' * 5)}, 6),
+        ('workout-stats', 'get', '/api/workouts/stats/', None, 2),
+        ('workout-export', 'get', '/api/workouts/export/', None, 2),
+        ('workout-export', 'get', '/api/workouts/export/?output=csv', None, 2),
+        # Массовые удаления ставят задание: подсчет строк, max(pk) на момент запроса,
+        # DeletionJob и Job в одной транзакции (точка сохранения и ее снятие)
+        ('workout-delete-by-date', 'delete', '/api/workouts/delete_by_date/?date={today}', None, 7),
+        ('workout-delete-all', 'delete', '/api/workouts/delete_all/', None, 7),
+        ('nutrition-list', 'get', '/api/nutrition/', None, 3),
+        ('nutrition-list', 'get', '/api/nutrition/?page_size=50', None, 3),
+        ('nutrition-list', 'post', '/api/nutrition/',
+         {'meal_type': 'lunch', 'calories': 600, 'protein': 30, 'carbohydrates': 70, 'fats': 20}, 5),
+        ('nutrition-detail', 'get', '/api/nutrition/{nutrition}/', None, 3),
+        ('nutrition-detail', 'patch', '/api/nutrition/{nutrition}/', {'calories': 700}, 8),
+        ('nutrition-detail', 'delete', '/api/nutrition/{nutrition}/', None, 8),
+        ('nutrition-bulk', 'post', '/api/nutrition/bulk/',
+         [{'client_id': f'n{i}', 'meal_type': 'snack', 'calories': 200, 'protein': 5, 'carbohydrates': 30,
+           'fats': 5} for i in range(5)], 9),
+        ('nutrition-import', 'post', '/api/nutrition/import/',
+         {'file': SimpleUploadedFile('nutrition.ndjson', b'{"meal_type": "snack", "calories": 200, "protein": 5, '
+                                     + b'"carbohydrates": 30, "fats": 5, "created_at": "2001-03-01T08:00:00Z"}\n' * 5)},
+         11),
+        ('nutrition-stats', 'get', '/api/nutrition/stats/', None, 2),
+        ('nutrition-today-stats', 'get', '/api/nutrition/today_stats/', None, 2),
+        ('nutrition-export', 'get', '/api/nutrition/export/', None, 2),
+        ('nutrition-delete-by-date', 'delete', '/api/nutrition/delete_by_date/?date={today}', None, 7),
+        ('nutrition-delete-by-meal-type', 'delete', '/api/nutrition/delete_by_meal_type/?meal_type=lunch',
+         None, 7),
+        ('nutrition-delete-all', 'delete', '/api/nutrition/delete_all/', None, 7),
+        ('goal-list', 'get', '/api/goals/', None, 3),
+        ('goal-list', 'get', '/api/goals/?page_size=50', None, 3),
+        ('goal-list', 'post', '/api/goals/',
+         {'name': 'Похудеть', 'goal_type': 'weight', 'target_weight': 70, 'target_date': '2030-01-01T00:00:00Z'},
+         2),
+        ('goal-detail', 'get', '/api/goals/{goal}/', None, 3),
+        ('goal-detail', 'patch', '/api/goals/{goal}/', {'progress': 50}, 5),
+        ('goal-detail', 'delete', '/api/goals/{goal}/', None, 8),
+        ('goal-achieved', 'get', '/api/goals/achieved/', None, 2),
+        ('goal-export', 'get', '/api/goals/export/?output=csv', None, 2),
+        ('goal-in-progress', 'get', '/api/goals/in_progress/', None, 2),
+        ('goal-by-category', 'get', '/api/goals/by_category/?category=weight', None, 2),
+        ('goal-toggle-achieved', 'patch', '/api/goals/{goal}/toggle_achieved/', None, 3),
+        ('goal-update-progress', 'patch', '/api/goals/{goal}/update_progress/', {'progress': 100}, 3),
+    ]
+
+    sizes = {}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.small = User.objects.create_user('budget-small', 'small@example.com', 'password')
+        cls.large = User.objects.create_user('budget-large', 'large@example.com', 'password')
+        seed_history(cls.small, cls.SMALL)
+        seed_history(cls.large, cls.LARGE)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        report = os.environ.get('QUERY_BUDGET_REPORT')
+        if report:
+            with open(report, 'w') as file:
+                json.dump(cls.sizes, file, indent=2, ensure_ascii=False)
+
+    def format(self, value, context):
+        if isinstance(value, str):
+            return value.format(**context)
+        if isinstance(value, dict):
+            return {key: self.format(item, context) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self.format(item, context) for item in value]
+        if isinstance(value, SimpleUploadedFile):
+            # Один и тот же файл загружается в каждом вызове
+            value.seek(0)
+        return value
+
+    def call(self, user, method, path, data):
+        refresh = start_session(user)
+        context = {
+            'username': user.username,
+            'user': user.pk,
+            'refresh': str(refresh),
+            'today': user_today(user).isoformat(),
+            'since': (timezone.now() - timedelta(days=1)).isoformat().replace('+00:00', 'Z'),
+            'workout': Workout.objects.filter(user=user).latest('id').pk,
+            'nutrition': Nutrition.objects.filter(user=user).latest('id').pk,
+            'goal': Goal.objects.filter(user=user).latest('id').pk,
+            'job': DeletionJob.objects.create(user=user, operation='workouts').pk,
+            'queued_job': Job.objects.create(user=user, name='jobs.prune').pk,
+        }
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+        cache.clear()
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as queries:
+                data = self.format(data, context)
+                upload = isinstance(data, dict) and any(isinstance(value, SimpleUploadedFile) for value in data.values())
+                response = getattr(client, method)(
+                    self.format(path, context), data, format='multipart' if upload else 'json'
+                )
+                # Выгрузка читает БД, пока отдается тело ответа
+                content = b''.join(response.streaming_content) if response.streaming else response.content
+            transaction.set_rollback(True)
+        return response, content, len(queries)
+
+    def test_every_api_route_has_a_budget(self):
+        def names(resolver, prefix=''):
+            for pattern in resolver.url_patterns:
+                if isinstance(pattern, URLResolver):
+                    yield from names(pattern, prefix + str(pattern.pattern))
+                elif (prefix + str(pattern.pattern)).startswith('api/') and pattern.name != 'api-root':
+                    yield pattern.name
+
+        self.assertEqual(set(names(get_resolver())), {route[0] for route in self.ROUTES})
+
+    def test_query_count_does_not_grow_with_history(self):
+        for name, method, path, data, budget in self.ROUTES:
+            with self.subTest(route=name, method=method, path=path):
+                small, small_content, small_queries = self.call(self.small, method, path, data)
+                large, large_content, large_queries = self.call(self.large, method, path, data)
+                self.assertLess(small.status_code, 400, small_content[:200])
+                self.assertLess(large.status_code, 400, large_content[:200])
+                self.sizes[f'{method.upper()} {path}'] = {
+                    'queries': large_queries,
+                    f'bytes_{self.SMALL}': len(small_content),
+                    f'bytes_{self.LARGE}': len(large_content),
+                }
+                self.assertEqual(small_queries, large_queries)
+                self.assertLessEqual(large_queries, budget)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class DeletionTests(UserAPITestCase):
+    """Массовые удаления пачками: сразу для небольших, через DeletionJob для больших"""
+
+    username = 'deleter'
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        seed_history(cls.user, 30)
+
+    def test_bench_api_refuses_without_confirmation(self):
+        User.objects.create_user('bench-api-0', 'bench@example.com', 'password')
+        with self.assertRaisesMessage(CommandError, '--yes-i-know'):
+            call_command('bench_api')
+        self.assertTrue(User.objects.filter(username='bench-api-0').exists())
+
+    def test_batches_follow_primary_key(self):
+        batches = []
+        deleted = delete_in_batches(Workout.objects.filter(user=self.user), size=7, progress=batches.append)
+        self.assertEqual((deleted, batches), (30, [7, 7, 7, 7, 2]))
+        self.assertFalse(Workout.objects.filter(user=self.user).exists())
+
+    def test_small_delete_cost_does_not_depend_on_rows(self):
+        other = User.objects.create_user('other-deleter', 'other-deleter@example.com', 'password')
+        seed_history(other, 300, per_day=300)
+        counts = []
+        for user in (self.user, other):
+            with CaptureQueriesContext(connection) as queries:
+                job = deletion.delete_user_data(user, 'nutrition', {'date': user_today(user).isoformat()})
+            self.assertIsNone(job)
+            counts.append(len(queries))
+            self.assertEqual(rollup.verify(user), [])
+        self.assertEqual(counts[0], counts[1])
+
+    @override_settings(DELETION_SYNC_MAX_ROWS=5, DELETION_BATCH_SIZE=4)
+    def test_large_delete_runs_as_job(self):
+        response = self.client.delete('/api/nutrition/delete_by_meal_type/?meal_type=lunch')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(run_pending(), 1)
+        self.assertFalse(Nutrition.objects.filter(user=self.user, meal_type='lunch').exists())
+        self.assertEqual(rollup.verify(self.user), [])
+        self.assertEqual(Tombstone.objects.filter(user=self.user, kind='nutrition').count(), 8)
+
+        job = APIClient().get(response.json()['status_url']).json()
+        self.assertEqual((job['status'], job['deleted'], job['operation']), ('done', 8, 'nutrition'))
+
+    @override_settings(DELETION_SYNC_MAX_ROWS=5, DELETION_BATCH_SIZE=4)
+    def test_delete_all_records_one_tombstone(self):
+        response = self.client.delete('/api/workouts/delete_all/')
+        self.assertEqual(response.status_code, 202)
+        run_pending()
+        self.assertFalse(Workout.objects.filter(user=self.user).exists())
+        self.assertEqual(
+            list(Tombstone.objects.filter(user=self.user).values_list('kind', 'object_id')), [('workout', None)]
+        )
+
+    @override_settings(DELETION_SYNC_MAX_ROWS=5, DELETION_BATCH_SIZE=4)
+    def test_job_keeps_rows_created_after_the_request(self):
+        cursor = self.client.get('/api/sync/').json()['cursor']
+        response = self.client.delete('/api/workouts/delete_all/')
+        self.assertEqual(response.status_code, 202)
+        self.client.delete(f'/api/nutrition/delete_by_date/?date={user_today(self.user).isoformat()}')
+        workout = self.client.post('/api/workouts/', {
+            'name': 'After', 'description': 'Notes', 'duration': 1, 'calories_burned': 1,
+        }).json()['id']
+        meal = self.client.post('/api/nutrition/', {
+            'meal_type': 'lunch', 'calories': 500, 'protein': 1, 'carbohydrates': 1, 'fats': 1,
+        }).json()['id']
+
+        self.assertEqual(run_pending(), 2)
+        self.assertEqual(list(Workout.objects.filter(user=self.user).values_list('id', flat=True)), [workout])
+        self.assertTrue(Nutrition.objects.filter(pk=meal).exists())
+        self.assertEqual(rollup.verify(self.user), [])
+        self.assertFalse(Tombstone.objects.filter(user=self.user, object_id=meal).exists())
+
+        # Клиент очищает тренировки и снова получает созданную после запроса
+        data = self.client.get('/api/sync/', {'since': cursor}).json()
+        self.assertTrue(data['workouts']['cleared'])
+        self.assertEqual([item['id'] for item in data['workouts']['updated']], [workout])
+
+    @override_settings(DELETION_SYNC_MAX_ROWS=5)
+    def test_failed_enqueue_leaves_nothing_behind(self):
+        generation = self.user.token_generation
+        with patch.object(deletion, 'enqueue', side_effect=DatabaseError('connection lost')):
+            with self.assertRaises(DatabaseError):
+                deletion.delete_user_data(self.user, 'workouts')
+            with self.assertRaises(DatabaseError):
+                deletion.delete_account(self.user)
+        self.assertFalse(DeletionJob.objects.exists())
+        # Аккаунт не заблокирован без удаления данных
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.is_active, self.user.token_generation), (True, generation))
+        self.assertEqual(Workout.objects.filter(user=self.user).count(), 30)
+
+    @override_settings(DELETION_SYNC_MAX_ROWS=5, DELETION_BATCH_SIZE=4)
+    def test_account_deletion(self):
+        refresh = start_session(self.user)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+        response = client.delete(f'/api/auth/users/{self.user.pk}/')
+        self.assertEqual(response.status_code, 202)
+        # Вход отключен сразу, еще до удаления данных
+        self.assertEqual(client.get('/api/auth/me/').status_code, 401)
+
+        job_id = response.json()['id']
+        run_pending()
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+        for model in (Workout, Nutrition, DailyNutritionSummary, Goal):
+            self.assertFalse(model.objects.filter(user_id=self.user.pk).exists())
+        job = DeletionJob.objects.get(pk=job_id)
+        self.assertEqual((job.status, job.user_id, job.deleted), ('done', None, 3 * 30 + 3 + 1))
+
+    def test_small_account_is_deleted_at_once(self):
+        user = User.objects.create_user('short-lived', 'short@example.com', 'password')
+        Workout.objects.create(user=user, name='Run', description='', duration=1, calories_burned=1)
+        self.client.force_authenticate(user)
+        response = self.client.delete(f'/api/auth/users/{user.pk}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(User.objects.filter(pk=user.pk).exists())
+
+    @override_settings(DELETION_SYNC_MAX_ROWS=5, DELETION_BATCH_SIZE=4, JOBS_RETRY_BACKOFF_SECONDS=0)
+    def test_failed_job_is_retried_from_remaining_rows(self):
+        response = self.client.delete('/api/workouts/delete_all/')
+        job_id = response.json()['id']
+        batches = []
+        original = deletion.delete_in_batches
+
+        def fail_after_first_batch(queryset, **kwargs):
+            def progress(deleted):
+                kwargs['progress'](deleted)
+                batches.append(deleted)
+                if len(batches) == 1:
+                    raise DatabaseError('disk I/O error')
+            return original(queryset, **{**kwargs, 'progress': progress})
+
+        with patch.object(deletion, 'delete_in_batches', fail_after_first_batch), \
+                self.assertLogs('apps.jobs.queue', 'ERROR'):
+            self.assertEqual(run_pending(), 2)
+        self.assertEqual(batches, [4, 4, 4, 4, 4, 4, 4, 2])
+        self.assertFalse(Workout.objects.filter(user=self.user).exists())
+        job = DeletionJob.objects.get(pk=job_id)
+        self.assertEqual((job.status, job.deleted, job.error), ('done', 30, ''))
+        self.assertEqual(Job.objects.get(name='users.run_deletion').attempts, 2)
+
+    @override_settings(DELETION_SYNC_MAX_ROWS=5)
+    def test_job_fails_when_attempts_are_exhausted(self):
+        response = self.client.delete('/api/workouts/delete_all/')
+        Job.objects.filter(name='users.run_deletion').update(max_attempts=1)
+        with patch.object(deletion, 'delete_in_batches', side_effect=DatabaseError('disk I/O error')), \
+                self.assertLogs('apps.jobs.queue', 'ERROR'):
+            run_pending()
+        job = APIClient().get(response.json()['status_url']).json()
+        self.assertEqual((job['status'], job['error']), ('failed', 'disk I/O error'))
+
+
+class ApkDownloadTests(TestCase):
+    """Главная страница пересобирается по mtime APK, APK отдается с докачкой"""
+    CONTENT = bytes(range(256)) * 40
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.path = os.path.join(media.name, 'apk', 'fit-mobile.apk')
+        self.enterContext(patch.dict(views._landing_pages, clear=True))
+
+    def publish(self, mtime):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'wb') as file:
+            file.write(self.CONTENT)
+        os.utime(self.path, (mtime, mtime))
+
+    def download(self, **headers):
+        response = self.client.get('/download/fit-mobile.apk', headers=headers)
+        return response, b''.join(response.streaming_content) if response.streaming else response.content
+
+    @override_settings(DEBUG=False)
+    def test_landing_page_is_rendered_again_when_the_apk_changes(self):
+        render_context = LandingPageView.get_context_data
+        with patch.object(LandingPageView, 'get_context_data', autospec=True, side_effect=render_context) as render:
+            response = self.client.get('/')
+            self.assertNotContains(response, '/download/fit-mobile.apk')
+            self.assertEqual(self.client.get('/', headers={'If-None-Match': response['ETag']}).status_code, 304)
+
+            self.publish(1_700_000_000)
+            self.assertContains(self.client.get('/'), '/download/fit-mobile.apk')
+            self.client.get('/')
+            self.publish(1_700_000_100)
+            self.client.get('/')
+        self.assertEqual(render.call_count, 3)
+
+    @override_settings(DEBUG=True)
+    def test_landing_page_is_not_cached_in_debug(self):
+        render_context = LandingPageView.get_context_data
+        with patch.object(LandingPageView, 'get_context_data', autospec=True, side_effect=render_context) as render:
+            self.client.get('/')
+            self.client.get('/')
+        self.assertEqual(render.call_count, 2)
+
+    def test_full_and_partial_download(self):
+        self.publish(1_700_000_000)
+        response, body = self.download()
+        self.assertEqual((response.status_code, body), (200, self.CONTENT))
+        self.assertEqual(response['Content-Type'], 'application/vnd.android.package-archive')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('attachment; filename="fit-mobile.apk"', response['Content-Disposition'])
+        etag = response['ETag']
+
+        response, body = self.download(Range='bytes=100-199')
+        self.assertEqual((response.status_code, body), (206, self.CONTENT[100:200]))
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.CONTENT)}')
+        self.assertEqual(response['Content-Length'], '100')
+
+        response, body = self.download(Range='bytes=10000-', **{'If-Range': etag})
+        self.assertEqual((response.status_code, body), (206, self.CONTENT[10000:]))
+        response, body = self.download(Range='bytes=-24')
+        self.assertEqual((response.status_code, body), (206, self.CONTENT[-24:]))
+
+        # Файл изменился с начала загрузки - докачка невозможна, отдается весь файл
+        response, body = self.download(Range='bytes=100-', **{'If-Range': '"stale"'})
+        self.assertEqual((response.status_code, body), (200, self.CONTENT))
+        response, _ = self.download(Range=f'bytes={len(self.CONTENT)}-')
+        self.assertEqual((response.status_code, response['Content-Range']), (416, f'bytes */{len(self.CONTENT)}'))
+        self.assertEqual(self.download(**{'If-None-Match': etag})[0].status_code, 304)
+
+    def test_missing_apk(self):
+        self.assertEqual(self.client.get('/download/fit-mobile.apk').status_code, 404)
+
+    @override_settings(FILE_SENDFILE_HEADER='X-Accel-Redirect')
+    def test_web_server_handoff(self):
+        self.publish(1_700_000_000)
+        response = self.client.get('/download/fit-mobile.apk', headers={'Range': 'bytes=0-9'})
+        self.assertEqual((response.status_code, response.content), (200, b''))
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/apk/fit-mobile.apk')
+        self.assertIn('ETag', response)
+
+
+class RangeParsingTests(SimpleTestCase):
+    def test_parse_range(self):
+        self.assertEqual(parse_range('bytes=0-99', 1000), (0, 99))
+        self.assertEqual(parse_range('bytes=900-2000', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=-2000', 1000), (0, 999))
+        for ignored in ('bytes=5-3', 'bytes=0-1,5-6', 'items=0-1', 'bytes=-'):
+            self.assertIsNone(parse_range(ignored, 1000))
+        for unsatisfiable in ('bytes=1000-', 'bytes=-0'):
+            with self.assertRaises(ValueError):
+                parse_range(unsatisfiable, 1000)
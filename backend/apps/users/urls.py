@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
@@ -7,6 +8,8 @@ from .views import (
     LogoutView,
     UserProfileView, 
     UserView,
+    DeletionJobView,
+    AsyncUserProfileView,
 )
 
 router = DefaultRouter()
@@ -18,4 +21,8 @@ urlpatterns = [
     path('login/', LoginView.as_view(), name='login'),
     path('profile/', UserProfileView.as_view(), name='profile'),
     path('me/', UserView.as_view(), name='user-detail'),
-] 
\ No newline at end of file
+    path('deletions/<uuid:pk>/', DeletionJobView.as_view(), name='deletion-job'),
+]
+
+if settings.ASYNC_READ_VIEWS:
+    urlpatterns.insert(0, path('profile/', AsyncUserProfileView.as_view(sync_view=UserProfileView.as_view()), name='profile'))
@@ -1,29 +1,54 @@
-from django.shortcuts import render
+from django.shortcuts import get_object_or_404, render
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from django.contrib.auth import authenticate, get_user_model
 from rest_framework_simplejwt.tokens import RefreshToken
-from .models import User, Goal
+from .sessions import start_session
+from .models import User, Goal, DeletionJob
+from .deletion import delete_account, deletion_response
 from .serializers import (
     UserSerializer, 
     GoalSerializer, 
     UserProfileSerializer,
-    ChangePasswordSerializer
+    ChangePasswordSerializer,
+    DeletionJobSerializer,
 )
 from rest_framework.views import APIView
 import logging
-from django.views.generic import TemplateView
+from django.views.generic import TemplateView, View
 from django.conf import settings
+from django.http import HttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+import hashlib
 import os
+import threading
+from backend.cache import UserCacheInvalidationMixin, cache_per_user
+from backend.conditional import ConditionalGetMixin, etag_from_data
+from backend.downloads import file_response
+from backend.fastpath import FastReadMixin
+from backend.export import ExportMixin
+from backend.async_views import AsyncListView, AsyncReadView
+from backend.sparse import SparseFieldsMixin
+from backend.dates import user_day_range, user_today
+from backend.logs import SampledLogger
+from apps.sync import tombstones
+from apps.nutrition import rollup
+from apps.nutrition.rollup import TOTAL_FIELDS
+from apps.workouts.models import Workout
+from django.db import transaction
+from django.db.models import Count, Sum
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
+# События на каждый запрос, пишутся с долей LOG_SAMPLE_RATE
+request_logger = SampledLogger(logger)
 
 # Create your views here.
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(UserCacheInvalidationMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [IsAuthenticated]
@@ -33,12 +58,18 @@ class UserViewSet(viewsets.ModelViewSet):
             return User.objects.all()
         return User.objects.filter(id=self.request.user.id)
 
+    def destroy(self, request, *args, **kwargs):
+        """Удалить аккаунт: вход отключается сразу, данные удаляются пачками"""
+        user = self.get_object()
+        logger.info('Account deletion requested', extra={'user_id': user.pk})
+        return deletion_response(request, delete_account(user))
+
     @action(detail=False, methods=['post'])
     def register(self, request):
         serializer = self.get_serializer(data=request.data)
         if serializer.is_valid():
             user = serializer.save()
-            refresh = RefreshToken.for_user(user)
+            refresh = start_session(user)
             return Response({
                 'user': serializer.data,
                 'refresh': str(refresh),
@@ -51,16 +82,17 @@ class UserViewSet(viewsets.ModelViewSet):
         """Get or update user profile"""
         if request.method == 'GET':
             serializer = UserProfileSerializer(request.user)
-            logger.info(f"Getting profile for user {request.user.username}")
+            request_logger.info('Profile requested', extra={'user_id': request.user.pk})
             return Response(serializer.data)
         elif request.method == 'PUT':
             serializer = UserProfileSerializer(request.user, data=request.data, partial=True)
-            logger.info(f"Updating profile for user {request.user.username} with data: {request.data}")
+            # Только имена полей: значения могут содержать личные данные
+            logger.info('Profile update', extra={'user_id': request.user.pk, 'fields': sorted(request.data)})
             if serializer.is_valid():
                 serializer.save()
-                logger.info(f"Profile updated successfully for user {request.user.username}")
+                logger.info('Profile updated', extra={'user_id': request.user.pk})
                 return Response(serializer.data)
-            logger.error(f"Profile update failed for user {request.user.username}: {serializer.errors}")
+            logger.error('Profile update rejected', extra={'user_id': request.user.pk, 'errors': serializer.errors})
             return Response(serializer.errors, status=400)
 
     @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated])
@@ -75,20 +107,25 @@ class UserViewSet(viewsets.ModelViewSet):
             return Response({'error': 'Incorrect old password'}, status=status.HTTP_400_BAD_REQUEST)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-class GoalViewSet(viewsets.ModelViewSet):
+class GoalViewSet(UserCacheInvalidationMixin, ConditionalGetMixin, SparseFieldsMixin, FastReadMixin,
+                  ExportMixin, viewsets.ModelViewSet):
     serializer_class = GoalSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        logger.info(f"Getting goals for user {self.request.user.username}")
         return Goal.objects.filter(user=self.request.user)
 
+    def list(self, request, *args, **kwargs):
+        # Не в get_queryset: список вызывает его дважды (ETag и сама выборка)
+        request_logger.info('Goals requested', extra={'user_id': request.user.pk})
+        return super().list(request, *args, **kwargs)
+
     def perform_create(self, serializer):
-        logger.info(f"Creating goal for user {self.request.user.username}")
+        request_logger.info('Creating goal', extra={'user_id': self.request.user.pk})
         serializer.save(user=self.request.user)
 
     def perform_update(self, serializer):
-        logger.info(f"Updating goal for user {self.request.user.username}")
+        request_logger.info('Updating goal', extra={'user_id': self.request.user.pk})
         instance = self.get_object()
         if instance.user == self.request.user:
             serializer.save()
@@ -96,12 +133,17 @@ class GoalViewSet(viewsets.ModelViewSet):
             raise PermissionError("You don't have permission to edit this goal")
 
     def destroy(self, request, *args, **kwargs):
-        logger.info(f"Deleting goal for user {request.user.username}")
+        request_logger.info('Deleting goal', extra={'user_id': request.user.pk})
         instance = self.get_object()
         if instance.user != request.user:
             raise PermissionError("You don't have permission to delete this goal")
         return super().destroy(request, *args, **kwargs)
 
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        tombstones.record_deleted(self.request.user, 'goal', [instance.pk])
+        instance.delete()
+
     @action(detail=True, methods=['patch'])
     def toggle_achieved(self, request, pk=None):
         """Переключить статус достижения цели"""
@@ -150,11 +192,13 @@ class GoalViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        goals = self.get_queryset().filter(category=category)
+        # Отдельного поля категории у цели нет - категория это goal_type
+        goals = self.get_queryset().filter(goal_type=category)
         serializer = self.get_serializer(goals, many=True)
         return Response(serializer.data)
 
     @action(detail=False, methods=['get'])
+    @cache_per_user('goals-achieved')
     def achieved(self, request):
         """Получить достигнутые цели"""
         goals = self.get_queryset().filter(achieved=True)
@@ -162,6 +206,7 @@ class GoalViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
     @action(detail=False, methods=['get'])
+    @cache_per_user('goals-in-progress')
     def in_progress(self, request):
         """Получить цели в процессе"""
         goals = self.get_queryset().filter(achieved=False)
@@ -184,16 +229,8 @@ class LoginView(APIView):
         user = authenticate(username=username, password=password)
         
         if user:
-            # Очищаем все предыдущие токены пользователя
-            try:
-                from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
-                OutstandingToken.objects.filter(user=user).delete()
-                logger.info(f"Cleared previous sessions for user {username}")
-            except Exception as e:
-                logger.error(f"Error clearing previous sessions: {e}")
-
-            # Создаем новый токен
-            refresh = RefreshToken.for_user(user)
+            # Новая сессия вытесняет предыдущие сверх MAX_SESSIONS_PER_USER
+            refresh = start_session(user)
             return Response({
                 'user': UserSerializer(user).data,
                 'refresh': str(refresh),
@@ -212,7 +249,7 @@ class RegisterView(APIView):
         serializer = UserSerializer(data=request.data)
         if serializer.is_valid():
             user = serializer.save()
-            refresh = RefreshToken.for_user(user)
+            refresh = start_session(user)
             return Response({
                 'user': serializer.data,
                 'refresh': str(refresh),
@@ -241,19 +278,20 @@ class LogoutView(APIView):
             token_obj = RefreshToken(token)
             token_obj.blacklist()
             
-            logger.info(f"User {request.user.username} logged out successfully")
+            logger.info('User logged out', extra={'user_id': request.user.pk})
             return Response({'message': 'Successfully logged out'}, status=status.HTTP_200_OK)
             
         except Exception as e:
-            logger.error(f"Logout error: {e}")
+            logger.error('Logout error: %s', e)
             return Response(
                 {'error': 'Failed to logout'},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-class UserProfileView(APIView):
+class UserProfileView(UserCacheInvalidationMixin, APIView):
     permission_classes = [IsAuthenticated]
 
+    @cache_per_user('profile')
     def get(self, request):
         serializer = UserProfileSerializer(request.user)
         return Response(serializer.data)
@@ -268,17 +306,154 @@ class UserProfileView(APIView):
 class UserView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @cache_per_user('me')
     def get(self, request):
         serializer = UserSerializer(request.user)
         return Response(serializer.data)
 
+class DeletionJobView(APIView):
+    """Статус фонового удаления. Без токена: после удаления аккаунта его уже нет"""
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def get(self, request, pk):
+        job = get_object_or_404(DeletionJob, pk=pk)
+        return Response(DeletionJobSerializer(job).data)
+
+def dashboard_queries(user):
+    """Сводка питания, тренировки за сегодня и цели в процессе для главного экрана"""
+    start, end = user_day_range(user)
+    return (
+        rollup.day_totals(user, start.date()),
+        Workout.objects.filter(user=user, created_at__gte=start, created_at__lt=end),
+        Goal.objects.filter(user=user, achieved=False),
+    )
+
+
+def workout_totals():
+    return {
+        'workouts_count': Count('id'),
+        'total_duration': Sum('duration'),
+        'total_calories_burned': Sum('calories_burned'),
+    }
+
+
+def dashboard_data(user, nutrition, workouts, goals):
+    return {
+        'profile': UserProfileSerializer(user).data,
+        'nutrition': nutrition or dict.fromkeys(TOTAL_FIELDS, 0),
+        'workouts': {key: value or 0 for key, value in workouts.items()},
+        'goals_in_progress': GoalSerializer(goals, many=True).data,
+    }
+
+
+class DashboardView(APIView):
+    """
+    Все данные главного экрана одним запросом: профиль, питание и
+    тренировки за сегодня, цели в процессе. Четыре запроса к БД при
+    промахе кэша, ни одного при попадании; ответ поддерживает ETag.
+    """
+    permission_classes = [IsAuthenticated]
+
+    @etag_from_data
+    @cache_per_user('dashboard', vary_on=lambda request: user_today(request.user))
+    def get(self, request):
+        user = request.user
+        nutrition, workouts, goals = dashboard_queries(user)
+        return Response(dashboard_data(
+            user, nutrition.first(), workouts.aggregate(**workout_totals()), goals
+        ))
+
+
+class AsyncGoalListView(AsyncListView):
+    """GET /api/goals/ под ASGI (см. backend.async_views)"""
+    serializer_class = GoalSerializer
+
+
+class AsyncUserProfileView(AsyncReadView):
+    """GET /api/auth/profile/ под ASGI, общий кэш с UserProfileView"""
+
+    @cache_per_user('profile')
+    async def read(self, request):
+        user = await User.objects.aget(pk=request.user.pk)
+        return self.json_response(UserProfileSerializer(user).data)
+
+
+class AsyncDashboardView(AsyncReadView):
+    """GET /api/dashboard/ под ASGI, общий кэш с DashboardView"""
+
+    @etag_from_data
+    @cache_per_user('dashboard', vary_on=lambda request: user_today(request.user))
+    async def read(self, request):
+        # Полная строка пользователя нужна профилю; запросов столько же, сколько у DashboardView
+        user = await User.objects.aget(pk=request.user.pk)
+        nutrition, workouts, goals = dashboard_queries(user)
+        return self.json_response(dashboard_data(
+            user,
+            await nutrition.afirst(),
+            await workouts.aaggregate(**workout_totals()),
+            [goal async for goal in goals],
+        ))
+
+# APK внутри MEDIA_ROOT
+APK_FILE = os.path.join('apk', 'fit-mobile.apk')
+APK_CONTENT_TYPE = 'application/vnd.android.package-archive'
+
+
+def apk_path():
+    return os.path.join(settings.MEDIA_ROOT, APK_FILE)
+
+
+def apk_mtime():
+    """mtime APK в наносекундах или None, если файла нет"""
+    try:
+        return os.stat(apk_path()).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+# mtime APK -> (HTML, ETag) последней отрендеренной главной страницы
+_landing_pages = {}
+_landing_lock = threading.Lock()
+
+
 class LandingPageView(TemplateView):
+    """
+    Главная страница со ссылкой на APK.
+
+    Страница не зависит от запроса, поэтому отрендеренный HTML хранится в
+    процессе, пока не изменится mtime APK (файл выложен заново или удален).
+    В DEBUG шаблон рендерится каждый раз, чтобы правки были видны сразу.
+    """
     template_name = 'landing.html'
 
+    def get(self, request, *args, **kwargs):
+        self.apk_mtime = apk_mtime()
+        with _landing_lock:
+            page = None if settings.DEBUG else _landing_pages.get(self.apk_mtime)
+        if page is None:
+            # Рендер вне блокировки: параллельные запросы получат одинаковый HTML
+            content = super().get(request, *args, **kwargs).render().content
+            page = (content, '"%s"' % hashlib.sha1(content).hexdigest())
+            with _landing_lock:
+                _landing_pages.clear()
+                _landing_pages[self.apk_mtime] = page
+        content, etag = page
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(content)
+        response['ETag'] = etag
+        return response
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # Путь к APK файлу
-        apk_path = os.path.join(settings.MEDIA_ROOT, 'apk', 'fit-mobile.apk')
-        context['apk_exists'] = os.path.exists(apk_path)
-        context['apk_url'] = settings.MEDIA_URL + 'apk/fit-mobile.apk' if context['apk_exists'] else None
+        context['apk_exists'] = self.apk_mtime is not None
+        context['apk_url'] = reverse('apk') if context['apk_exists'] else None
         return context
+
+
+class ApkDownloadView(View):
+    """APK с докачкой по Range и отдачей через веб-сервер (см. backend/downloads.py)"""
+
+    def get(self, request):
+        return file_response(request, apk_path(), APK_CONTENT_TYPE, os.path.basename(APK_FILE))
@@ -2,13 +2,26 @@ from django.db import models
 from apps.users.models import User
 
 class Workout(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='workouts')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='workouts',
+                             db_index=False)  # покрывается индексом (user, created_at)
     name = models.CharField(max_length=100)
     description = models.TextField()
     duration = models.IntegerField()
     calories_burned = models.IntegerField()
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Ключ идемпотентности, который генерирует клиент (для bulk-загрузки)
+    client_id = models.CharField(max_length=64, null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'client_id'], name='workout_user_client_id_uniq',
+                                    condition=models.Q(client_id__isnull=False)),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='workout_user_created_idx'),
+            models.Index(fields=['user', 'updated_at'], name='workout_user_updated_idx'),
+        ]
 
     def __str__(self):
-        return f"{self.user.username} - {self.name}"
+        return f"{self.user_id} - {self.name}"
@@ -4,4 +4,5 @@ from .models import Workout
 class WorkoutSerializer(serializers.ModelSerializer):
     class Meta:
         model = Workout
-        exclude = ('user',) 
\ No newline at end of file
+        exclude = ('user',)
+        read_only_fields = ('client_id',) 
\ No newline at end of file
@@ -1,3 +1,479 @@
-from django.test import TestCase
+import asyncio
+import base64
+import csv
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from unittest.mock import patch
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+from django.db import connection
+from django.http import HttpResponse
+from django.test import AsyncClient, RequestFactory, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from apps.users.models import User
+from apps.users.sessions import start_session
+from backend.dates import user_day_range, user_today
+from backend.fastpath import get_plan
+from backend.metrics import MetricsMiddleware
+from backend.pagination import KeysetPagination
+from backend.testing import UserAPITestCase, explain
+from .models import Workout
+from .serializers import WorkoutSerializer
+from .views import WorkoutViewSet
+
+
+class WorkoutQueryPlanTests(UserAPITestCase):
+    """Проверяем, что фильтры по пользователю и дате используют индекс (user, created_at)"""
+
+    username = 'planner'
+
+    def test_day_range_uses_user_created_index(self):
+        start, end = user_day_range(self.user)
+        plan = explain(
+            Workout.objects.filter(user=self.user, created_at__gte=start, created_at__lt=end)
+        )
+        self.assertIn('workout_user_created_idx', plan)
+
+    def test_keyset_page_uses_user_created_index(self):
+        plan = explain(
+            Workout.objects.filter(user=self.user).order_by('-created_at', '-id')[:50]
+        )
+        self.assertIn('workout_user_created_idx', plan)
+
+
+class KeysetPaginationTests(UserAPITestCase):
+    """Keyset-пагинация по (created_at, id): курсор, ссылка next и одинаковые created_at"""
+
+    username = 'pager'
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Workout.objects.bulk_create([
+            Workout(user=cls.user, name=f'Workout {i}', description='', duration=i, calories_burned=i)
+            for i in range(5)
+        ])
+        # Три записи с одним created_at: порядок между ними решает id
+        same = timezone.now().replace(microsecond=0)
+        ids = Workout.objects.filter(user=cls.user).order_by('id').values_list('id', flat=True)
+        Workout.objects.filter(id__in=ids[:3]).update(created_at=same)
+        Workout.objects.filter(id__in=ids[3:]).update(created_at=same - timedelta(days=1))
+
+    def expected_ids(self):
+        return list(Workout.objects.filter(user=self.user).order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def test_without_params_list_is_not_paginated(self):
+        response = self.client.get('/api/workouts/')
+        self.assertEqual(sorted(item['id'] for item in response.json()), sorted(self.expected_ids()))
+
+    def test_next_links_walk_every_row_once(self):
+        ids, url = [], '/api/workouts/?page_size=2'
+        while url:
+            data = self.client.get(url).json()
+            self.assertLessEqual(len(data['results']), 2)
+            ids.extend(item['id'] for item in data['results'])
+            url = data['next']
+        self.assertEqual(ids, self.expected_ids())
+
+    def test_ties_on_created_at_are_broken_by_id(self):
+        ids, url = [], '/api/workouts/?page_size=1'
+        while url:
+            data = self.client.get(url).json()
+            ids.extend(item['id'] for item in data['results'])
+            url = data['next']
+        self.assertEqual(ids, self.expected_ids())
+        self.assertEqual(ids[:3], sorted(ids[:3], reverse=True))
+
+    def test_cursor_encodes_last_row(self):
+        data = self.client.get('/api/workouts/?page_size=3&fields=id').json()
+        self.assertTrue(data['next'].startswith('http://testserver/api/workouts/?'))
+        query = parse_qs(urlparse(data['next']).query)
+        self.assertEqual((query['page_size'], query['fields']), (['3'], ['id']))
+
+        last = Workout.objects.get(pk=data['results'][-1]['id'])
+        created_at, pk = base64.urlsafe_b64decode(query['cursor'][0]).decode().rsplit('|', 1)
+        self.assertEqual((parse_datetime(created_at), int(pk)), (last.created_at, last.pk))
+
+        request = Request(APIRequestFactory().get('/api/workouts/', {'cursor': query['cursor'][0]}))
+        self.assertEqual(KeysetPagination().decode_cursor(request), (last.created_at, last.pk))
+
+    def test_last_page_has_no_next_link(self):
+        self.assertIsNone(self.client.get('/api/workouts/?page_size=5').json()['next'])
+        # Неположительный page_size - размер страницы по умолчанию
+        self.assertIsNone(self.client.get('/api/workouts/?page_size=0').json()['next'])
+
+    def test_invalid_cursor_is_rejected(self):
+        for cursor in ('not base64!', base64.urlsafe_b64encode(b'yesterday|1').decode(),
+                       base64.urlsafe_b64encode(b'2024-01-01T00:00:00+00:00|x').decode(),
+                       base64.urlsafe_b64encode(b'no separator').decode()):
+            with self.subTest(cursor=cursor):
+                response = self.client.get('/api/workouts/', {'cursor': cursor})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {'detail': 'Invalid cursor'})
+
+
+class ConditionalGetTests(UserAPITestCase):
+    """ETag и If-None-Match для list и retrieve"""
+
+    username = 'conditional'
+
+    def setUp(self):
+        super().setUp()
+        self.workout = self.create_workout('Run')
+
+    def create_workout(self, name):
+        response = self.client.post('/api/workouts/', {
+            'name': name, 'description': 'Notes', 'duration': 30, 'calories_burned': 200,
+        })
+        self.assertEqual(response.status_code, 201)
+        return response.json()['id']
+
+    def etag(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def test_matching_etag_returns_304(self):
+        for url in ('/api/workouts/', f'/api/workouts/{self.workout}/'):
+            with self.subTest(url=url):
+                etag = self.etag(url)
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response['ETag'], etag)
+                self.assertEqual(response.content, b'')
+
+    def test_mismatch_returns_200_with_current_etag(self):
+        for url in ('/api/workouts/', f'/api/workouts/{self.workout}/'):
+            with self.subTest(url=url):
+                etag = self.etag(url)
+                response = self.client.get(url, HTTP_IF_NONE_MATCH='"stale"')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response['ETag'], etag)
+                self.assertTrue(response.content)
+
+    def test_etag_changes_after_writes(self):
+        list_url, detail_url = '/api/workouts/', f'/api/workouts/{self.workout}/'
+        etags = [self.etag(list_url)]
+
+        self.create_workout('Swim')
+        etags.append(self.etag(list_url))
+        detail_etag = self.etag(detail_url)
+
+        self.client.patch(detail_url, {'duration': 45})
+        etags.append(self.etag(list_url))
+        self.assertNotEqual(self.etag(detail_url), detail_etag)
+
+        self.client.delete(detail_url)
+        etags.append(self.etag(list_url))
+        self.assertEqual(len(set(etags)), 4)
+
+        # Старый ETag больше не совпадает - клиент получает новые данные
+        response = self.client.get(list_url, HTTP_IF_NONE_MATCH=etags[0])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['name'] for item in response.json()], ['Swim'])
+
+    def test_etag_is_per_user(self):
+        etag = self.etag('/api/workouts/')
+        other = User.objects.create_user('other-conditional', 'other@example.com', 'password')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get('/api/workouts/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(self.client.get(f'/api/workouts/{self.workout}/').status_code, 404)
+
+
+class WorkoutFastPathParityTests(UserAPITestCase):
+    """Быстрый путь list/retrieve должен совпадать с WorkoutSerializer байт в байт"""
+
+    username = 'parity'
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Workout.objects.bulk_create([
+            Workout(user=cls.user, name='Бег 🏃', description='line break "quoted"',
+                    duration=45, calories_burned=2**31 - 1),
+            Workout(user=cls.user, name='', description='', duration=0, calories_burned=0,
+                    client_id='offline-1'),
+        ])
+
+    def expected(self, data):
+        return JSONRenderer().render(data)
+
+    def test_list_matches_serializer(self):
+        self.assertIsNotNone(get_plan(WorkoutSerializer()))
+        for tz in ('UTC', 'Asia/Kolkata'):
+            with timezone.override(tz):
+                response = self.client.get('/api/workouts/')
+                queryset = Workout.objects.filter(user=self.user)
+                self.assertEqual(response.content, self.expected(WorkoutSerializer(queryset, many=True).data))
+
+    def test_paginated_list_and_retrieve_match_serializer(self):
+        response = self.client.get('/api/workouts/?page_size=1')
+        first = Workout.objects.filter(user=self.user).order_by('-created_at', '-id').first()
+        self.assertEqual(
+            self.expected(response.json()['results']),
+            self.expected(WorkoutSerializer([first], many=True).data),
+        )
+        response = self.client.get(f'/api/workouts/{first.pk}/')
+        self.assertEqual(response.content, self.expected(WorkoutSerializer(first).data))
+
+
+class WorkoutSparseFieldsTests(UserAPITestCase):
+    """?fields= сужает ответ и список выбираемых колонок"""
+
+    username = 'sparse'
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Workout.objects.bulk_create([
+            Workout(user=cls.user, name=f'Workout {i}', description='x' * 1000, duration=i, calories_burned=i)
+            for i in range(3)
+        ])
+
+    def get_with_sql(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        selects = [q['sql'] for q in queries.captured_queries if 'workouts_workout' in q['sql']]
+        return response, selects
+
+    def test_list_selects_only_requested_columns(self):
+        response, selects = self.get_with_sql('/api/workouts/?fields=id,name')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([set(item) for item in response.json()], [{'id', 'name'}] * 3)
+        self.assertFalse(any('"description"' in sql for sql in selects))
+
+    def test_paginated_list_keeps_cursor(self):
+        response = self.client.get('/api/workouts/?fields=name&page_size=2')
+        data = response.json()
+        self.assertEqual([set(item) for item in data['results']], [{'name'}] * 2)
+        response = self.client.get(data['next'])
+        self.assertEqual(len(response.json()['results']), 1)
+
+    def test_retrieve_and_serializer_path(self):
+        workout = Workout.objects.filter(user=self.user).first()
+        response = self.client.get(f'/api/workouts/{workout.pk}/?fields=duration')
+        self.assertEqual(response.json(), {'duration': workout.duration})
+        # Browsable API идет через сериализатор и .only()
+        response, selects = self.get_with_sql('/api/workouts/?fields=duration&format=api')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(any('"description"' in sql for sql in selects))
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get('/api/workouts/?fields=name,password')
+        self.assertEqual(response.status_code, 400)
+
+
+class WorkoutStatsTests(UserAPITestCase):
+    """stats/: диапазон по умолчанию, границы интервалов и ошибки параметров"""
+
+    username = 'stats'
+
+    def create_workout(self, day, duration):
+        workout = Workout.objects.create(user=self.user, name='Run', description='', duration=duration,
+                                         calories_burned=duration * 10)
+        created_at = datetime.combine(date.fromisoformat(day), time(12), tzinfo=dt_timezone.utc)
+        Workout.objects.filter(pk=workout.pk).update(created_at=created_at)
+
+    def stats(self, **params):
+        response = self.client.get('/api/workouts/stats/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_default_range_is_last_30_days_by_day(self):
+        data = self.stats()
+        today = user_today(self.user)
+        self.assertEqual((data['from'], data['to'], data['bucket']),
+                         ((today - timedelta(days=29)).isoformat(), today.isoformat(), 'day'))
+        self.assertEqual(len(data['results']), 30)
+        self.assertEqual(data['results'][-1]['period'], today.isoformat())
+
+    def test_bucket_boundaries(self):
+        # 2024-03-03 - воскресенье, 2024-03-04 - понедельник
+        for day, duration in (('2024-02-29', 10), ('2024-03-03', 20), ('2024-03-04', 30), ('2024-03-31', 40)):
+            self.create_workout(day, duration)
+
+        days = self.stats(**{'from': '2024-03-03', 'to': '2024-03-04'})['results']
+        self.assertEqual([(row['period'], row['total_duration']) for row in days],
+                         [('2024-03-03', 20), ('2024-03-04', 30)])
+
+        weeks = self.stats(**{'from': '2024-02-29', 'to': '2024-03-04', 'bucket': 'week'})['results']
+        # Первая неделя начинается с понедельника до from
+        self.assertEqual([(row['period'], row['workouts_count'], row['total_duration']) for row in weeks],
+                         [('2024-02-26', 2, 30), ('2024-03-04', 1, 30)])
+
+        months = self.stats(**{'from': '2024-02-01', 'to': '2024-04-30', 'bucket': 'month'})['results']
+        self.assertEqual([(row['period'], row['total_duration']) for row in months],
+                         [('2024-02-01', 10), ('2024-03-01', 90), ('2024-04-01', 0)])
+
+    def test_bad_params_are_rejected(self):
+        for params in (
+            {'to': 'abc'},
+            {'from': 'abc'},
+            {'to': '2024-02-30'},
+            {'from': '2024-03-05', 'to': '2024-03-04'},
+            {'to': '9999-12-31'},
+            {'from': '0001-01-01', 'to': '0001-01-05'},
+            {'to': '0001-01-05'},
+            {'from': '9999-12-01', 'to': '9999-12-30', 'bucket': 'month'},
+            {'from': '2000-01-01', 'to': '2024-01-01'},
+            {'bucket': 'year'},
+        ):
+            with self.subTest(params=params):
+                response = self.client.get('/api/workouts/stats/', params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+
+
+class WorkoutExportTests(UserAPITestCase):
+    """export/ отдает всю историю потоком в том же формате, что и список"""
+
+    username = 'exporter'
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Workout.objects.bulk_create([
+            Workout(user=cls.user, name=f'Бег, "круг" {i}', description='line\nbreak', duration=i,
+                    calories_burned=i * 10)
+            for i in range(5)
+        ])
+
+    def export(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def expected(self):
+        queryset = Workout.objects.filter(user=self.user).order_by('created_at', 'id')
+        return json.loads(JSONRenderer().render(WorkoutSerializer(queryset, many=True).data))
+
+    def test_ndjson_matches_serializer(self):
+        # Пачки меньше числа строк: граница пачек не должна терять строки
+        with patch.object(WorkoutViewSet, 'export_chunk_size', 2):
+            body = self.export('/api/workouts/export/')
+        self.assertEqual([json.loads(line) for line in body.splitlines()], self.expected())
+
+    def test_csv_has_header_and_rows(self):
+        response = self.client.get('/api/workouts/export/?output=csv', HTTP_ACCEPT='text/csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('workout-export.csv', response['Content-Disposition'])
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        expected = self.expected()
+        self.assertEqual(list(rows[0]), list(expected[0]))
+        self.assertEqual([row['name'] for row in rows], [item['name'] for item in expected])
+        self.assertEqual(rows[0]['description'], 'line\nbreak')
+
+    def test_sparse_fields(self):
+        body = self.export('/api/workouts/export/?output=csv&fields=id,duration')
+        self.assertEqual(body.splitlines()[0], 'id,duration')
+        self.assertEqual(len(body.splitlines()), 6)
+
+    def test_unknown_output_is_rejected(self):
+        response = self.client.get('/api/workouts/export/?output=xml')
+        self.assertEqual(response.status_code, 400)
+
+    def test_other_users_rows_are_not_exported(self):
+        other = User.objects.create_user('other-exporter', 'other@example.com', 'password')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.export('/api/workouts/export/'), '')
+
+
+def metric_sample(text, name, route):
+    # Значение серии с меткой route (method=GET)
+    for line in text.splitlines():
+        if line.startswith(f'{name}{{method="GET",route="{route}"}}'):
+            return float(line.rsplit(' ', 1)[1])
+    return 0
+
+
+@override_settings(METRICS_TOKEN='secret')
+class MetricsTests(UserAPITestCase):
+    """Метрики запросов на /metrics и обнаружение N+1"""
+
+    username = 'metrics'
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.workout = Workout.objects.create(user=cls.user, name='Бег', duration=30, calories_burned=300)
+
+    def scrape(self, token='secret'):
+        return self.client.get('/metrics', HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_request_is_recorded(self):
+        before = self.scrape().content.decode()
+        self.client.get(f'/api/workouts/{self.workout.pk}/')
+        text = self.scrape().content.decode()
+        self.assertIn('# TYPE http_request_duration_seconds histogram', text)
+        self.assertEqual(
+            metric_sample(text, 'http_request_duration_seconds_count', 'workout-detail'),
+            metric_sample(before, 'http_request_duration_seconds_count', 'workout-detail') + 1,
+        )
+        self.assertGreater(metric_sample(text, 'http_request_db_queries_sum', 'workout-detail'), 0)
+        self.assertIn('http_request_serialization_seconds_sum{method="GET",route="workout-detail"}', text)
+
+    def test_metrics_require_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+        self.assertEqual(self.scrape('wrong').status_code, 404)
+        # Адрес reverse proxy ничего не открывает
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='127.0.0.1').status_code, 404)
+        with override_settings(METRICS_TOKEN=''):
+            self.assertEqual(self.scrape('').status_code, 404)
+
+    @override_settings(METRICS_N_PLUS_ONE_THRESHOLD=3)
+    def test_repeated_query_is_flagged(self):
+        def view(request):
+            for _ in range(4):
+                list(Workout.objects.filter(user=self.user))
+            return HttpResponse()
+
+        request = RequestFactory().get('/n-plus-one/')
+        request.resolver_match = None
+        with self.assertLogs('backend.metrics', 'WARNING') as logs:
+            MetricsMiddleware(view)(request)
+        self.assertIn('4 times', logs.output[0])
+
+    @override_settings(METRICS_N_PLUS_ONE_THRESHOLD=4)
+    def test_queries_below_threshold_are_not_flagged(self):
+        def view(request):
+            for _ in range(4):
+                list(Workout.objects.filter(user=self.user))
+            return HttpResponse()
+
+        request = RequestFactory().get('/n-plus-one/')
+        request.resolver_match = None
+        with self.assertNoLogs('backend.metrics', 'WARNING'):
+            MetricsMiddleware(view)(request)
+
+
+@override_settings(METRICS_TOKEN='secret')
+class AsgiMetricsTests(TransactionTestCase):
+    """Под ASGI запросы к БД идут из потоков sync_to_async и тоже считаются"""
+
+    def test_queries_in_worker_threads_are_counted(self):
+        user = User.objects.create_user('asgi-metrics', 'asgi-metrics@example.com', 'password')
+        Workout.objects.create(user=user, name='Бег', duration=30, calories_burned=300)
+        headers = {'Authorization': f'Bearer {start_session(user).access_token}'}
+        scrape = {'HTTP_AUTHORIZATION': 'Bearer secret'}
+        before = self.client.get('/metrics', **scrape).content.decode()
+
+        def serve():
+            # Свой цикл событий, как у ASGI-сервера: ORM работает в новом потоке на каждый запрос
+            return asyncio.run(AsyncClient().get('/api/workouts/stats/', headers=headers))
+
+        with ThreadPoolExecutor(1) as executor:
+            self.assertEqual(executor.submit(serve).result().status_code, 200)
+        text = self.client.get('/metrics', **scrape).content.decode()
+        self.assertGreater(
+            metric_sample(text, 'http_request_db_queries_sum', 'workout-stats'),
+            metric_sample(before, 'http_request_db_queries_sum', 'workout-stats'),
+        )
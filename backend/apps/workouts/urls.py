@@ -1,10 +1,16 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import WorkoutViewSet
+from .views import WorkoutViewSet, AsyncWorkoutListView
 
 router = DefaultRouter()
 router.register(r'', WorkoutViewSet, basename='workout')
 
 urlpatterns = [
     path('', include(router.urls)),
-] 
\ No newline at end of file
+]
+
+if settings.ASYNC_READ_VIEWS:
+    urlpatterns.insert(0, path('', AsyncWorkoutListView.as_view(
+        sync_view=WorkoutViewSet.as_view({'get': 'list', 'post': 'create'}, basename='workout', detail=False)
+    ), name='workout-list'))
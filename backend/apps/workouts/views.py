@@ -5,12 +5,29 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from .models import Workout
 from .serializers import WorkoutSerializer
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.utils.dateparse import parse_date
+from backend.dates import day_range, get_user_timezone, user_today
+from backend.stats import parse_stats_params, truncate, fill_buckets
+from backend.cache import UserCacheInvalidationMixin
+from backend.conditional import ConditionalGetMixin
+from backend.bulk import BulkCreateMixin
+from backend.export import ExportMixin
+from backend.imports import ImportMixin
+from backend.fastpath import FastReadMixin
+from backend.sparse import SparseFieldsMixin
+from backend.async_views import AsyncListView
+from apps.users.deletion import delete_user_data, deletion_response
+from apps.sync import tombstones
 
 # Create your views here.
 
-class WorkoutViewSet(viewsets.ModelViewSet):
+class WorkoutViewSet(UserCacheInvalidationMixin, ConditionalGetMixin, SparseFieldsMixin, FastReadMixin,
+                     ExportMixin, ImportMixin, BulkCreateMixin, viewsets.ModelViewSet):
     serializer_class = WorkoutSerializer
     permission_classes = [IsAuthenticated]
+    import_kind = 'workouts'
     
     def get_queryset(self):
         return Workout.objects.filter(user=self.request.user)
@@ -25,12 +42,15 @@ class WorkoutViewSet(viewsets.ModelViewSet):
         else:
             raise PermissionError("You don't have permission to edit this workout")
 
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        tombstones.record_deleted(self.request.user, 'workout', [instance.pk])
+        instance.delete()
+
     @action(detail=False, methods=['delete'])
     def delete_all(self, request):
         """Удалить все тренировки пользователя"""
-        workouts = self.get_queryset()
-        workouts.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        return deletion_response(request, delete_user_data(request.user, 'workouts'))
 
     @action(detail=False, methods=['delete'])
     def delete_by_date(self, request):
@@ -41,7 +61,52 @@ class WorkoutViewSet(viewsets.ModelViewSet):
                 {'error': 'Date parameter is required'}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
-        
-        workouts = self.get_queryset().filter(created_at__date=date)
-        workouts.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+
+        try:
+            day = parse_date(date)
+        except ValueError:
+            day = None
+        if day is None:
+            return Response(
+                {'error': 'Date must be in YYYY-MM-DD format'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return deletion_response(request, delete_user_data(request.user, 'workouts', {'date': day.isoformat()}))
+
+    @action(detail=False, methods=['get'])
+    def stats(self, request):
+        """Статистика тренировок по дням, неделям или месяцам (?from=&to=&bucket=)"""
+        try:
+            date_from, date_to, bucket = parse_stats_params(
+                request.query_params, user_today(request.user)
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        tz = get_user_timezone(request.user)
+        start, end = day_range(date_from, tz, days=(date_to - date_from).days + 1)
+        rows = (
+            self.get_queryset()
+            .filter(created_at__gte=start, created_at__lt=end)
+            .annotate(period=truncate('created_at', bucket, tz))
+            .values('period')
+            .annotate(
+                workouts_count=Count('id'),
+                total_duration=Sum('duration'),
+                total_calories_burned=Sum('calories_burned'),
+            )
+            .order_by('period')
+        )
+        empty = {'workouts_count': 0, 'total_duration': 0, 'total_calories_burned': 0}
+        return Response({
+            'from': date_from,
+            'to': date_to,
+            'bucket': bucket,
+            'results': fill_buckets(rows, date_from, date_to, bucket, empty),
+        })
+
+
+class AsyncWorkoutListView(AsyncListView):
+    """GET /api/workouts/ под ASGI (см. backend.async_views)"""
+    serializer_class = WorkoutSerializer
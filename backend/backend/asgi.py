@@ -12,5 +12,10 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+# Частые GET-запросы обслуживаются async-view без перехода в поток
+os.environ.setdefault('DJANGO_ASYNC_READS', '1')
+# Async-код открывает соединения в разных потоках, постоянные соединения
+# под ASGI не переиспользуются; для PostgreSQL используйте DATABASE_POOL
+os.environ.setdefault('DATABASE_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
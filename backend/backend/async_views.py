@@ -0,0 +1,155 @@
+"""
+Асинхронные view для самых частых GET-запросов.
+
+Под ASGI синхронный DRF-view выполняется через sync_to_async в общем
+потоке, и запросы процесса выстраиваются к нему в очередь. Здесь чтение
+идет через async-ORM (afirst, aaggregate, async for) прямо в цикле
+событий. Все, что такой view не обрабатывает сам (другие методы,
+browsable API и ?format=, ошибки аутентификации, неизвестные поля,
+некорректный курсор), передается синхронному DRF-view, поэтому ответы
+обоих путей совпадают.
+
+Маршруты подключаются только при settings.ASYNC_READ_VIEWS (его включает
+asgi.py): под WSGI async-view пришлось бы запускать через async_to_sync.
+"""
+import inspect
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+
+from apps.users.authentication import StatelessSessionJWTAuthentication
+from backend.conditional import aetag_state, etag_matches, queryset_etag
+from backend.fastpath import get_plan, page_columns, represent
+from backend.metrics import MetricsJSONRenderer
+from backend.pagination import KeysetPagination
+from backend.sparse import narrow_fields, parse_fields
+
+JSON_MEDIA_TYPES = ('*/*', 'application/*', 'application/json')
+
+
+class UseSyncView(Exception):
+    """Запрос должен обработать синхронный view"""
+
+
+def accepts_json(request):
+    """Выберет ли согласование контента DRF для запроса JSONRenderer"""
+    if 'format' in request.GET:
+        return False
+    accept = request.headers.get('Accept')
+    if not accept:
+        return True
+    media_types = [part.split(';')[0].strip() for part in accept.split(',')]
+    return 'text/html' not in media_types and any(media_type in JSON_MEDIA_TYPES for media_type in media_types)
+
+
+async def aauthenticate(request):
+    """Пользователь по JWT из запроса или None, если аутентификация не удалась"""
+    authenticator = StatelessSessionJWTAuthentication()
+    try:
+        header = authenticator.get_header(request)
+        raw_token = authenticator.get_raw_token(header) if header else None
+        if raw_token is None:
+            return None
+        return await authenticator.aget_user(authenticator.get_validated_token(raw_token))
+    except APIException:
+        return None
+
+
+class AsyncReadView(View):
+    """
+    GET обрабатывается методом read(), остальное - sync_view.
+
+    Подкласс обязан определить async read(request, *args, **kwargs);
+    sync_view - view DRF для того же маршрута, передается в as_view().
+    """
+    sync_view = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if not inspect.iscoroutinefunction(getattr(cls, 'read', None)):
+            raise TypeError(f'{cls.__name__} must define async read(request, *args, **kwargs)')
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Как у DRF-view: аутентификация по токену, CSRF не проверяется
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def get(self, request, *args, **kwargs):
+        if accepts_json(request):
+            user = await aauthenticate(request)
+            if user is not None:
+                request.user = user
+                try:
+                    return await self.read(request, *args, **kwargs)
+                except UseSyncView:
+                    pass
+        return await self.fallback(request, *args, **kwargs)
+
+    async def fallback(self, request, *args, **kwargs):
+        return await sync_to_async(self.sync_view)(request, *args, **kwargs)
+
+    http_method_not_allowed = fallback
+    options = fallback
+
+    def json_response(self, data, status=200):
+        response = HttpResponse(MetricsJSONRenderer().render(data), status=status, content_type='application/json')
+        # Для cache_per_user и etag_from_data, как у Response DRF
+        response.data = data
+        patch_vary_headers(response, ['Accept'])
+        return response
+
+
+class AsyncListView(AsyncReadView):
+    """
+    list() вьюсета с ConditionalGetMixin, SparseFieldsMixin и FastReadMixin:
+    те же ETag, ?fields= и keyset-пагинация.
+    """
+    serializer_class = None
+    pagination_class = KeysetPagination
+
+    def get_queryset(self, request):
+        return self.serializer_class.Meta.model.objects.filter(user=request.user)
+
+    def get_plan(self, request):
+        serializer = self.serializer_class()
+        requested = parse_fields(request.GET)
+        try:
+            if requested:
+                narrow_fields(serializer, requested)
+        except APIException:
+            raise UseSyncView
+        plan = get_plan(serializer)
+        if plan is None:
+            raise UseSyncView
+        return plan
+
+    async def read(self, request, *args, **kwargs):
+        names, sources, converters = self.get_plan(request)
+        queryset = self.get_queryset(request)
+
+        etag = queryset_etag(
+            request.user.pk, await aetag_state(queryset), request.get_full_path(), MetricsJSONRenderer.format
+        )
+        if etag_matches(request, etag):
+            return HttpResponseNotModified(headers={'ETag': etag})
+
+        paginator = self.pagination_class()
+        try:
+            page = await paginator.apaginate_queryset(
+                queryset.values_list(*page_columns(sources), named=True), Request(request)
+            )
+        except APIException:
+            raise UseSyncView
+        if page is not None:
+            data = paginator.get_paginated_data(represent(page, names, converters))
+        else:
+            data = represent([row async for row in queryset.values_list(*sources)], names, converters)
+
+        response = self.json_response(data)
+        response['ETag'] = etag
+        return response
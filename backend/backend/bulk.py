@@ -0,0 +1,113 @@
+from django.contrib.auth import get_user_model
+from django.db import connections, transaction
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+
+def insert_from_select(model, queryset, columns, constants=None):
+    """
+    INSERT INTO model (...) SELECT ... FROM (queryset) одним запросом.
+
+    columns - поле model -> имя столбца queryset (из values()), constants -
+    поле model -> значение, одинаковое для всех строк. Число запросов не
+    зависит от числа строк, в отличие от чтения и bulk_create пачками.
+    Возвращает число вставленных строк.
+    """
+    constants = constants or {}
+    connection = connections[queryset.db]
+    quote = connection.ops.quote_name
+    sql, params = queryset.order_by().query.sql_with_params()
+
+    targets, selects, select_params = [], [], []
+    for name, value in constants.items():
+        field = model._meta.get_field(name)
+        targets.append(quote(field.column))
+        selects.append('%s')
+        select_params.append(field.get_db_prep_save(value, connection))
+    for name, source in columns.items():
+        targets.append(quote(model._meta.get_field(name).column))
+        selects.append(f'q.{quote(source)}')
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {quote(model._meta.db_table)} ({", ".join(targets)}) '
+            f'SELECT {", ".join(selects)} FROM ({sql}) q',
+            (*select_params, *params),
+        )
+        return cursor.rowcount
+
+
+class BulkCreateMixin:
+    """
+    POST bulk/ - пакетное создание записей с ключами идемпотентности.
+
+    Тело запроса - массив объектов, у каждого обязателен `client_id`,
+    сгенерированный клиентом. Пакет проверяется целиком (many=True) и
+    записывается одним bulk_create в одной транзакции. Записи с уже
+    известным client_id не создаются повторно, поэтому пакет можно
+    безопасно отправить еще раз после обрыва соединения.
+    """
+    bulk_max_items = 500
+
+    def after_bulk_create(self, created_ids):
+        """Хук для поддержки производных данных после вставки"""
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """Создать записи пакетом, повторная отправка не создает дубликатов"""
+        items = request.data
+        if not isinstance(items, list) or not items:
+            return Response(
+                {'error': 'Expected a non-empty list of items'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(items) > self.bulk_max_items:
+            return Response(
+                {'error': f'At most {self.bulk_max_items} items are allowed per request'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        keys = [item.get('client_id') if isinstance(item, dict) else None for item in items]
+        key_errors = [
+            {} if isinstance(key, str) and 0 < len(key) <= 64
+            else {'client_id': ['A client_id of at most 64 characters is required']}
+            for key in keys
+        ]
+        serializer = self.get_serializer(data=items, many=True)
+        serializer.is_valid()
+        errors = serializer.errors or [{} for _ in items]
+        errors = [{**item_errors, **key_error} for item_errors, key_error in zip(errors, key_errors)]
+        if any(errors):
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        model = self.get_queryset().model
+        user = request.user
+        with transaction.atomic():
+            # Сериализуем пакеты одного пользователя, чтобы параллельный
+            # повтор не вставил те же записи
+            get_user_model().objects.select_for_update().filter(pk=user.pk).exists()
+
+            existing = dict(
+                model.objects.filter(user=user, client_id__in=set(keys)).values_list('client_id', 'id')
+            )
+            new_objects = {}
+            for key, data in zip(keys, serializer.validated_data):
+                if key not in existing and key not in new_objects:
+                    new_objects[key] = model(user=user, client_id=key, **data)
+            model.objects.bulk_create(new_objects.values(), ignore_conflicts=True)
+
+            created = dict(
+                model.objects.filter(user=user, client_id__in=list(new_objects)).values_list('client_id', 'id')
+            )
+            self.after_bulk_create(list(created.values()))
+
+        results = [
+            {'client_id': key, 'id': existing.get(key, created.get(key)),
+             'status': 'existing' if key in existing else 'created'}
+            for key in keys
+        ]
+        return Response(
+            results,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+        )
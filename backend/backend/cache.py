@@ -0,0 +1,184 @@
+"""
+Кэш ответов по пользователю.
+
+Ключ ответа содержит id пользователя и его текущую версию. Любая запись
+пользователя увеличивает версию, после чего старые ключи просто перестают
+читаться и вытесняются по TTL - перебирать их не нужно.
+
+Версия должна быть общей для всех процессов, иначе запись в одном воркере
+не сбросит кэш в остальных. Поэтому кэш работает, только если включен
+USER_CACHE_ENABLED (по умолчанию - когда задан REDIS_URL).
+"""
+import inspect
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+
+_lock = threading.Lock()
+_counters = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+
+def get_cache():
+    return caches[getattr(settings, 'USER_CACHE_ALIAS', 'default')]
+
+
+async def acache(cache, method, *args, **kwargs):
+    """
+    Вызвать метод кэша из async-кода.
+
+    Async-методы встроенных бэкендов - обертки sync_to_async, то есть
+    переход в общий поток на каждый вызов. LocMemCache не делает
+    ввода-вывода, поэтому его методы вызываются напрямую.
+    """
+    if isinstance(cache, LocMemCache):
+        return getattr(cache, method)(*args, **kwargs)
+    return await getattr(cache, 'a' + method)(*args, **kwargs)
+
+
+def is_enabled():
+    return getattr(settings, 'USER_CACHE_ENABLED', False)
+
+
+def get_timeout():
+    return getattr(settings, 'USER_CACHE_TIMEOUT', 300)
+
+
+def _count(name):
+    with _lock:
+        _counters[name] += 1
+
+
+def cache_stats():
+    """Счетчики попаданий, промахов и инвалидаций в текущем процессе"""
+    with _lock:
+        return dict(_counters)
+
+
+def _version_key(user_id):
+    return f'user:{user_id}:version'
+
+
+def _initial_version():
+    # Начальная версия от времени: если ключ версии вытеснят,
+    # новая версия не совпадет ни с одной из прежних
+    return time.time_ns() // 1000
+
+
+def get_user_version(user_id):
+    cache = get_cache()
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        version = _initial_version()
+        if not cache.add(_version_key(user_id), version, timeout=None):
+            version = cache.get(_version_key(user_id), version)
+    return version
+
+
+async def aget_user_version(user_id):
+    cache = get_cache()
+    version = await acache(cache, 'get', _version_key(user_id))
+    if version is None:
+        version = _initial_version()
+        if not await acache(cache, 'add', _version_key(user_id), version, timeout=None):
+            version = await acache(cache, 'get', _version_key(user_id), version)
+    return version
+
+
+def bump_user_version(user_id):
+    """Сделать все закэшированные ответы пользователя устаревшими"""
+    if not is_enabled():
+        return
+
+    def bump():
+        cache = get_cache()
+        try:
+            cache.incr(_version_key(user_id))
+        except ValueError:
+            cache.set(_version_key(user_id), _initial_version(), timeout=None)
+        _count('invalidations')
+
+    bump()
+    if transaction.get_connection().in_atomic_block:
+        # Повторно после коммита: параллельный запрос мог успеть закэшировать
+        # еще не закоммиченное состояние под новой версией
+        transaction.on_commit(bump)
+
+
+def _response_key(request, version, namespace, vary_on):
+    return ':'.join(str(part) for part in (
+        'user', request.user.id, version, namespace,
+        request.get_full_path(), vary_on(request) if vary_on else '',
+    ))
+
+
+def cache_per_user(namespace, vary_on=None):
+    """
+    Кэшировать успешный ответ метода view для текущего пользователя.
+
+    `vary_on(request)` добавляет в ключ значение, от которого зависит ответ
+    помимо данных пользователя (например, текущая дата). Для async-методов
+    (см. backend.async_views) ключи те же, поэтому синхронный и асинхронный
+    пути читают общий кэш; ответ при попадании строит view.json_response().
+    """
+    def decorator(view_method):
+        if inspect.iscoroutinefunction(view_method):
+            @wraps(view_method)
+            async def async_wrapper(view, request, *args, **kwargs):
+                if not is_enabled():
+                    return await view_method(view, request, *args, **kwargs)
+                key = _response_key(request, await aget_user_version(request.user.id), namespace, vary_on)
+                cache = get_cache()
+                data = await acache(cache, 'get', key)
+                if data is not None:
+                    _count('hits')
+                    response = view.json_response(data)
+                    response['X-Cache'] = 'HIT'
+                    return response
+
+                _count('misses')
+                response = await view_method(view, request, *args, **kwargs)
+                if response.status_code == 200:
+                    await acache(cache, 'set', key, response.data, get_timeout())
+                response['X-Cache'] = 'MISS'
+                return response
+            return async_wrapper
+
+        @wraps(view_method)
+        def wrapper(view, request, *args, **kwargs):
+            if not is_enabled():
+                return view_method(view, request, *args, **kwargs)
+            key = _response_key(request, get_user_version(request.user.id), namespace, vary_on)
+            cache = get_cache()
+            data = cache.get(key)
+            if data is not None:
+                _count('hits')
+                response = Response(data)
+                response['X-Cache'] = 'HIT'
+                return response
+
+            _count('misses')
+            response = view_method(view, request, *args, **kwargs)
+            if response.status_code == 200:
+                cache.set(key, response.data, get_timeout())
+            response['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
+
+
+class UserCacheInvalidationMixin:
+    """Сбрасывает кэш пользователя после любого успешного изменяющего запроса"""
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if (request.method not in SAFE_METHODS and response.status_code < 400
+                and request.user.is_authenticated):
+            bump_user_version(request.user.id)
+        return response
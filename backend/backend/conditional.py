@@ -0,0 +1,117 @@
+import hashlib
+import inspect
+import json
+from functools import wraps
+
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max
+from django.http import HttpResponseNotModified
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+
+def etag_matches(request, etag):
+    if_none_match = request.headers.get('If-None-Match')
+    if not if_none_match:
+        return False
+    etags = parse_etags(if_none_match)
+    return '*' in etags or etag in etags
+
+
+def not_modified(etag):
+    response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    response['ETag'] = etag
+    return response
+
+
+def data_etag(data):
+    payload = json.dumps(data, cls=JSONEncoder, sort_keys=True)
+    return '"%s"' % hashlib.sha1(payload.encode()).hexdigest()
+
+
+def queryset_etag(user_pk, state, full_path, renderer_format):
+    """ETag по агрегату (last_update, count) из etag_state()"""
+    last_update = state['last_update'].isoformat() if state['last_update'] else ''
+    raw = '|'.join((str(user_pk), str(state['count']), last_update, full_path, renderer_format))
+    return '"%s"' % hashlib.sha1(raw.encode()).hexdigest()
+
+
+def etag_state(queryset):
+    return queryset.order_by().aggregate(last_update=Max('updated_at'), count=Count('pk'))
+
+
+async def aetag_state(queryset):
+    return await queryset.order_by().aaggregate(last_update=Max('updated_at'), count=Count('pk'))
+
+
+def etag_from_data(view_method):
+    """
+    ETag по содержимому небольшого ответа.
+
+    Подходит для составных ответов, которые и так берутся из кэша: хэш
+    считается по уже готовым данным, а 304 экономит трафик клиента.
+    """
+    def finalize(request, response, not_modified_response):
+        if response.status_code != status.HTTP_200_OK:
+            return response
+        etag = data_etag(response.data)
+        if etag_matches(request, etag):
+            return not_modified_response(etag)
+        response['ETag'] = etag
+        return response
+
+    if inspect.iscoroutinefunction(view_method):
+        @wraps(view_method)
+        async def async_wrapper(view, request, *args, **kwargs):
+            response = await view_method(view, request, *args, **kwargs)
+            # Response DRF без APIView не отрисовать - 304 обычным HttpResponse
+            return finalize(request, response, lambda etag: HttpResponseNotModified(headers={'ETag': etag}))
+        return async_wrapper
+
+    @wraps(view_method)
+    def wrapper(view, request, *args, **kwargs):
+        return finalize(request, view_method(view, request, *args, **kwargs), not_modified)
+    return wrapper
+
+
+class ConditionalGetMixin:
+    """
+    ETag и If-None-Match для list и retrieve.
+
+    ETag считается одним агрегатом (max(updated_at), count) по тому же
+    queryset, что отдаст view, без сериализации. Если клиент прислал
+    совпадающий ETag, отвечаем 304 до запуска сериализаторов.
+    """
+
+    def get_etag(self, request, queryset):
+        return queryset_etag(
+            request.user.pk, etag_state(queryset), request.get_full_path(), request.accepted_renderer.format
+        )
+
+    def conditional_response(self, request, etag, render):
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        response = render()
+        if response.status_code == status.HTTP_200_OK:
+            response['ETag'] = etag
+        return response
+
+    def list(self, request, *args, **kwargs):
+        etag = self.get_etag(request, self.filter_queryset(self.get_queryset()))
+        return self.conditional_response(
+            request, etag, lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        render = lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs)
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            etag = self.get_etag(request, self.filter_queryset(self.get_queryset()).filter(
+                **{self.lookup_field: kwargs[lookup_url_kwarg]}
+            ))
+        except (TypeError, ValueError, ValidationError):
+            # Некорректный pk - пусть get_object() ответит 404 как обычно
+            return render()
+        return self.conditional_response(request, etag, render)
@@ -0,0 +1,39 @@
+from datetime import datetime, time, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from django.conf import settings
+from django.utils import timezone
+
+
+def get_user_timezone(user):
+    """Часовой пояс пользователя, при неизвестном значении - TIME_ZONE проекта"""
+    try:
+        return ZoneInfo(getattr(user, 'timezone', None) or settings.TIME_ZONE)
+    except (ZoneInfoNotFoundError, ValueError):
+        return ZoneInfo(settings.TIME_ZONE)
+
+
+def user_today(user):
+    """Текущая дата в часовом поясе пользователя"""
+    return timezone.localdate(timezone=get_user_timezone(user))
+
+
+def day_range(day, tz, days=1):
+    """
+    Полуинтервал [start, end) для локальных суток `day` в поясе `tz`.
+
+    Фильтр `created_at__gte=start, created_at__lt=end` сравнивает саму
+    колонку, поэтому индекс (user, created_at) может его обслужить, в
+    отличие от `created_at__date=...`.
+    """
+    start = datetime.combine(day, time.min, tzinfo=tz)
+    end = datetime.combine(day + timedelta(days=days), time.min, tzinfo=tz)
+    return start, end
+
+
+def user_day_range(user, day=None):
+    """Полуинтервал локальных суток пользователя (по умолчанию - сегодня)"""
+    tz = get_user_timezone(user)
+    if day is None:
+        day = timezone.localdate(timezone=tz)
+    return day_range(day, tz)
@@ -0,0 +1,52 @@
+"""
+Удаление большого числа строк пачками.
+
+QuerySet.delete() удаляет все строки одной транзакцией, а при каскадах
+Collector сначала загружает их в память. delete_in_batches выбирает id
+следующей пачки по первичному ключу (keyset, без OFFSET) вне транзакции и
+удаляет пачку в своей короткой транзакции, так что блокировки держатся
+недолго, а память ограничена размером пачки.
+
+Первым запросом транзакции пачки идет запись: в SQLite транзакция,
+начатая с чтения, не может дождаться блокировки на запись и сразу падает
+с "database is locked" при параллельном писателе.
+"""
+from django.conf import settings
+from django.db import transaction
+
+
+def batch_size():
+    return getattr(settings, 'DELETION_BATCH_SIZE', 1000)
+
+
+def delete_in_batches(queryset, size=None, before_batch=None, progress=None):
+    """
+    Удалить строки queryset пачками по size, вернуть число удаленных строк.
+
+    before_batch(batch) вызывается в транзакции пачки до удаления (следы
+    удаления, сводки), progress(deleted) - после коммита пачки с числом
+    удаленных в ней строк.
+    """
+    size = size or batch_size()
+    model = queryset.model
+    ids_query = queryset.order_by('pk').values_list('pk', flat=True)
+    total = 0
+    last_pk = None
+    while True:
+        pending = ids_query if last_pk is None else ids_query.filter(pk__gt=last_pk)
+        ids = list(pending[:size])
+        if not ids:
+            return total
+        last_pk = ids[-1]
+        # Внутри внешней транзакции пачка выполняется в ней же, без точек сохранения
+        with transaction.atomic(using=queryset.db, savepoint=False):
+            # Условие queryset повторяется: строка могла измениться после выборки id
+            batch = queryset.filter(pk__in=ids)
+            if before_batch is not None:
+                before_batch(batch)
+            deleted = batch.delete()[1].get(model._meta.label, 0)
+        total += deleted
+        if progress is not None:
+            progress(deleted)
+        if len(ids) < size:
+            return total
@@ -0,0 +1,150 @@
+"""
+Отдача больших файлов (APK) с докачкой.
+
+file_response отвечает на условные запросы (ETag и Last-Modified по mtime
+и размеру файла, 304 и 412) и на Range с одним диапазоном байт: 206 с
+Content-Range, 416 для диапазона за концом файла. If-Range с устаревшим
+ETag или датой отдает файл целиком, несколько диапазонов - тоже. Полный
+ответ WSGI-сервер может передать через sendfile, диапазон читается
+блоками.
+
+С FILE_SENDFILE_HEADER = 'X-Accel-Redirect' (nginx) или 'X-Sendfile'
+(Apache mod_xsendfile, lighttpd) Django отвечает только заголовками, а
+файл с поддержкой Range отдает веб-сервер: воркеры Python его не читают.
+Для X-Accel-Redirect путь внутри MEDIA_ROOT дописывается к
+FILE_ACCEL_REDIRECT_PREFIX - internal location nginx с alias на MEDIA_ROOT.
+"""
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def file_etag(stat):
+    return '"%x-%x"' % (stat.st_mtime_ns, stat.st_size)
+
+
+def parse_range(header, size):
+    """
+    (start, end) включительно для заголовка Range или None, если его
+    нужно игнорировать и отдать весь файл. ValueError - диапазон за концом
+    файла (416).
+    """
+    match = RANGE_RE.match(header.strip())
+    if match is None:
+        # Несколько диапазонов и другие единицы не поддерживаются
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        # bytes=-N - последние N байт
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError('Unsatisfiable range')
+        return max(size - length, 0), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise ValueError('Unsatisfiable range')
+    return start, min(int(last), size - 1) if last else size - 1
+
+
+def if_range_matches(request, etag, last_modified):
+    """Range применяется, только если файл не изменился с If-Range"""
+    value = request.headers.get('If-Range')
+    if value is None:
+        return True
+    if value.startswith(('"', 'W/')):
+        # Сильное сравнение: слабый ETag не совпадает никогда
+        return value == etag
+    return parse_http_date_safe(value) == last_modified
+
+
+class FileRange:
+    """Диапазон открытого файла: FileResponse читает его блоками до конца диапазона"""
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def _handoff(header, path, content_type, filename):
+    response = HttpResponse(content_type=content_type)
+    if header.lower() == 'x-accel-redirect':
+        relative = os.path.relpath(path, settings.MEDIA_ROOT).replace(os.sep, '/')
+        response[header] = getattr(settings, 'FILE_ACCEL_REDIRECT_PREFIX', '/protected-media/') + quote(relative)
+    else:
+        response[header] = os.fspath(path)
+    if filename:
+        response['Content-Disposition'] = content_disposition_header(True, filename)
+    return response
+
+
+def _file(file, stat, request, etag, last_modified, content_type, filename):
+    byte_range = None
+    if 'Range' in request.headers and if_range_matches(request, etag, last_modified):
+        try:
+            byte_range = parse_range(request.headers['Range'], stat.st_size)
+        except ValueError:
+            file.close()
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+            return response
+
+    options = {'as_attachment': bool(filename), 'filename': filename or '', 'content_type': content_type}
+    if byte_range is None:
+        return FileResponse(file, **options)
+    start, end = byte_range
+    response = FileResponse(FileRange(file, start, end - start + 1), status=206, **options)
+    response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+    response['Content-Length'] = end - start + 1
+    return response
+
+
+def file_response(request, path, content_type=None, filename=None):
+    """Ответ с файлом path; filename - имя для сохранения (Content-Disposition: attachment)"""
+    header = getattr(settings, 'FILE_SENDFILE_HEADER', '')
+    file = None
+    try:
+        if header:
+            stat = os.stat(path)
+        else:
+            # ETag по открытому файлу: файл могли заменить между stat и open
+            file = open(path, 'rb')
+            stat = os.fstat(file.fileno())
+    except (FileNotFoundError, IsADirectoryError):
+        raise Http404('File not found')
+
+    etag = file_etag(stat)
+    last_modified = int(stat.st_mtime)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        if file is not None:
+            file.close()
+    elif header:
+        response = _handoff(header, path, content_type, filename)
+    else:
+        response = _file(file, stat, request, etag, last_modified, content_type, filename)
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
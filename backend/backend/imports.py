@@ -0,0 +1,266 @@
+"""
+Импорт истории из других трекеров.
+
+Файл CSV (строка заголовка с именами полей) или NDJSON (один объект на
+строку) читается построчно и не загружается в память целиком. Строки
+проверяются сериализатором viewset'а пачками по batch_size, каждая пачка
+вставляется одним bulk_create в своей транзакции. Поля помимо полей
+сериализатора:
+
+- created_at - время записи в исходном трекере (по умолчанию - сейчас);
+- client_id - ключ идемпотентности: строки с уже известным client_id
+  пропускаются, поэтому оборванный импорт можно повторить тем же файлом.
+
+Ошибочные строки не прерывают импорт, в отчет попадают их номера и ошибки.
+
+Файл больше IMPORT_SYNC_MAX_BYTES ImportMixin сохраняет в хранилище и
+импортирует заданием очереди users.import_history (apps/jobs), отчет
+попадает в результат задания.
+"""
+import csv
+import io
+import json
+import os
+import uuid
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.urls import reverse
+from rest_framework import serializers, status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from apps.jobs.queue import enqueue
+from backend.cache import bump_user_version
+
+IMPORT_FORMATS = ('csv', 'ndjson')
+IMPORT_EXTENSIONS = {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}
+
+
+def import_storage():
+    """
+    Хранилище файлов, ждущих фонового импорта.
+
+    Лежит вне MEDIA_ROOT и без base_url: сырые файлы истории пользователя
+    не должны отдаваться по /media/.
+    """
+    return FileSystemStorage(location=settings.IMPORT_UPLOAD_ROOT, base_url=None)
+
+
+class ImportFileError(Exception):
+    """Файл нельзя читать дальше: не UTF-8 или испорченный CSV"""
+
+
+def guess_format(filename):
+    return IMPORT_EXTENSIONS.get(os.path.splitext(filename or '')[1].lower())
+
+
+def read_rows(binary, input_format):
+    """(номер строки в файле, данные строки) по мере чтения бинарного файла"""
+    text = io.TextIOWrapper(binary, encoding='utf-8-sig', newline='')
+    try:
+        if input_format == 'csv':
+            reader = csv.DictReader(text)
+            for row in reader:
+                # Пустая ячейка - поле не задано, как отсутствующий ключ в NDJSON;
+                # лишние ячейки без заголовка DictReader кладет под ключ None
+                yield reader.line_num, {
+                    name: value for name, value in row.items() if name is not None and value not in ('', None)
+                }
+        else:
+            for number, line in enumerate(text, 1):
+                if line.strip():
+                    try:
+                        yield number, json.loads(line)
+                    except ValueError:
+                        yield number, None
+    except (UnicodeDecodeError, csv.Error) as exc:
+        raise ImportFileError(f'Cannot read the file: {exc}') from exc
+    finally:
+        # Закрывать загруженный файл - дело владельца
+        text.detach()
+
+
+class ImportReport:
+    """Счетчики импорта и ошибки первых max_errors строк"""
+
+    def __init__(self, max_errors=100):
+        self.rows = 0
+        self.created = 0
+        self.skipped = 0
+        self.failed = 0
+        self.errors = []
+        self.max_errors = max_errors
+
+    def add_error(self, line, errors):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line, 'errors': errors})
+
+    def as_dict(self):
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'skipped': self.skipped,
+            'failed': self.failed,
+            'errors': self.errors,
+        }
+
+
+def _validate(serializer, created_at_field, row):
+    """(client_id, created_at, validated_data) или словарь ошибок строки"""
+    if not isinstance(row, dict):
+        return {'non_field_errors': ['Expected a JSON object']}
+    errors = {}
+    try:
+        data = serializer.run_validation(row)
+    except serializers.ValidationError as exc:
+        errors.update(serializers.as_serializer_error(exc))
+
+    key = row.get('client_id')
+    if key is not None and not (isinstance(key, str) and 0 < len(key) <= 64):
+        errors['client_id'] = ['A client_id must be a string of at most 64 characters']
+
+    created_at = row.get('created_at')
+    if created_at is not None:
+        try:
+            created_at = created_at_field.run_validation(created_at)
+        except serializers.ValidationError as exc:
+            errors['created_at'] = exc.detail
+    return errors or (key, created_at, data)
+
+
+def _insert(user, model, rows, report, after_batch):
+    with transaction.atomic():
+        # Как и у BulkCreateMixin: параллельный повтор не вставит те же client_id
+        get_user_model().objects.select_for_update().filter(pk=user.pk).exists()
+        keys = {key for key, _, _ in rows if key}
+        existing = set(
+            model.objects.filter(user=user, client_id__in=keys).values_list('client_id', flat=True)
+        ) if keys else set()
+
+        objects, dated = [], []
+        for key, created_at, data in rows:
+            if key in existing:
+                report.skipped += 1
+                continue
+            if key:
+                existing.add(key)
+            instance = model(user=user, client_id=key, **data)
+            objects.append(instance)
+            if created_at is not None:
+                dated.append((instance, created_at))
+        model.objects.bulk_create(objects)
+
+        # created_at с auto_now_add перезаписывается при вставке - ставим исходное время вторым запросом
+        for instance, created_at in dated:
+            instance.created_at = created_at
+        model.objects.bulk_update([instance for instance, _ in dated], ['created_at'])
+
+        report.created += len(objects)
+        if after_batch is not None and objects:
+            after_batch([instance.pk for instance in objects])
+
+
+def import_rows(user, model, serializer, rows, batch_size=500, after_batch=None, progress=None, report=None):
+    """
+    Импортировать rows (из read_rows) в model пользователя.
+
+    after_batch(ids) вызывается внутри транзакции пачки с id созданных
+    записей, progress(report) - после каждой пачки.
+    """
+    report = report or ImportReport()
+    created_at_field = serializers.DateTimeField()
+    rows = iter(rows)
+    while batch := list(islice(rows, batch_size)):
+        valid = []
+        for line, row in batch:
+            report.rows += 1
+            result = _validate(serializer, created_at_field, row)
+            if isinstance(result, dict):
+                report.add_error(line, result)
+            else:
+                valid.append(result)
+        if valid:
+            _insert(user, model, valid, report, after_batch)
+        if progress is not None:
+            progress(report)
+    return report
+
+
+class ImportMixin:
+    """
+    POST import/ - загрузка истории файлом CSV или NDJSON (multipart, поле file).
+
+    Формат берется из поля input или из расширения файла. После каждой
+    пачки вызывается after_bulk_create, как у BulkCreateMixin. Если задан
+    import_kind (ключ apps.users.imports.IMPORTERS), файл больше
+    IMPORT_SYNC_MAX_BYTES импортируется в фоне: ответ 202 со ссылкой на
+    статус задания.
+    """
+    import_batch_size = 500
+    import_max_errors = 100
+    import_kind = None
+
+    @action(detail=False, methods=['post'], url_path='import', url_name='import')
+    def import_file(self, request):
+        """Импортировать записи из файла, ответ - отчет по строкам"""
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response(
+                {'error': 'A file is required in the "file" field'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        input_format = request.data.get('input') or guess_format(upload.name)
+        if input_format not in IMPORT_FORMATS:
+            return Response(
+                {'error': f"Input must be one of: {', '.join(IMPORT_FORMATS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if self.import_kind and upload.size > getattr(settings, 'IMPORT_SYNC_MAX_BYTES', 1024 * 1024):
+            return self.enqueue_import(request, upload, input_format)
+
+        report = ImportReport(self.import_max_errors)
+        try:
+            import_rows(
+                request.user, self.get_queryset().model, self.get_serializer(),
+                read_rows(upload.file, input_format), self.import_batch_size,
+                after_batch=self.after_bulk_create, report=report,
+            )
+        except ImportFileError as exc:
+            if report.created:
+                # Записанные пачки остаются, а ответ 400 не сбросит кэш сам
+                bump_user_version(request.user.id)
+            return Response({**report.as_dict(), 'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(
+            report.as_dict(),
+            status=status.HTTP_201_CREATED if report.created else status.HTTP_200_OK
+        )
+
+    def enqueue_import(self, request, upload, input_format):
+        storage = import_storage()
+        path = storage.save(f'{uuid.uuid4().hex}{os.path.splitext(upload.name)[1].lower()}', upload)
+        try:
+            job = enqueue('users.import_history', {
+                'user_id': request.user.id,
+                'kind': self.import_kind,
+                'path': path,
+                'input_format': input_format,
+                'max_errors': self.import_max_errors,
+            }, user=request.user)
+        except Exception:
+            # Без задания файл никто не прочитает и не удалит
+            storage.delete(path)
+            raise
+        return Response(
+            {
+                'id': str(job.pk),
+                'status': job.status,
+                'status_url': request.build_absolute_uri(reverse('job-detail', args=[job.pk])),
+            },
+            status=status.HTTP_202_ACCEPTED
+        )
@@ -0,0 +1,111 @@
+"""
+Структурные логи без лишней работы в потоке запроса.
+
+- Сообщения пишутся с %-аргументами и полями в extra, а не f-строками:
+  строка собирается, только если запись дойдет до обработчика.
+- События на каждый запрос пишутся через SampledLogger, который
+  пропускает лишь долю INFO-записей (LOG_SAMPLE_RATE).
+- QueueJSONHandler только кладет запись в очередь, а форматирование в JSON
+  и запись в поток делает отдельный поток QueueListener.
+"""
+import copy
+import json
+import logging
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from django.conf import settings
+
+# Стандартные атрибуты LogRecord; все остальное пришло из extra
+RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JSONFormatter(logging.Formatter):
+    """Одна JSON-строка на запись: время, уровень, логгер, сообщение и поля из extra"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for name, value in vars(record).items():
+            if name not in RECORD_ATTRIBUTES:
+                entry[name] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SampledLogger(logging.LoggerAdapter):
+    """
+    Логгер событий на каждый запрос.
+
+    INFO и ниже пишутся с вероятностью settings.LOG_SAMPLE_RATE; решение
+    принимается до создания LogRecord, поэтому отброшенное событие почти
+    ничего не стоит. WARNING и выше пишутся всегда.
+    """
+
+    def __init__(self, logger):
+        super().__init__(logger, {})
+
+    def log(self, level, msg, *args, **kwargs):
+        if level <= logging.INFO:
+            rate = getattr(settings, 'LOG_SAMPLE_RATE', 1)
+            if rate < 1 and random.random() >= rate:
+                return
+        super().log(level, msg, *args, **kwargs)
+
+    def process(self, msg, kwargs):
+        # LoggerAdapter.process заменил бы extra вызова на self.extra
+        return msg, kwargs
+
+
+class QueueJSONHandler(QueueHandler):
+    """
+    Неблокирующий обработчик: запись уходит в очередь, JSON пишет фоновый поток.
+
+    При переполнении очереди (maxsize) запись отбрасывается, а не тормозит
+    запрос.
+    """
+
+    def __init__(self, stream=None, maxsize=10000):
+        super().__init__(queue.Queue(maxsize))
+        target = logging.StreamHandler(stream or sys.stderr)
+        target.setFormatter(JSONFormatter())
+        self.listener = QueueListener(self.queue, target, respect_handler_level=True)
+        self.listener.start()
+        self._stopped = False
+
+    def prepare(self, record):
+        # В отличие от QueueHandler.prepare, без полного форматирования: в потоке
+        # запроса подставляются только аргументы, пока объекты не изменились
+        if not record.args and not record.exc_info:
+            return record
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # Трейсбек держит кадры стека - форматируем его здесь
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+    def close(self):
+        # logging.shutdown при выходе вызывает close - дописываем очередь
+        if not self._stopped:
+            self._stopped = True
+            self.listener.stop()
+        super().close()
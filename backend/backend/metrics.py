@@ -0,0 +1,234 @@
+"""
+Метрики запросов в формате Prometheus.
+
+MetricsMiddleware для каждого запроса считает число SQL-запросов, их
+суммарное время, время рендеринга ответа (MetricsJSONRenderer) и общее
+время и кладет их в гистограммы с метками route (имя маршрута) и method.
+Если один и тот же SQL выполнился в запросе больше
+METRICS_N_PLUS_ONE_THRESHOLD раз, это записывается в лог и в счетчик
+http_n_plus_one_total - типичный признак N+1.
+
+Метрики хранятся в памяти процесса; при нескольких воркерах Prometheus
+опрашивает каждый из них. GET /metrics отвечает только на запрос с
+заголовком Authorization: Bearer <METRICS_TOKEN> (bearer_token в конфигурации
+Prometheus); без METRICS_TOKEN метрики не отдаются вовсе.
+"""
+import hmac
+import logging
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import Http404, HttpResponse
+from rest_framework.renderers import JSONRenderer
+
+from backend.cache import cache_stats
+
+logger = logging.getLogger(__name__)
+
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class Histogram:
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        # метки -> [счетчики по корзинам..., сумма, количество]
+        self._series = {}
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = sorted((labels, list(series)) for labels, series in self._series.items())
+        for labels, series in items:
+            label_text = format_labels(labels)
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{label_text},le="+Inf"}} {series[-1]}')
+            lines.append(f'{self.name}_sum{{{label_text}}} {series[-2]}')
+            lines.append(f'{self.name}_count{{{label_text}}} {series[-1]}')
+        return lines
+
+
+class CounterMetric:
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._lock = threading.Lock()
+        self._values = Counter()
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] += amount
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            items = sorted(self._values.items())
+        lines.extend(f'{self.name}{{{format_labels(labels)}}} {value}' for labels, value in items)
+        return lines
+
+
+def format_labels(labels):
+    # labels - кортеж пар (имя, значение)
+    return ','.join(
+        '%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for name, value in labels
+    )
+
+
+REQUEST_SECONDS = Histogram('http_request_duration_seconds', 'Request wall time', SECONDS_BUCKETS)
+DB_QUERIES = Histogram('http_request_db_queries', 'SQL queries per request', QUERY_COUNT_BUCKETS)
+DB_SECONDS = Histogram('http_request_db_seconds', 'Total SQL time per request', SECONDS_BUCKETS)
+RENDER_SECONDS = Histogram(
+    'http_request_serialization_seconds', 'Response rendering time per request', SECONDS_BUCKETS
+)
+N_PLUS_ONE = CounterMetric('http_n_plus_one_total', 'Requests that repeated one SQL statement too often')
+
+METRICS = (REQUEST_SECONDS, DB_QUERIES, DB_SECONDS, RENDER_SECONDS, N_PLUS_ONE)
+
+
+class RequestMetrics:
+    __slots__ = ('started', 'queries', 'db_seconds', 'render_seconds', 'statements')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.render_seconds = 0.0
+        self.statements = Counter()
+
+
+def record_query(execute, sql, params, many, context):
+    """execute_wrapper: время и текст SQL для метрик текущего запроса"""
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_seconds += time.perf_counter() - started
+        metrics.queries += 1
+        # Параметры в SQL не подставлены, поэтому одинаковый текст - один и тот же запрос
+        metrics.statements[sql] += 1
+
+
+def add_query_recorder(connection):
+    # В начало списка: connection.execute_wrapper() снимает последнюю обертку
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    """
+    Обертка для каждого нового соединения.
+
+    Объект соединения свой у каждого потока, а под ASGI ORM работает в
+    потоках sync_to_async, а не в потоке middleware. Метрики запроса эти
+    потоки находят через ContextVar: sync_to_async переносит контекст.
+    """
+    add_query_recorder(connection)
+
+
+def start_request():
+    # Соединения, открытые до импорта модуля (например, в тестах)
+    for alias in settings.DATABASES:
+        add_query_recorder(connections[alias])
+    metrics = RequestMetrics()
+    return metrics, _current.set(metrics)
+
+
+def finish_request(request, response, metrics, token):
+    _current.reset(token)
+    match = request.resolver_match
+    labels = (('method', request.method), ('route', match.view_name if match else 'unmatched'))
+    REQUEST_SECONDS.observe(labels, time.perf_counter() - metrics.started)
+    DB_QUERIES.observe(labels, metrics.queries)
+    DB_SECONDS.observe(labels, metrics.db_seconds)
+    RENDER_SECONDS.observe(labels, metrics.render_seconds)
+
+    if metrics.statements:
+        sql, count = metrics.statements.most_common(1)[0]
+        if count > getattr(settings, 'METRICS_N_PLUS_ONE_THRESHOLD', 5):
+            N_PLUS_ONE.inc(labels)
+            logger.warning(
+                'Possible N+1: %s %s ran the same query %d times: %.200s',
+                request.method, request.path, count, sql,
+            )
+
+
+class MetricsJSONRenderer(JSONRenderer):
+    """JSONRenderer, время которого попадает в http_request_serialization_seconds"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        metrics = _current.get()
+        if metrics is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        started = time.perf_counter()
+        try:
+            return super().render(data, accepted_media_type, renderer_context)
+        finally:
+            metrics.render_seconds += time.perf_counter() - started
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics, token = start_request()
+        response = self.get_response(request)
+        finish_request(request, response, metrics, token)
+        return response
+
+    async def __acall__(self, request):
+        metrics, token = start_request()
+        response = await self.get_response(request)
+        finish_request(request, response, metrics, token)
+        return response
+
+
+def metrics_view(request):
+    """GET /metrics - метрики в текстовом формате Prometheus"""
+    # REMOTE_ADDR за локальным reverse proxy всегда 127.0.0.1 - проверяем токен
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if not token or not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        raise Http404
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.expose())
+    for name, value in sorted(cache_stats().items()):
+        lines.append(f'# TYPE user_cache_{name}_total counter')
+        lines.append(f'user_cache_{name}_total {value}')
+    return HttpResponse('\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,139 @@
+"""
+Чтение с реплик для GET-запросов.
+
+ReplicaRoutingMiddleware выбирает для безопасного запроса (GET, HEAD,
+OPTIONS) одну реплику из settings.REPLICA_DATABASES, и ReplicaRouter
+направляет на нее все чтения этого запроса. Записи, запросы вне HTTP
+(команды), небезопасные запросы и чтения внутри транзакции основной БД
+(в том числе в TestCase) идут в основную БД.
+
+Чтобы пользователь видел свои изменения, после успешной записи он
+закрепляется за основной БД на REPLICA_PIN_SECONDS - время должно
+покрывать задержку репликации. Иначе устаревший ответ реплики попал бы и
+в кэш ответов под новой версией пользователя.
+Закрепление хранится в общем кэше, поэтому реплики без REDIS_URL не
+настраиваются (settings.py).
+"""
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.exceptions import APIException
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+
+from backend.cache import acache, get_cache
+
+# Реплика для чтений текущего запроса или None - основная БД
+_read_alias = ContextVar('replica_read_alias', default=None)
+
+
+def replicas():
+    return getattr(settings, 'REPLICA_DATABASES', [])
+
+
+def _pin_key(user_id):
+    return f'user:{user_id}:primary-pin'
+
+
+def _pin_timeout():
+    return getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+
+
+def pin_to_primary(user_id):
+    """Читать данные пользователя из основной БД ближайшие REPLICA_PIN_SECONDS"""
+    if replicas():
+        get_cache().set(_pin_key(user_id), True, _pin_timeout())
+
+
+def is_pinned(user_id):
+    return get_cache().get(_pin_key(user_id), False)
+
+
+def token_user_id(request):
+    """id пользователя из JWT запроса без обращения к БД или None"""
+    authenticator = JWTAuthentication()
+    try:
+        header = authenticator.get_header(request)
+        raw_token = authenticator.get_raw_token(header) if header else None
+        if raw_token is None:
+            return None
+        user_id = authenticator.get_validated_token(raw_token).get(api_settings.USER_ID_CLAIM)
+        # Тот же тип, что у user.pk в pin_to_primary (simplejwt >= 5.4 кладет строку)
+        return None if user_id is None else get_user_model()._meta.pk.to_python(user_id)
+    except (APIException, ValidationError):
+        return None
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        alias = _read_alias.get()
+        if alias is not None and connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            # Внутри транзакции основной БД читаем ее же, включая незакоммиченное
+            return None
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # На репликах те же данные, что и в основной БД
+        databases = {'default', *replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        if db in replicas():
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        user_id = token_user_id(request)
+        pinned = user_id is not None and is_pinned(user_id)
+        token = _read_alias.set(self.read_alias(request, pinned))
+        try:
+            response = self.get_response(request)
+        finally:
+            _read_alias.reset(token)
+        if self.should_pin(request, user_id, response):
+            pin_to_primary(user_id)
+        return response
+
+    async def __acall__(self, request):
+        user_id = token_user_id(request)
+        pinned = user_id is not None and await acache(get_cache(), 'get', _pin_key(user_id), False)
+        token = _read_alias.set(self.read_alias(request, pinned))
+        try:
+            response = await self.get_response(request)
+        finally:
+            _read_alias.reset(token)
+        if self.should_pin(request, user_id, response):
+            await acache(get_cache(), 'set', _pin_key(user_id), True, _pin_timeout())
+        return response
+
+    def read_alias(self, request, pinned):
+        if request.method not in SAFE_METHODS or pinned or not replicas():
+            return None
+        return random.choice(replicas())
+
+    def should_pin(self, request, user_id, response):
+        return (user_id is not None and request.method not in SAFE_METHODS
+                and response.status_code < 400 and bool(replicas()))
@@ -0,0 +1,61 @@
+from rest_framework.exceptions import ParseError
+from rest_framework.permissions import SAFE_METHODS
+
+
+def parse_fields(query_params, param='fields'):
+    """Список полей из ?fields=a,b,c или None"""
+    raw = query_params.get(param)
+    if not raw:
+        return None
+    return [name.strip() for name in raw.split(',') if name.strip()] or None
+
+
+def narrow_fields(serializer, requested, param='fields'):
+    """Оставить в сериализаторе (или child у many=True) только requested"""
+    fields = getattr(serializer, 'child', serializer).fields
+    unknown = sorted(set(requested) - set(fields))
+    if unknown:
+        raise ParseError(f"Unknown field(s) in '{param}': {', '.join(unknown)}")
+    for name in list(fields):
+        if name not in requested:
+            fields.pop(name)
+    return serializer
+
+
+class SparseFieldsMixin:
+    """
+    ?fields=a,b,c для чтения.
+
+    Сужает вывод сериализатора до перечисленных полей и добавляет .only()
+    к queryset в filter_queryset(), так что неиспользуемые колонки
+    (например, TextField description) не читаются из БД. Быстрый путь (FastReadMixin) берет
+    список полей из суженного сериализатора и выбирает только их.
+    """
+    fields_query_param = 'fields'
+    # Нужны keyset-пагинации и всегда выбираются
+    always_selected = ('id', 'created_at')
+
+    def get_requested_fields(self):
+        if self.request.method not in SAFE_METHODS:
+            return None
+        return parse_fields(self.request.query_params, self.fields_query_param)
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        requested = self.get_requested_fields()
+        if requested:
+            narrow_fields(serializer, requested, self.fields_query_param)
+        return serializer
+
+    def filter_queryset(self, queryset):
+        # filter_queryset, а не get_queryset: его вьюсеты переопределяют сами
+        queryset = super().filter_queryset(queryset)
+        requested = self.get_requested_fields()
+        if requested:
+            model_fields = {f.name for f in queryset.model._meta.concrete_fields}
+            sources = [
+                field.source for field in self.get_serializer().fields.values()
+                if field.source in model_fields
+            ]
+            queryset = queryset.only(*sources, *self.always_selected)
+        return queryset
@@ -0,0 +1,89 @@
+from datetime import date, timedelta
+
+from django.db.models import DateField
+from django.db.models.functions import Trunc
+from django.utils.dateparse import parse_date
+
+BUCKETS = ('day', 'week', 'month')
+DEFAULT_DAYS = 30
+MAX_BUCKETS = 400
+# Полночь этих дат в любом поясе еще переводится в UTC (backend.dates.day_range)
+MIN_DATE = date.min + timedelta(days=1)
+MAX_DATE = date.max - timedelta(days=1)
+
+
+def bucket_start(day, bucket):
+    """Начало интервала, в который попадает дата"""
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def next_bucket(day, bucket):
+    if bucket == 'week':
+        return day + timedelta(days=7)
+    if bucket == 'month':
+        return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return day + timedelta(days=1)
+
+
+def bucket_starts(date_from, date_to, bucket):
+    day = bucket_start(date_from, bucket)
+    while day <= date_to:
+        yield day
+        day = next_bucket(day, bucket)
+
+
+def truncate(field, bucket, tzinfo=None):
+    """Trunc* по интервалу; для DateTimeField дата берется в поясе tzinfo"""
+    return Trunc(field, bucket, output_field=DateField(), tzinfo=tzinfo)
+
+
+def parse_day(query_params, name):
+    try:
+        day = parse_date(query_params[name])
+    except ValueError:
+        # Формат верный, но такой даты нет (2024-02-30)
+        day = None
+    if day is None:
+        raise ValueError('Dates must be in YYYY-MM-DD format')
+    return day
+
+
+def parse_stats_params(query_params, today):
+    """
+    Разобрать параметры from, to и bucket.
+
+    По умолчанию - последние DEFAULT_DAYS дней по дням. При ошибке
+    выбрасывает ValueError с сообщением для клиента.
+    """
+    bucket = query_params.get('bucket', 'day')
+    if bucket not in BUCKETS:
+        raise ValueError(f"Bucket must be one of: {', '.join(BUCKETS)}")
+
+    date_to = parse_day(query_params, 'to') if 'to' in query_params else today
+    try:
+        date_from = (parse_day(query_params, 'from') if 'from' in query_params
+                     else date_to - timedelta(days=DEFAULT_DAYS - 1))
+        if not (MIN_DATE <= date_from and date_to <= MAX_DATE):
+            raise ValueError('Dates are out of range')
+        if date_from > date_to:
+            raise ValueError("'from' must not be later than 'to'")
+        # Интервал после последнего может начинаться за date.max
+        for count, _ in enumerate(bucket_starts(date_from, date_to, bucket), 1):
+            if count > MAX_BUCKETS:
+                raise ValueError(f'Too many buckets, at most {MAX_BUCKETS} are allowed')
+    except OverflowError:
+        raise ValueError('Dates are out of range') from None
+    return date_from, date_to, bucket
+
+
+def fill_buckets(rows, date_from, date_to, bucket, empty):
+    """Дополнить результат GROUP BY пустыми интервалами"""
+    by_start = {row['period']: row for row in rows}
+    return [
+        by_start.get(start) or {'period': start, **empty}
+        for start in bucket_starts(date_from, date_to, bucket)
+    ]
@@ -0,0 +1,35 @@
+"""
+Общие помощники тестов приложений: план запроса и тестовый класс с
+пользователем и клиентом API, вошедшим под ним.
+"""
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+
+def explain(queryset):
+    """План выполнения queryset с запретом seq scan на PostgreSQL"""
+    if connection.vendor == 'postgresql':
+        # На маленькой тестовой таблице PostgreSQL предпочтет seq scan
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+    return queryset.explain()
+
+
+class UserAPITestCase(TestCase):
+    """
+    Пользователь username на весь класс; перед каждым тестом кэш очищается,
+    а self.client - APIClient, аутентифицированный этим пользователем.
+    """
+    username = 'tester'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(cls.username, f'{cls.username}@example.com', 'password')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
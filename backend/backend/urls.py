@@ -22,11 +22,14 @@ from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
 )
-from apps.users.views import LandingPageView
+from apps.users.views import LandingPageView, ApkDownloadView, DashboardView, AsyncDashboardView
+from backend.metrics import metrics_view
 
 urlpatterns = [
     path('', LandingPageView.as_view(), name='landing'),
+    path('download/fit-mobile.apk', ApkDownloadView.as_view(), name='apk'),
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('api/auth/', include('apps.users.urls')),
@@ -34,5 +37,9 @@ urlpatterns = [
         path('workouts/', include('apps.workouts.urls')),
         path('nutrition/', include('apps.nutrition.urls')),
         path('goals/', include('apps.users.goals_urls')),
+        path('sync/', include('apps.sync.urls')),
+        path('jobs/', include('apps.jobs.urls')),
+        path('dashboard/', AsyncDashboardView.as_view(sync_view=DashboardView.as_view())
+             if settings.ASYNC_READ_VIEWS else DashboardView.as_view(), name='dashboard'),
     ])),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)